@@ -0,0 +1,609 @@
+"""
+Reportes de fatiga por viaje, conductor y turno sobre el histórico de la DB o de diarios JSONL.
+
+Lee en bloques con un cursor del lado del servidor (fetchmany) y mantiene en memoria solo
+los viajes abiertos (minutos con eventos de cada uno), así meses de eventos entran en
+memoria acotada. Cada viaje se resume al cerrarse con operaciones vectorizadas de NumPy y
+las filas se escriben por grupos en archivos columnares (Parquet o Arrow con pyarrow; CSV
+si pyarrow no está instalado).
+
+Fuentes:
+- sesiones   tablas sesion + evento (modelo actual)
+- viaje      tabla histórica `viaje` con contadores acumulados: los deltas se reconstruyen
+             fila a fila y un contador que baja (o un hueco de --hueco minutos) abre viaje nuevo
+- diarios    eventos_pendientes.jsonl exportados por EventWriter (también el formato anterior)
+
+Salida (en el directorio --salida):
+- viajes.<ext>              un resumen por viaje: eventos, tasas por hora y ventanas de riesgo
+- ventanas_riesgo.<ext>     tramos con puntaje de riesgo >= --umbral en ventanas de --ventana minutos
+- conductores_turnos.<ext>  totales y tasas por origen (conductor/cámara) y turno
+
+Ejemplos:
+    python analitica.py --mysql --desde 2026-07-01 --hasta 2026-10-01 --salida reportes/
+    python analitica.py --mysql --tabla viaje --salida reportes/ --formato arrow
+    python analitica.py --sqlite copia.db --salida reportes/
+    python analitica.py --diario eventos_pendientes.jsonl cabina2.jsonl --salida reportes/ --formato csv
+"""
+import argparse
+import csv
+import itertools
+import json
+import os
+import sqlite3
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from somnolencia import DB_CONFIG, EVENT_TYPES, SESSION_END, SESSION_START, EventWriter, mysql_connector
+
+# Tipos de registro: los eventos usan el índice de EVENT_TYPES; luego inicio y fin de viaje
+KINDS = EVENT_TYPES + (SESSION_START, SESSION_END)
+_START, _END = len(EVENT_TYPES), len(EVENT_TYPES) + 1
+_KIND_CODE = {k: i for i, k in enumerate(KINDS)}
+MINUTE = np.timedelta64(1, "m")
+# Turno según la hora de inicio del viaje (hora local): el primero cuyo inicio ya pasó
+SHIFTS = (("noche", 22), ("tarde", 14), ("mañana", 6))
+FORMATS = ("parquet", "arrow", "csv")
+
+# Equivalente SQLite de SCHEMA_SQL y de la tabla histórica, para probar sin MySQL
+SQLITE_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS sesion (id_sesion TEXT PRIMARY KEY, origen TEXT, inicio TEXT NOT NULL, fin TEXT)",
+    "CREATE TABLE IF NOT EXISTS evento (id_evento INTEGER PRIMARY KEY AUTOINCREMENT, id_sesion TEXT NOT NULL, "
+    "tipo TEXT NOT NULL, ts TEXT NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS idx_evento_sesion_ts ON evento (id_sesion, ts)",
+    "CREATE TABLE IF NOT EXISTS viaje (id_viaje INTEGER PRIMARY KEY AUTOINCREMENT, hora_viaje TEXT NOT NULL, "
+    "parpadeo INTEGER NOT NULL, cabeceos INTEGER NOT NULL, bosteso INTEGER NOT NULL)",
+)
+
+
+
+def connect_sqlite(path: str = ":memory:") -> sqlite3.Connection:
+    """Conexión SQLite con las tablas de SQLITE_SCHEMA (se crean si faltan)."""
+    conn = sqlite3.connect(path)
+    for stmt in SQLITE_SCHEMA:
+        conn.execute(stmt)
+    conn.commit()
+    return conn
+
+
+# Bloque de registros: (viaje, tipo, ts, peso, origen), un arreglo por columna
+Chunk = Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]
+
+
+def shift_of(ts: datetime) -> str:
+    for name, hour in SHIFTS:
+        if ts.hour >= hour:
+            return name
+    return SHIFTS[0][0]
+
+
+def _to_datetime64(values) -> np.ndarray:
+    """datetime de MySQL o texto ISO de SQLite/diarios -> datetime64[ms] (None -> NaT)."""
+    return np.array(values, dtype="datetime64[ms]")
+
+
+def _to_datetime(ts: np.datetime64) -> Optional[datetime]:
+    return None if np.isnat(ts) else ts.astype("datetime64[ms]").item()
+
+
+# ---------------- Fuentes ----------------
+def _server_cursor(conn):
+    """Cursor sin buffer (MySQL trae las filas del servidor a medida que se piden)."""
+    try:
+        return conn.cursor(buffered=False)
+    except TypeError:       # sqlite3: el cursor ya es perezoso
+        return conn.cursor()
+
+
+def _date_filter(conn, column: str, desde: str = None, hasta: str = None) -> Tuple[str, List]:
+    ph = "?" if isinstance(conn, sqlite3.Connection) else "%s"
+    clauses, params = [], []
+    if desde:
+        clauses.append(f"{column} >= {ph}")
+        params.append(desde)
+    if hasta:
+        clauses.append(f"{column} < {ph}")
+        params.append(hasta)
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", params
+
+
+def stream_sessions(conn, chunk_size: int = 5000, desde: str = None, hasta: str = None) -> Iterator[Chunk]:
+    """
+    sesion LEFT JOIN evento ordenado por sesión: cada viaje llega contiguo y se cierra
+    apenas empieza el siguiente (también los viajes sin eventos, que cuentan horas).
+    """
+    where, params = _date_filter(conn, "s.inicio", desde, hasta)
+    cur = _server_cursor(conn)
+    cur.execute("SELECT s.id_sesion, s.origen, s.inicio, s.fin, e.tipo, e.ts "
+                "FROM sesion s LEFT JOIN evento e ON e.id_sesion = s.id_sesion"
+                f"{where} ORDER BY s.inicio, s.id_sesion, e.ts", params)
+    prev: Optional[Tuple[str, object]] = None      # (id_sesion, fin) de la última sesión vista
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            sid = np.array([r[0] for r in rows], object)
+            origen = np.array([r[1] for r in rows], object)
+            inicio = _to_datetime64([r[2] for r in rows])
+            fin = _to_datetime64([r[3] for r in rows])
+            tipo = [r[4] for r in rows]
+            ts = _to_datetime64([r[5] for r in rows])
+            # primera fila de cada sesión: cierra la anterior y marca el inicio de esta
+            first = np.ones(len(rows), bool)
+            first[1:] = sid[1:] != sid[:-1]
+            if prev is not None and sid[0] == prev[0]:
+                first[0] = False
+            starts = np.flatnonzero(first)
+            prev_sid = np.concatenate([[prev[0] if prev else None], sid[:-1]])[starts]
+            prev_fin = np.concatenate([_to_datetime64([prev[1] if prev else None]), fin[:-1]])[starts]
+            closing = np.array([k is not None for k in prev_sid], bool)
+            kinds = np.array([_KIND_CODE.get(t, -1) for t in tipo], np.int8)     # None (sin eventos) -> -1
+            is_event = (kinds >= 0) & (kinds < _START)
+            n_end, n_start = int(closing.sum()), len(starts)
+            yield (np.concatenate([prev_sid[closing], sid[starts], sid[is_event]]),
+                   np.concatenate([np.full(n_end, _END, np.int8), np.full(n_start, _START, np.int8),
+                                   kinds[is_event]]),
+                   np.concatenate([prev_fin[closing], inicio[starts], ts[is_event]]),
+                   np.ones(n_end + n_start + int(is_event.sum()), np.int64),
+                   np.concatenate([np.full(n_end, None, object), origen[starts], origen[is_event]]))
+            prev = (rows[-1][0], rows[-1][3])
+    finally:
+        cur.close()
+    if prev is not None:
+        yield (np.array([prev[0]], object), np.array([_END], np.int8), _to_datetime64([prev[1]]),
+               np.ones(1, np.int64), np.array([None], object))
+
+
+def stream_viaje(conn, chunk_size: int = 5000, gap_minutes: float = 30.0, desde: str = None,
+                 hasta: str = None) -> Iterator[Chunk]:
+    """
+    Tabla histórica `viaje` (una fila por evento con los contadores acumulados del viaje).
+    Delta de cada fila = contadores - contadores de la fila anterior. Un contador que baja, o
+    una fila con un solo evento acumulado (la primera de cada ejecución), es un reinicio del
+    detector (los contadores vuelven a 0); un hueco de `gap_minutes` sin
+    filas separa el viaje pero los contadores siguen siendo los del mismo proceso.
+    """
+    where, params = _date_filter(conn, "hora_viaje", desde, hasta)
+    cur = _server_cursor(conn)
+    cur.execute("SELECT id_viaje, hora_viaje, parpadeo, cabeceos, bosteso FROM viaje"
+                f"{where} ORDER BY id_viaje", params)
+    gap = np.timedelta64(int(gap_minutes * 60000), "ms")
+    prev_key, prev_ts, prev_cum = None, None, np.zeros(3, np.int64)
+    try:
+        while True:
+            rows = cur.fetchmany(chunk_size)
+            if not rows:
+                break
+            n = len(rows)
+            ids = np.array([f"viaje-{r[0]}" for r in rows], object)
+            ts = _to_datetime64([r[1] for r in rows])
+            cum = np.array([r[2:5] for r in rows], np.int64).reshape(n, 3)
+            before = np.vstack([prev_cum, cum[:-1]])
+            before_ts = np.concatenate([_to_datetime64([prev_ts]), ts[:-1]])
+            # se escribía una fila por evento: total 1 o un contador que baja = el detector se
+            # reinició; un hueco largo = otro viaje
+            restart = (cum < before).any(axis=1) | (cum.sum(axis=1) <= 1)
+            if prev_key is None:
+                restart[0] = True
+            reset = restart | ((ts - before_ts) > gap)
+            seg = np.cumsum(reset)
+            keys = np.concatenate([[prev_key], ids[reset]])[seg]
+            delta = np.clip(cum - np.where(restart[:, None], 0, before), 0, None)
+            # fin de cada viaje que se cierra en este bloque: la fila anterior al reinicio
+            ends = np.flatnonzero(reset)
+            ended_keys = np.concatenate([[prev_key], keys[:-1]])[ends]
+            ended_ts = before_ts[ends]
+            valid = np.array([k is not None for k in ended_keys], bool)
+            row, col = np.nonzero(delta)
+            yield (np.concatenate([keys[row], ended_keys[valid]]),
+                   np.concatenate([col.astype(np.int8), np.full(valid.sum(), _END, np.int8)]),
+                   np.concatenate([ts[row], ended_ts[valid]]),
+                   np.concatenate([delta[row, col], np.ones(valid.sum(), np.int64)]),
+                   np.full(len(row) + valid.sum(), None, object))
+            prev_key, prev_ts, prev_cum = keys[-1], _to_datetime(ts[-1]), cum[-1]
+    finally:
+        cur.close()
+
+
+def _journal_chunk(rows: List) -> Chunk:
+    return (np.array([r[0] for r in rows], object),
+            np.array([_KIND_CODE[r[1]] for r in rows], np.int8),
+            _to_datetime64([r[2]["dt"] if isinstance(r[2], dict) else r[2] for r in rows]),
+            np.ones(len(rows), np.int64),
+            np.array([r[3] for r in rows], object))
+
+
+def _journal_rows(path: str, chunk_size: int) -> Iterator[List]:
+    with open(path, encoding="utf-8") as f:
+        lines = (line for line in f if line.strip())
+        while True:
+            rows = [json.loads(line) for line in itertools.islice(lines, chunk_size)]
+            if not rows:
+                return
+            yield rows
+
+
+def stream_journals(paths: Iterable[str], chunk_size: int = 5000) -> Iterator[Chunk]:
+    """
+    Diarios JSONL de EventWriter: filas [id_sesion, tipo, {"dt": iso}, origen]. Las del formato
+    anterior ([hora ISO, parpadeos, cabeceos, bostezos]) se convierten como al reenviar el
+    diario (EventWriter._legacy_rows): una sesión 'legado<fecha>' por archivo. Son anteriores
+    a las del formato actual, así que se juntan en una primera pasada y salen antes.
+    """
+    for path in paths:
+        legacy = [r for rows in _journal_rows(path, chunk_size) for r in rows if EventWriter._is_legacy(r)]
+        if legacy:
+            try:
+                converted = EventWriter._legacy_rows(legacy)
+            except ValueError as e:
+                print(f"⚠️ {path}: {len(legacy)} filas del formato anterior con fecha inválida ({e})")
+                converted = []
+            for i in range(0, len(converted), chunk_size):
+                yield _journal_chunk(converted[i:i + chunk_size])
+        for rows in _journal_rows(path, chunk_size):
+            current = [r for r in rows if len(r) == 4 and isinstance(r[1], str) and r[1] in _KIND_CODE]
+            if current:
+                yield _journal_chunk(current)
+
+
+# ---------------- Agregación por viaje ----------------
+class _OpenTrip:
+    """Eventos por minuto de un viaje abierto: arreglo (3, minutos) que crece por duplicación."""
+    __slots__ = ("key", "origen", "start", "end", "first", "last", "base", "bins", "n")
+
+    def __init__(self, key: str):
+        self.key = key
+        self.origen = None
+        self.start = self.end = None        # marcas de inicio/fin de la sesión
+        self.first = self.last = None       # primer y último evento
+        self.base = None                    # minuto de la columna 0
+        self.bins = np.zeros((len(EVENT_TYPES), 64), np.int64)
+        self.n = 0
+
+    def add(self, kinds: np.ndarray, ts: np.ndarray, weights: np.ndarray, origen: np.ndarray):
+        if self.origen is None:
+            named = [o for o in origen.tolist() if o is not None]
+            if named:
+                self.origen = named[0]
+        marks = ts[kinds == _START]
+        marks = marks[~np.isnat(marks)]
+        if marks.size:
+            self.start = marks.min() if self.start is None else min(self.start, marks.min())
+        marks = ts[kinds == _END]
+        marks = marks[~np.isnat(marks)]
+        if marks.size:
+            self.end = marks.max() if self.end is None else max(self.end, marks.max())
+        ev = (kinds < _START) & ~np.isnat(ts)
+        if not ev.any():
+            return
+        k, t, w = kinds[ev], ts[ev], weights[ev]
+        lo, hi = t.min(), t.max()
+        self.first = lo if self.first is None else min(self.first, lo)
+        self.last = hi if self.last is None else max(self.last, hi)
+        minutes = t.astype("datetime64[m]")
+        if self.base is None:
+            self.base = minutes.min()
+        elif minutes.min() < self.base:
+            shift = int((self.base - minutes.min()) // MINUTE)
+            self.bins = np.pad(self.bins, ((0, 0), (shift, 0)))
+            self.base -= shift * MINUTE
+            self.n += shift
+        off = ((minutes - self.base) // MINUTE).astype(np.int64)
+        need = int(off.max()) + 1
+        cap = self.bins.shape[1]
+        if need > cap:
+            self.bins = np.pad(self.bins, ((0, 0), (0, max(need, 2 * cap) - cap)))
+            cap = self.bins.shape[1]
+        self.bins += np.bincount(k.astype(np.int64) * cap + off, weights=w,
+                                 minlength=len(EVENT_TYPES) * cap).astype(np.int64).reshape(-1, cap)
+        self.n = max(self.n, need)
+
+
+class TripAnalyzer:
+    """
+    Agrupa los bloques por viaje y resume cada viaje al cerrarse: con su marca de fin,
+    cuando lleva `idle_minutes` sin registros respecto del último tiempo visto, o al final.
+    Lo que llegue de un viaje después de cerrado por inactividad sale como otro tramo.
+
+    Riesgo por minuto sobre la ventana de los últimos `window_minutes` minutos:
+        puntaje = min(1, w_cab * cabeceos / cab_ref + w_bos * bostezos / bos_ref
+                         + w_par * max(0, parpadeos/min - par_ref) / par_ref)
+    Los tramos con puntaje >= `threshold` son ventanas de riesgo.
+    """
+    def __init__(self, window_minutes: int = 10, threshold: float = 0.5, idle_minutes: float = 120.0,
+                 refs: Tuple[float, float, float] = (20.0, 3.0, 3.0), weights: Tuple[float, float, float] = (0.2, 0.5, 0.3)):
+        self.window = max(1, int(window_minutes))
+        self.threshold = threshold
+        self.idle = np.timedelta64(int(idle_minutes * 60000), "ms")
+        self.refs = np.asarray(refs, np.float64)            # parpadeos/min, cabeceos y bostezos por ventana
+        self.weights = np.asarray(weights, np.float64)      # parpadeo, cabeceo, bostezo
+        self._open: Dict[str, _OpenTrip] = {}
+        self._now = None
+        self.records = 0
+
+    def feed(self, chunk: Chunk) -> Iterator[Tuple[Dict, List[Dict]]]:
+        keys, kinds, ts, weights, origen = chunk
+        if not len(keys):
+            return
+        self.records += len(keys)
+        uniq, inv = np.unique(keys.astype(str), return_inverse=True)
+        order = np.argsort(inv, kind="stable")
+        bounds = np.flatnonzero(np.diff(inv[order])) + 1
+        for key, idx in zip(uniq.tolist(), np.split(order, bounds)):
+            trip = self._open.get(key)
+            if trip is None:
+                trip = self._open[key] = _OpenTrip(key)
+            trip.add(kinds[idx], ts[idx], weights[idx], origen[idx])
+            if (kinds[idx] == _END).any():
+                yield self._close(key)
+        valid = ts[~np.isnat(ts)]
+        if valid.size:
+            now = valid.max()
+            self._now = now if self._now is None else max(self._now, now)
+            for key in [k for k, t in self._open.items() if self._last_seen(t) < self._now - self.idle]:
+                yield self._close(key)
+
+    def finish(self) -> Iterator[Tuple[Dict, List[Dict]]]:
+        for key in list(self._open):
+            yield self._close(key)
+
+    @staticmethod
+    def _last_seen(trip: _OpenTrip):
+        seen = [t for t in (trip.start, trip.last, trip.end) if t is not None]
+        return max(seen) if seen else np.datetime64("NaT")
+
+    def _close(self, key: str) -> Tuple[Dict, List[Dict]]:
+        return self.summarize(self._open.pop(key))
+
+    def summarize(self, trip: _OpenTrip) -> Tuple[Dict, List[Dict]]:
+        counts = trip.bins[:, :trip.n]
+        start = trip.start if trip.start is not None else trip.first
+        end = trip.end if trip.end is not None else trip.last
+        if start is None:
+            start = end
+        if end is None or end < start:
+            end = start if trip.last is None else max(start, trip.last)
+        hours = max(float((end - start) / np.timedelta64(1, "s")), 60.0) / 3600.0
+        totals = counts.sum(axis=1)
+        windows, max_score = self._risk_windows(trip, counts)
+        inicio = _to_datetime(start)
+        row = {"id_viaje": trip.key, "origen": trip.origen or "", "turno": shift_of(inicio) if inicio else "",
+               "inicio": inicio, "fin": _to_datetime(end), "duracion_min": round(hours * 60, 2),
+               **{f"{t}s": int(c) for t, c in zip(EVENT_TYPES, totals)},
+               **{f"{t}s_h": round(c / hours, 3) for t, c in zip(EVENT_TYPES, totals)},
+               "ventanas_riesgo": len(windows), "minutos_riesgo": sum(w["minutos"] for w in windows),
+               "puntaje_max": max_score}
+        return row, windows
+
+    def _risk_windows(self, trip: _OpenTrip, counts: np.ndarray) -> Tuple[List[Dict], float]:
+        """Tramos de riesgo del viaje y puntaje máximo."""
+        n = counts.shape[1]
+        if n == 0:
+            return [], 0.0
+        w = self.window
+        c = np.zeros((counts.shape[0], n + 1), np.int64)
+        np.cumsum(counts, axis=1, out=c[:, 1:])
+        idx = np.arange(1, n + 1)
+        lo = np.maximum(idx - w, 0)
+        win = (c[:, idx] - c[:, lo]).astype(np.float64)         # eventos en la ventana que termina en cada minuto
+        blink_excess = np.maximum(0.0, win[0] / w - self.refs[0]) / self.refs[0]
+        score = np.minimum(1.0, self.weights[0] * blink_excess + self.weights[1] * win[1] / self.refs[1]
+                           + self.weights[2] * win[2] / self.refs[2])
+        edges = np.diff(np.concatenate([[0], (score >= self.threshold).astype(np.int8), [0]]))
+        # tramo = minutos cubiertos por ventanas riesgosas (la primera empieza w-1 minutos antes);
+        # tramos que se solapan se unen
+        spans = []
+        for s, e in zip(np.flatnonzero(edges == 1).tolist(), np.flatnonzero(edges == -1).tolist()):
+            first = max(0, s - w + 1)
+            if spans and first <= spans[-1][1]:
+                spans[-1][1:] = [e, max(spans[-1][2], float(score[s:e].max()))]
+            else:
+                spans.append([first, e, float(score[s:e].max())])
+        out = []
+        for first, e, peak in spans:
+            ev = c[:, e] - c[:, first]
+            out.append({"id_viaje": trip.key, "origen": trip.origen or "",
+                        "inicio": _to_datetime(trip.base + first * MINUTE),
+                        "fin": _to_datetime(trip.base + e * MINUTE), "minutos": e - first,
+                        **{f"{t}s": int(v) for t, v in zip(EVENT_TYPES, ev)},
+                        "puntaje_max": round(peak, 3)})
+        return out, round(float(score.max()), 3)
+
+
+class ShiftReport:
+    """Totales por (origen, turno); hay pocas combinaciones, se escribe al final."""
+    SUMS = ("viajes", "viajes_con_riesgo", "duracion_min", "parpadeos", "cabeceos", "bostezos",
+            "ventanas_riesgo", "minutos_riesgo")
+
+    def __init__(self):
+        self._acc: Dict[Tuple[str, str], Dict[str, float]] = {}
+
+    def add(self, trip: Dict):
+        acc = self._acc.setdefault((trip["origen"], trip["turno"]), dict.fromkeys(self.SUMS, 0))
+        acc["viajes"] += 1
+        acc["viajes_con_riesgo"] += trip["ventanas_riesgo"] > 0
+        for k in self.SUMS[2:]:
+            acc[k] += trip[k]
+
+    def rows(self) -> Iterator[Dict]:
+        for (origen, turno), acc in sorted(self._acc.items()):
+            hours = max(acc["duracion_min"], 1.0) / 60.0
+            yield {"origen": origen, "turno": turno, **acc, "duracion_min": round(acc["duracion_min"], 2),
+                   **{f"{t}s_h": round(acc[f"{t}s"] / hours, 3) for t in EVENT_TYPES}}
+
+
+# ---------------- Escritura columnar ----------------
+TRIP_COLUMNS = (("id_viaje", "str"), ("origen", "str"), ("turno", "str"), ("inicio", "datetime"),
+                ("fin", "datetime"), ("duracion_min", "float"),
+                *((f"{t}s", "int") for t in EVENT_TYPES), *((f"{t}s_h", "float") for t in EVENT_TYPES),
+                ("ventanas_riesgo", "int"), ("minutos_riesgo", "int"), ("puntaje_max", "float"))
+WINDOW_COLUMNS = (("id_viaje", "str"), ("origen", "str"), ("inicio", "datetime"), ("fin", "datetime"),
+                  ("minutos", "int"), *((f"{t}s", "int") for t in EVENT_TYPES), ("puntaje_max", "float"))
+SHIFT_COLUMNS = (("origen", "str"), ("turno", "str"), ("viajes", "int"), ("viajes_con_riesgo", "int"),
+                 ("duracion_min", "float"),
+                 *((f"{t}s", "int") for t in EVENT_TYPES), ("ventanas_riesgo", "int"), ("minutos_riesgo", "int"),
+                 *((f"{t}s_h", "float") for t in EVENT_TYPES))
+
+
+class ColumnarWriter:
+    """
+    Escribe filas (dict) en grupos de `row_group` filas: un row group de Parquet o un
+    record batch de Arrow por grupo, o CSV. En memoria queda como mucho un grupo.
+    """
+    def __init__(self, path: str, columns, fmt: str = "parquet", row_group: int = 10000):
+        if fmt not in FORMATS:
+            raise ValueError(f"formato debe ser uno de {FORMATS}")
+        if fmt != "csv" and pyarrow is None:
+            raise ImportError(f"El formato {fmt} necesita pyarrow (pip install pyarrow)")
+        self.path = path
+        self.columns = columns
+        self.fmt = fmt
+        self.row_group = row_group
+        self.rows = 0
+        self._buf: List[Dict] = []
+        self._writer = None
+        self._file = None
+        if fmt == "csv":
+            self._file = open(path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow([name for name, _ in columns])
+        else:
+            types = {"str": pyarrow.string(), "int": pyarrow.int64(), "float": pyarrow.float64(),
+                     "datetime": pyarrow.timestamp("ms")}
+            self._schema = pyarrow.schema([(name, types[kind]) for name, kind in columns])
+
+    def write(self, row: Dict):
+        self._buf.append(row)
+        if len(self._buf) >= self.row_group:
+            self._flush()
+
+    def _flush(self):
+        if not self._buf:
+            return
+        rows, self._buf = self._buf, []
+        self.rows += len(rows)
+        if self.fmt == "csv":
+            self._writer.writerows([[_csv_value(r.get(name)) for name, _ in self.columns] for r in rows])
+            return
+        batch = pyarrow.record_batch([pyarrow.array([r.get(name) for r in rows], self._schema.field(name).type)
+                                      for name, _ in self.columns], schema=self._schema)
+        writer = self._open_arrow()
+        if self.fmt == "parquet":
+            writer.write_table(pyarrow.Table.from_batches([batch]))      # un row group por grupo
+        else:
+            writer.write_batch(batch)
+
+    def _open_arrow(self):
+        if self._writer is None:
+            if self.fmt == "parquet":
+                self._writer = pyarrow.parquet.ParquetWriter(self.path, self._schema, compression="zstd")
+            else:
+                self._writer = pyarrow.ipc.new_file(self.path, self._schema)
+        return self._writer
+
+    def close(self):
+        self._flush()
+        if self.fmt == "csv":
+            self._file.close()
+        else:
+            self._open_arrow().close()      # sin filas queda un archivo vacío con el esquema
+
+
+def _csv_value(v):
+    return v.isoformat(sep=" ") if isinstance(v, datetime) else v
+
+
+# ---------------- Trabajo completo ----------------
+def run(chunks: Iterable[Chunk], salida: str, fmt: str = None, window_minutes: int = 10,
+        threshold: float = 0.5, idle_minutes: float = 120.0, row_group: int = 10000) -> Dict:
+    """Consume los bloques de una fuente y escribe los tres reportes en `salida`. Retorna contadores."""
+    fmt = fmt or ("parquet" if pyarrow is not None else "csv")
+    ext = {"parquet": "parquet", "arrow": "arrow", "csv": "csv"}[fmt]
+    os.makedirs(salida, exist_ok=True)
+    analyzer = TripAnalyzer(window_minutes, threshold, idle_minutes)
+    shifts = ShiftReport()
+    trips = ColumnarWriter(os.path.join(salida, f"viajes.{ext}"), TRIP_COLUMNS, fmt, row_group)
+    windows = ColumnarWriter(os.path.join(salida, f"ventanas_riesgo.{ext}"), WINDOW_COLUMNS, fmt, row_group)
+    t0 = time.perf_counter()
+    n_chunks = 0
+
+    def emit(results):
+        for row, wins in results:
+            trips.write(row)
+            shifts.add(row)
+            for w in wins:
+                windows.write(w)
+
+    try:
+        for chunk in chunks:
+            n_chunks += 1
+            emit(analyzer.feed(chunk))
+        emit(analyzer.finish())
+    finally:
+        trips.close()
+        windows.close()
+    report = ColumnarWriter(os.path.join(salida, f"conductores_turnos.{ext}"), SHIFT_COLUMNS, fmt, row_group)
+    for row in shifts.rows():
+        report.write(row)
+    report.close()
+    return {"formato": fmt, "bloques": n_chunks, "registros": analyzer.records, "viajes": trips.rows,
+            "ventanas_riesgo": windows.rows, "conductores_turnos": report.rows,
+            "segundos": round(time.perf_counter() - t0, 2)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Reportes de fatiga por viaje, conductor y turno")
+    src = parser.add_mutually_exclusive_group(required=True)
+    src.add_argument("--mysql", action="store_true", help="lee de MySQL con DB_CONFIG de somnolencia.py")
+    src.add_argument("--sqlite", metavar="ARCHIVO", help="lee de una copia SQLite (mismas tablas)")
+    src.add_argument("--diario", nargs="+", metavar="JSONL", help="diarios exportados por EventWriter")
+    parser.add_argument("--tabla", choices=("sesiones", "viaje"), default="sesiones",
+                        help="sesiones (sesion + evento) o la tabla histórica viaje")
+    parser.add_argument("--desde", help="fecha de inicio (AAAA-MM-DD), inclusive")
+    parser.add_argument("--hasta", help="fecha de fin (AAAA-MM-DD), exclusiva")
+    parser.add_argument("--salida", required=True, help="directorio de los reportes")
+    parser.add_argument("--formato", choices=FORMATS, help="por defecto parquet (csv si no hay pyarrow)")
+    parser.add_argument("--bloque", type=int, default=5000, help="filas por fetchmany")
+    parser.add_argument("--ventana", type=int, default=10, help="minutos de la ventana de riesgo")
+    parser.add_argument("--umbral", type=float, default=0.5, help="puntaje mínimo de una ventana de riesgo")
+    parser.add_argument("--hueco", type=float, default=30.0,
+                        help="tabla viaje: minutos sin filas que separan dos viajes")
+    args = parser.parse_args(argv)
+    for value in (args.desde, args.hasta):
+        if value:
+            try:
+                datetime.strptime(value, "%Y-%m-%d")
+            except ValueError:
+                parser.error(f"fecha inválida: {value} (AAAA-MM-DD)")
+
+    conn = None
+    if args.diario:
+        chunks = stream_journals(args.diario, args.bloque)
+    else:
+        conn = connect_sqlite(args.sqlite) if args.sqlite else mysql_connector.connect(**DB_CONFIG)
+        if args.tabla == "viaje":
+            chunks = stream_viaje(conn, args.bloque, args.hueco, args.desde, args.hasta)
+        else:
+            chunks = stream_sessions(conn, args.bloque, args.desde, args.hasta)
+    try:
+        r = run(chunks, args.salida, args.formato, args.ventana, args.umbral)
+    finally:
+        if conn is not None:
+            conn.close()
+    print(f"📊 {r['registros']} registros en {r['bloques']} bloques ({r['segundos']} s): {r['viajes']} viajes, "
+          f"{r['ventanas_riesgo']} ventanas de riesgo, {r['conductores_turnos']} filas conductor/turno "
+          f"-> {args.salida} ({r['formato']})")
+
+
+if __name__ == "__main__":
+    main()
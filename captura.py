@@ -0,0 +1,285 @@
+"""
+Fuentes de captura con buffers preasignados: cámara (formato nativo MJPEG o YUYV), archivo/URL
+y pipelines de GStreamer, todas con la interfaz de cv2.VideoCapture (read/isOpened/release).
+
+Cada read() decodifica directo en el siguiente buffer de un anillo preasignado (cap.read(dst)),
+así no se asigna un frame nuevo por lectura. En lectura secuencial el anillo se reusa en orden;
+con etapas en hilos (PipelineRunner) el pool lleva la cuenta de los buffers en vuelo y solo
+entrega los que el consumidor devolvió con release(): si no hay ninguno libre la lectura espera
+un momento y, si sigue sin haber, usa un frame nuevo en vez de pisar uno que se está dibujando.
+
+Ejemplos:
+    python somnolencia.py --fuente 0 --formato MJPG
+    python captura.py bench viaje.mp4
+    python captura.py bench 0 --formato YUYV --frames 600
+"""
+import argparse
+import collections
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+import cv2
+
+FORMATS = ("MJPG", "YUYV")
+DEFAULT_POOL = 8
+
+
+class FramePool:
+    """
+    Anillo de buffers del mismo tamaño que se reutilizan en orden. Con tracking=True next()
+    solo entrega buffers libres (devueltos con release) y espera hasta `wait` segundos a que
+    se libere uno; si no, retorna None y `exhausted` cuenta la vez.
+    """
+    def __init__(self, size: int = DEFAULT_POOL, wait: float = 0.05):
+        self.size = size
+        self.wait = wait
+        self.shape = None
+        self.tracking = False
+        self.exhausted = 0
+        self._bufs = []
+        self._i = 0
+        self._free = collections.deque()
+        self._cond = threading.Condition()
+
+    @property
+    def ready(self) -> bool:
+        return bool(self._bufs)
+
+    def resize(self, shape, dtype=np.uint8):
+        with self._cond:
+            self.shape = shape
+            self._bufs = [np.empty(shape, dtype) for _ in range(self.size)]
+            self._i = 0
+            self._free = collections.deque(range(self.size))
+
+    def next(self) -> Optional[np.ndarray]:
+        if not self.tracking:
+            buf = self._bufs[self._i]
+            self._i = (self._i + 1) % self.size
+            return buf
+        with self._cond:
+            if not self._free and not self._cond.wait_for(lambda: self._free, self.wait):
+                self.exhausted += 1
+                return None
+            return self._bufs[self._free.popleft()]
+
+    def release(self, buf):
+        """Devuelve un buffer entregado por next(); los de otro tamaño (antes de resize) se ignoran."""
+        if not self.tracking:
+            return
+        with self._cond:
+            for i, b in enumerate(self._bufs):
+                if b is buf:
+                    if i not in self._free:
+                        self._free.append(i)
+                        self._cond.notify()
+                    return
+
+
+class CaptureSource:
+    """
+    cv2.VideoCapture que decodifica en los buffers de un FramePool. `allocations` cuenta
+    los frames que OpenCV tuvo que asignar (el primero, o un cambio de resolución);
+    con pool_size=0 se comporta como VideoCapture.read() (un frame nuevo por lectura).
+    """
+    def __init__(self, cap, pool_size: int = DEFAULT_POOL, name: str = ""):
+        self._cap = cap
+        self.name = name
+        self.pool = FramePool(pool_size) if pool_size > 0 else None
+        self.frames = 0
+        self.allocations = 0
+
+    def isOpened(self) -> bool:
+        return self._cap.isOpened()
+
+    def release(self):
+        self._cap.release()
+
+    def get(self, prop):
+        return self._cap.get(prop)
+
+    def set(self, prop, value) -> bool:
+        return self._cap.set(prop, value)
+
+    def read(self):
+        pool = self.pool
+        buf = pool.next() if pool is not None and pool.ready else None
+        ok, frame = self._cap.read(buf) if buf is not None else self._cap.read()
+        if not ok:
+            return False, None
+        self.frames += 1
+        if frame is not buf:
+            self.allocations += 1
+            # las próximas lecturas van al pool (salvo que solo estuviera agotado)
+            if pool is not None and (not pool.ready or frame.shape != pool.shape):
+                pool.resize(frame.shape, frame.dtype)
+        return True, frame
+
+    def release_frame(self, frame):
+        """El consumidor terminó con `frame`: su buffer vuelve al pool."""
+        if self.pool is not None:
+            self.pool.release(frame)
+
+    def stats(self) -> Dict:
+        out = {"fuente": self.name, "frames": self.frames, "asignaciones": self.allocations}
+        if self.pool is not None and self.pool.tracking:
+            out["pool_agotado"] = self.pool.exhausted
+        return out
+
+
+class YuyvCapture(CaptureSource):
+    """
+    Cámara en YUYV sin conversión de OpenCV (CAP_PROP_CONVERT_RGB=0): el crudo se lee en un
+    único buffer y se convierte a BGR directo en el buffer del pool (una sola pasada).
+    """
+    def __init__(self, cap, width: int, height: int, pool_size: int = DEFAULT_POOL, name: str = ""):
+        super().__init__(cap, max(pool_size, 1), name)
+        self.pool.resize((height, width, 3))
+        self._raw = None
+        self._passthrough = False
+
+    def read(self):
+        if self._passthrough:
+            return super().read()
+        ok, raw = self._cap.read(self._raw) if self._raw is not None else self._cap.read()
+        if not ok:
+            return False, None
+        self.frames += 1
+        if raw is not self._raw:
+            self.allocations += 1
+            self._raw = raw
+        h, w = self.pool.shape[:2]
+        if raw.size != h * w * 2:
+            # el driver ignoró el formato pedido y entrega BGR: se sigue como captura común
+            self._cap.set(cv2.CAP_PROP_CONVERT_RGB, 1)
+            self._passthrough = True
+            self.pool.resize(raw.shape, raw.dtype)
+            out = self.pool.next()
+            if out is None:
+                self.allocations += 1
+                return True, raw.copy()
+            out[...] = raw
+            return True, out
+        out = self.pool.next()
+        if out is None:
+            self.allocations += 1
+            return True, cv2.cvtColor(raw.reshape(h, w, 2), cv2.COLOR_YUV2BGR_YUYV)
+        cv2.cvtColor(raw.reshape(h, w, 2), cv2.COLOR_YUV2BGR_YUYV, dst=out)
+        return True, out
+
+
+def open_camera(index: int = 0, width: int = 1280, height: int = 720, fps: float = None,
+                fmt: Optional[str] = None, pool_size: int = DEFAULT_POOL) -> CaptureSource:
+    """
+    Cámara local pidiendo su formato nativo: MJPG (decodificado por OpenCV con
+    libjpeg-turbo, menos ancho de banda USB a 720p) o YUYV (sin compresión).
+    """
+    if fmt is not None and fmt not in FORMATS:
+        raise ValueError(f"formato debe ser uno de {FORMATS}")
+    api = cv2.CAP_V4L2 if sys.platform.startswith("linux") else cv2.CAP_ANY
+    cap = cv2.VideoCapture(index, api)
+    if fmt:
+        # el FOURCC va antes que el tamaño: varios drivers fijan la resolución por formato
+        cap.set(cv2.CAP_PROP_FOURCC, cv2.VideoWriter_fourcc(*fmt))
+    cap.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if fps:
+        cap.set(cv2.CAP_PROP_FPS, fps)
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)     # el frame más nuevo, no uno encolado en el driver
+    name = f"camara:{index}" + (f":{fmt}" if fmt else "")
+    if fmt == "YUYV" and cap.set(cv2.CAP_PROP_CONVERT_RGB, 0):
+        w, h = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return YuyvCapture(cap, w, h, pool_size, name)
+    return CaptureSource(cap, pool_size, name)
+
+
+def gst_camera_pipeline(device: str = "/dev/video0", width: int = 1280, height: int = 720,
+                        fps: int = 30, mjpeg: bool = True) -> str:
+    """Pipeline de GStreamer para una cámara V4L2; appsink descarta frames viejos."""
+    if mjpeg:
+        src = f"image/jpeg,width={width},height={height},framerate={fps}/1 ! jpegdec"
+    else:
+        src = f"video/x-raw,format=YUY2,width={width},height={height},framerate={fps}/1"
+    return (f"v4l2src device={device} ! {src} ! videoconvert ! video/x-raw,format=BGR ! "
+            f"appsink drop=true max-buffers=1 sync=false")
+
+
+def open_source(spec: str, width: int = 1280, height: int = 720, fmt: Optional[str] = None,
+                pool_size: int = DEFAULT_POOL) -> CaptureSource:
+    """
+    '0', '1'...          cámara local (con formato opcional)
+    'gst:<pipeline>'     pipeline de GStreamer (o cualquier texto con ' ! ' y appsink)
+    otro                 archivo o URL (RTSP/HTTP) vía FFmpeg
+    """
+    if spec.isdigit():
+        return open_camera(int(spec), width, height, fmt=fmt, pool_size=pool_size)
+    if spec.startswith("gst:") or " ! " in spec:
+        pipeline = spec[4:] if spec.startswith("gst:") else spec
+        return CaptureSource(cv2.VideoCapture(pipeline, cv2.CAP_GSTREAMER), pool_size, "gstreamer")
+    return CaptureSource(cv2.VideoCapture(spec), pool_size, spec)
+
+
+# ---------------- Benchmark de asignaciones y copias ----------------
+def benchmark(spec: str, frames: int = 300, fmt: Optional[str] = None) -> Dict[str, Dict]:
+    """
+    Lee `frames` frames de la fuente y los convierte a RGB como lo hace el detector, con
+    y sin buffers preasignados. Reporta ms por lectura y conversión, y asignaciones y MB
+    asignados por frame (cada frame nuevo de OpenCV es una asignación del tamaño del frame).
+    """
+    out = {}
+    for mode, pool_size in (("asigna_por_frame", 0), ("pool", DEFAULT_POOL)):
+        src = open_source(spec, fmt=fmt, pool_size=pool_size)
+        if not src.isOpened():
+            raise IOError(f"No se pudo abrir {spec}")
+        rgb = None
+        rgb_allocs = 0
+        t_read = t_cvt = 0.0
+        n = 0
+        try:
+            while n < frames:
+                t0 = time.perf_counter()
+                ok, frame = src.read()
+                t1 = time.perf_counter()
+                if not ok:
+                    break
+                if pool_size and rgb is not None and rgb.shape == frame.shape:
+                    cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+                else:
+                    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+                    rgb_allocs += 1
+                t_read += t1 - t0
+                t_cvt += time.perf_counter() - t1
+                n += 1
+        finally:
+            src.release()
+        if n == 0:
+            raise IOError(f"{spec} no entregó frames")
+        nbytes = rgb.nbytes
+        allocs = src.allocations + rgb_allocs
+        out[mode] = {"frames": n, "lectura_ms": round(1000 * t_read / n, 3),
+                     "conversion_ms": round(1000 * t_cvt / n, 3),
+                     "asignaciones_por_frame": round(allocs / n, 3),
+                     "mb_asignados_por_frame": round(allocs * nbytes / n / 1e6, 3)}
+    return out
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fuentes de captura con buffers preasignados")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    bench = sub.add_parser("bench", help="asignaciones y copias por frame, con y sin pool")
+    bench.add_argument("fuente", help="índice de cámara, archivo/URL o gst:<pipeline>")
+    bench.add_argument("--formato", choices=FORMATS, help="formato nativo de la cámara")
+    bench.add_argument("--frames", type=int, default=300)
+    args = parser.parse_args(argv)
+
+    for mode, r in benchmark(args.fuente, args.frames, args.formato).items():
+        print(f"📷 {mode:<17} {r['frames']} frames  lectura={r['lectura_ms']:.3f} ms  "
+              f"rgb={r['conversion_ms']:.3f} ms  asignaciones/frame={r['asignaciones_por_frame']}  "
+              f"MB/frame={r['mb_asignados_por_frame']}")
+
+
+if __name__ == "__main__":
+    main()
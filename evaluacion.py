@@ -0,0 +1,310 @@
+"""
+Evaluación offline del detector de somnolencia: sin cámara, sin ventana y sin dibujos.
+
+Corre DrowsinessDetector sobre videos grabados o carpetas de imágenes, guarda las
+métricas de cada frame (CSV o JSONL) y un reporte de rendimiento por etapa.
+
+Ejemplos:
+    python evaluacion.py viaje.mp4 imagenes/ --salida metricas.csv --reporte reporte.json
+    python evaluacion.py viaje.mp4 --config refine_landmarks=true --config refine_landmarks=false
+    python evaluacion.py viaje.mp4 --config ear_threshold=0.25 --config ear_threshold=0.22,yawn_threshold=0.5
+    python evaluacion.py viaje.mp4 --config roi_tracking=false --config roi_tracking=true
+    python evaluacion.py viaje.mp4 --config adaptive_rate=false --config adaptive_rate=true
+    python evaluacion.py viaje.mp4 --config landmark_backend=mediapipe --config landmark_backend=lbf:lbfmodel.yaml
+"""
+import os
+import argparse
+import csv
+import json
+import multiprocessing
+import time
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+import cv2
+
+try:
+    import resource
+except ImportError:     # Windows
+    resource = None
+
+from somnolencia import DrowsinessDetector, NullAudio, NullEventWriter
+from captura import open_source
+
+IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".bmp")
+STAGES = ("conversion", "inferencia", "metricas")
+
+
+# ---------------- Fuentes de frames ----------------
+def iter_frames(source: str, fps: float = 30.0) -> Iterator[Tuple[int, float, np.ndarray]]:
+    """(índice, tiempo en s, frame BGR) de un video o de una carpeta de imágenes ordenadas por nombre."""
+    if os.path.isdir(source):
+        files = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTS))
+        for i, name in enumerate(files):
+            frame = cv2.imread(os.path.join(source, name))
+            if frame is not None:
+                yield i, i / fps, frame
+        return
+
+    cap = open_source(source, pool_size=2)     # cada frame se analiza antes de leer el siguiente
+    if not cap.isOpened():
+        raise IOError(f"No se pudo abrir {source}")
+    video_fps = cap.get(cv2.CAP_PROP_FPS) or fps
+    try:
+        i = 0
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            yield i, i / video_fps, frame
+            i += 1
+    finally:
+        cap.release()
+
+
+class VideoClock:
+    """Reloj del detector que avanza con el tiempo del video, no con el de pared."""
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self) -> float:
+        return self.t
+
+
+# ---------------- Salida por frame ----------------
+FIELDS = ["fuente", "frame", "t", "rostro", "ear_left", "ear_right", "ear_smoothed", "mouth_open_ratio",
+          "eye_closed_time", "drowsiness_level", "blinks_count", "head_nods_count", "yawns_count",
+          "pitch", "yaw", "roll", "perclos", "blink_rate", "fatigue_score"] + [f"{st}_ms" for st in STAGES]
+
+
+class MetricsWriter:
+    """Escribe una fila por frame; el formato sale de la extensión (.csv o .jsonl)."""
+    def __init__(self, path: str):
+        self._f = open(path, "w", newline="", encoding="utf-8")
+        self._csv = None
+        if path.lower().endswith(".csv"):
+            self._csv = csv.DictWriter(self._f, fieldnames=FIELDS)
+            self._csv.writeheader()
+
+    def write(self, row: Dict):
+        if self._csv is not None:
+            self._csv.writerow(row)
+        else:
+            self._f.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    def close(self):
+        self._f.close()
+
+
+def frame_row(source: str, idx: int, t: float, detector: DrowsinessDetector) -> Dict:
+    m = detector.metrics
+    row = {"fuente": source, "frame": idx, "t": round(t, 4), "rostro": int(m.is_face_detected),
+           "ear_left": round(m.ear_left, 5), "ear_right": round(m.ear_right, 5),
+           "ear_smoothed": round(m.ear_smoothed, 5),
+           "mouth_open_ratio": round(m.mouth_open_ratio, 5), "eye_closed_time": round(m.eye_closed_time, 3),
+           "drowsiness_level": m.drowsiness_level, "blinks_count": m.blinks_count,
+           "head_nods_count": m.head_nods_count, "yawns_count": m.yawns_count,
+           "pitch": round(m.head_pose["pitch"], 3), "yaw": round(m.head_pose["yaw"], 3),
+           "roll": round(m.head_pose["roll"], 3), "perclos": round(m.perclos, 4),
+           "blink_rate": round(m.blink_rate, 2), "fatigue_score": round(m.fatigue_score, 4)}
+    for st in STAGES:
+        row[f"{st}_ms"] = round(detector.stage_times[st] * 1000, 3)
+    return row
+
+
+# ---------------- Reporte ----------------
+def percentiles(values_s: List[float]) -> Dict[str, float]:
+    if not values_s:
+        return {"p50": 0.0, "p95": 0.0, "p99": 0.0, "media": 0.0}
+    ms = np.asarray(values_s) * 1000
+    p50, p95, p99 = np.percentile(ms, [50, 95, 99])
+    return {"p50": round(float(p50), 3), "p95": round(float(p95), 3),
+            "p99": round(float(p99), 3), "media": round(float(ms.mean()), 3)}
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)   # Linux: KB
+
+
+def parse_config(text: str) -> Dict:
+    """'refine_landmarks=false,ear_threshold=0.22' -> kwargs de DrowsinessDetector."""
+    config = {}
+    for part in filter(None, (p.strip() for p in text.split(","))):
+        key, _, value = part.partition("=")
+        try:
+            config[key.strip()] = json.loads(value.strip().lower())
+        except ValueError:
+            config[key.strip()] = value.strip()
+    return config
+
+
+def evaluate(sources: List[str], config: Dict = None, salida: str = None,
+             fps: float = 30.0, warmup: int = 5) -> Dict:
+    """
+    Corre el detector sobre cada fuente (un detector nuevo por fuente = un viaje) y
+    retorna el reporte. Los primeros `warmup` frames de cada fuente no entran en las latencias.
+    """
+    config = dict(config or {})
+    writer = MetricsWriter(salida) if salida else None
+    timings = {st: [] for st in STAGES + ("total",)}
+    per_source = {}
+    series = {"ear": [], "mouth": [], "rostro": [], "parpadeos": []}     # para medir concordancia entre configs
+    frames = 0
+    busy = 0.0
+    cpu0 = time.process_time()
+    try:
+        for source in sources:
+            clock = VideoClock()
+            detector = DrowsinessDetector(**{"event_writer": NullEventWriter(), "audio": NullAudio(),
+                                             "clock": clock, "render_level": "ninguno", **config})
+            n = faces = 0
+            try:
+                for idx, t, frame in iter_frames(source, fps):
+                    clock.t = t
+                    t0 = time.perf_counter()
+                    detector.analyze(frame)
+                    elapsed = time.perf_counter() - t0
+                    n += 1
+                    faces += detector.metrics.is_face_detected
+                    series["ear"].append((detector.metrics.ear_left + detector.metrics.ear_right) / 2.0)
+                    series["mouth"].append(detector.metrics.mouth_open_ratio)
+                    series["rostro"].append(detector.metrics.is_face_detected)
+                    series["parpadeos"].append(detector.metrics.blinks_count)
+                    if idx >= warmup:
+                        busy += elapsed
+                        timings["total"].append(elapsed)
+                        for st in STAGES:
+                            timings[st].append(detector.stage_times[st])
+                    if writer:
+                        writer.write(frame_row(source, idx, t, detector))
+                m = detector.metrics
+                per_source[source] = {"frames": n, "rostro_pct": round(100.0 * faces / max(n, 1), 1),
+                                      "parpadeos": m.blinks_count, "cabeceos": m.head_nods_count,
+                                      "bostezos": m.yawns_count,
+                                      "deteccion_valida_ms": detector.startup_times.get("deteccion_valida_ms")}
+                if detector.roi_tracking:
+                    per_source[source]["roi"] = dict(detector.roi_stats)
+                if detector.scheduler is not None:
+                    per_source[source]["adaptativo"] = detector.scheduler.stats()
+                frames += n
+            finally:
+                detector.cleanup()
+    finally:
+        if writer:
+            writer.close()
+
+    measured = len(timings["total"])
+    cpu_s = time.process_time() - cpu0
+    return {"config": config, "frames": frames,
+            "fps": round(measured / busy, 2) if busy > 0 else 0.0,
+            "etapas": {st: percentiles(timings[st]) for st in STAGES},
+            "total": percentiles(timings["total"]),
+            "cpu_ms_por_frame": round(1000.0 * cpu_s / max(frames, 1), 3),
+            "rss_max_mb": peak_rss_mb(),
+            "fuentes": per_source,
+            "_serie": series}
+
+
+def _evaluate_in_child(args):
+    return evaluate(*args)
+
+
+def evaluate_isolated(sources: List[str], config: Dict, salida: str = None, fps: float = 30.0) -> Dict:
+    """Evalúa en un proceso aparte para que el pico de RSS sea solo de esta configuración."""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(_evaluate_in_child, ((sources, config, salida, fps),))
+
+
+def print_report(report: Dict, title: str = ""):
+    print(f"\n📊 {title or 'Reporte'}  config={report['config']}")
+    print(f"   frames={report['frames']}  fps={report['fps']}  cpu={report['cpu_ms_por_frame']} ms/frame  "
+          f"rss_max={report['rss_max_mb']} MB")
+    for name, p in list(report["etapas"].items()) + [("total", report["total"])]:
+        print(f"   {name:<11} p50={p['p50']:>8.3f}  p95={p['p95']:>8.3f}  p99={p['p99']:>8.3f} ms")
+    for source, r in report["fuentes"].items():
+        print(f"   {source}: {r}")
+
+
+def agreement(a: Dict, b: Dict, tolerance: int = 5) -> Dict[str, float]:
+    """
+    Concordancia frame a frame de B respecto de A (mismos clips, mismo orden), incluido el
+    momento de cada parpadeo (modelos.blink_agreement, a `tolerance` frames).
+    """
+    from modelos import blink_agreement
+
+    sa, sb = a["_serie"], b["_serie"]
+    n = min(len(sa["rostro"]), len(sb["rostro"]))
+    if n == 0:
+        return {}
+    face_a, face_b = np.asarray(sa["rostro"][:n], bool), np.asarray(sb["rostro"][:n], bool)
+    both = face_a & face_b
+    out = {"rostro_coincide_pct": round(100.0 * float((face_a == face_b).mean()), 2)}
+    if both.any():
+        out["ear_dif_media"] = round(float(np.abs(np.asarray(sa["ear"][:n]) - np.asarray(sb["ear"][:n]))[both].mean()), 5)
+        out["mouth_dif_media"] = round(float(np.abs(np.asarray(sa["mouth"][:n]) - np.asarray(sb["mouth"][:n]))[both].mean()), 5)
+    out.update(blink_agreement(sa["parpadeos"], sb["parpadeos"], tolerance))
+    return out
+
+
+def public(report: Dict) -> Dict:
+    return {k: v for k, v in report.items() if not k.startswith("_")}
+
+
+def print_comparison(a: Dict, b: Dict):
+    print("\n⚖️ Comparación (B - A)")
+    print(f"   fps: {a['fps']} -> {b['fps']} ({b['fps'] - a['fps']:+.2f})")
+    print(f"   cpu: {a['cpu_ms_por_frame']} -> {b['cpu_ms_por_frame']} ms/frame "
+          f"({b['cpu_ms_por_frame'] - a['cpu_ms_por_frame']:+.3f})")
+    for key in ("p50", "p95", "p99"):
+        print(f"   total {key}: {a['total'][key]} -> {b['total'][key]} ms "
+              f"({b['total'][key] - a['total'][key]:+.3f})")
+    for source in a["fuentes"]:
+        ra, rb = a["fuentes"][source], b["fuentes"].get(source, {})
+        diffs = {k: rb.get(k, 0) - ra[k] for k in ("parpadeos", "cabeceos", "bostezos")}
+        print(f"   {source}: eventos {diffs}  rostro {ra['rostro_pct']}% -> {rb.get('rostro_pct')}%")
+    print(f"   concordancia: {agreement(a, b)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluación offline del detector de somnolencia")
+    parser.add_argument("fuentes", nargs="+", help="videos o carpetas de imágenes")
+    parser.add_argument("--salida", help="métricas por frame (.csv o .jsonl); con dos configs se agrega sufijo A/B")
+    parser.add_argument("--reporte", help="reporte de rendimiento en JSON")
+    parser.add_argument("--config", action="append", default=[],
+                        help="kwargs del detector, ej. refine_landmarks=false,ear_threshold=0.22 (máx. 2)")
+    parser.add_argument("--fps", type=float, default=30.0, help="fps nominal para carpetas de imágenes")
+    args = parser.parse_args(argv)
+
+    configs = [parse_config(c) for c in args.config] or [{}]
+    if len(configs) > 2:
+        parser.error("--config se puede indicar como máximo dos veces")
+
+    if len(configs) == 1:
+        reports = [evaluate(args.fuentes, configs[0], args.salida, args.fps)]
+        print_report(reports[0])
+    else:
+        reports = []
+        for label, config in zip("AB", configs):
+            salida = None
+            if args.salida:
+                base, ext = os.path.splitext(args.salida)
+                salida = f"{base}_{label}{ext}"
+            reports.append(evaluate_isolated(args.fuentes, config, salida, args.fps))
+            print_report(reports[-1], f"Config {label}")
+        print_comparison(*reports)
+
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            if len(reports) == 1:
+                out = public(reports[0])
+            else:
+                out = {"A": public(reports[0]), "B": public(reports[1]),
+                       "concordancia": agreement(*reports)}
+            json.dump(out, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -52,40 +52,61 @@
             <div class="col-12">
 
               <div class="card">
+                <?php
+                // Rango de fechas (por defecto, los últimos 7 días); hasta es inclusivo
+                $desde = $_GET['desde'] ?? date('Y-m-d', strtotime('-6 days'));
+                $hasta = $_GET['hasta'] ?? date('Y-m-d');
+                if (!DateTime::createFromFormat('Y-m-d', $desde)) $desde = date('Y-m-d', strtotime('-6 days'));
+                if (!DateTime::createFromFormat('Y-m-d', $hasta)) $hasta = date('Y-m-d');
+                ?>
                 <div class="card-header">
                   <h3 class="card-title">Viajes</h3>
+                  <form method="get" class="form-inline float-right">
+                    <input type="date" name="desde" class="form-control form-control-sm mr-1" value="<?php echo htmlspecialchars($desde) ?>">
+                    <input type="date" name="hasta" class="form-control form-control-sm mr-1" value="<?php echo htmlspecialchars($hasta) ?>">
+                    <button type="submit" class="btn btn-sm btn-primary">Filtrar</button>
+                  </form>
                 </div>
                 <!-- /.card-header -->
                 <div class="card-body">
                   <table id="example1" class="table table-bordered table-striped">
                     <thead>
                       <tr>
-                        <th>ID</th>
-                        <th>Fecha y Hora</th>
+                        <th>Origen</th>
+                        <th>Inicio</th>
+                        <th>Fin</th>
                         <th>Parpadeos</th>
                         <th>Cabeceos</th>
-                        <th>Vostesos</th>
-                        
+                        <th>Bostezos</th>
                       </tr>
                     </thead>
                     <tbody>
 
                       <?php
                       include_once("bdcone.php");
-                      $consulta = $cadena->prepare("SELECT * FROM viaje");
-                      $consulta->execute();
+                      // Rango acotado sobre el resumen por minuto (índice en minuto), no sobre los eventos
+                      $consulta = $cadena->prepare(
+                        "SELECT s.id_sesion, s.origen, s.inicio, s.fin,
+                                SUM(r.parpadeos) AS parpadeos, SUM(r.cabeceos) AS cabeceos, SUM(r.bostezos) AS bostezos
+                           FROM resumen_minuto r
+                           JOIN sesion s ON s.id_sesion = r.id_sesion
+                          WHERE r.minuto >= :desde AND r.minuto < DATE_ADD(:hasta, INTERVAL 1 DAY)
+                          GROUP BY s.id_sesion, s.origen, s.inicio, s.fin
+                          ORDER BY s.inicio DESC");
+                      $consulta->execute([':desde' => $desde, ':hasta' => $hasta]);
                       $consultatabla = $consulta->fetchAll(PDO::FETCH_ASSOC);
                       foreach ($consultatabla as $viaje) {
-                        $id_viaje  = $viaje['id_viaje'];
-                        $hora_viaje = $viaje['hora_viaje'];
-                        $parpadeo = $viaje['parpadeo'];
+                        $origen = $viaje['origen'] ?? substr($viaje['id_sesion'], 0, 8);
+                        $inicio = $viaje['inicio'];
+                        $fin = $viaje['fin'] ?? 'en curso';
+                        $parpadeo = $viaje['parpadeos'];
                         $cabeceos = $viaje['cabeceos'];
-                        $bosteso = $viaje['bosteso'];
-                        
+                        $bosteso = $viaje['bostezos'];
                         ?>
                         <tr>
-                          <td><?php echo $id_viaje ?></td>
-                          <td><?php echo $hora_viaje ?> </td>
+                          <td><?php echo htmlspecialchars($origen) ?></td>
+                          <td><?php echo $inicio ?> </td>
+                          <td><?php echo $fin ?> </td>
                           <td><?php echo $parpadeo ?></td>
                           <td><?php echo $cabeceos ?> </td>
                           <td><?php echo $bosteso ?> </td>
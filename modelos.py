@@ -0,0 +1,336 @@
+"""
+Modelos de landmarks más livianos que FaceMesh y comparación entre modelos.
+
+Todos implementan somnolencia.LandmarkBackend: detect(rgb) retorna solo los landmarks que
+usa la lógica (METRIC_IDX, en ese orden y normalizados a la imagen), así la máquina de
+estados no cambia con el modelo.
+
+- FacemarkLbfBackend: rostro con cascada Haar + Facemark LBF de OpenCV (opencv-contrib),
+  68 puntos de iBUG en 2D. Modelo: lbfmodel.yaml.
+- OnnxLandmarkBackend: cualquier modelo ONNX de landmarks sobre el recorte del rostro
+  (68 puntos de iBUG o la malla de 468/478 de MediaPipe). Corre con ONNX Runtime (CPU) si
+  está instalado o con el módulo DNN de OpenCV.
+
+La frente (landmark 10 de MediaPipe) no existe en los 68 puntos de iBUG: se estima reflejando
+la punta de la nariz sobre el puente. El cabeceo se mide contra la línea base de cada
+conductor, así que alcanza con que la estimación sea estable.
+
+Ejemplos:
+    python somnolencia.py --modelo lbf:lbfmodel.yaml
+    python modelos.py bench viaje.mp4 noche.mp4 --modelo mediapipe --modelo mediapipe_sin_iris \\
+        --modelo lbf:lbfmodel.yaml --modelo onnx:pfld.onnx --reporte modelos.json
+"""
+import argparse
+import json
+from abc import abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import cv2
+
+try:
+    import onnxruntime
+except ImportError:
+    onnxruntime = None
+
+from somnolencia import METRIC_IDX, LandmarkBackend
+
+# Landmark de MediaPipe -> punto de iBUG-68 (ojos, boca, nariz y barbilla)
+IBUG68_FROM_MEDIAPIPE = {
+    362: 42, 385: 43, 387: 44, 263: 45, 373: 46, 380: 47,     # ojo izquierdo
+    33: 36, 160: 37, 158: 38, 133: 39, 153: 40, 144: 41,      # ojo derecho
+    61: 48, 291: 54, 13: 62, 14: 66,                          # comisuras y labios internos
+    1: 30, 152: 8,                                            # punta de la nariz y barbilla
+}
+_FOREHEAD = 10
+_NOSE_BRIDGE, _NOSE_TIP = 27, 30
+_IBUG_ROWS = np.array([IBUG68_FROM_MEDIAPIPE.get(i, _NOSE_BRIDGE) for i in METRIC_IDX.tolist()])
+_FOREHEAD_ROW = METRIC_IDX.tolist().index(_FOREHEAD)
+
+
+def ibug68_to_metric(points: np.ndarray, out: np.ndarray) -> np.ndarray:
+    """(68, 2|3) de iBUG normalizados -> filas de METRIC_IDX en `out` (z = 0 si no viene)."""
+    out[:] = 0.0
+    d = min(points.shape[1], 3)
+    out[:, :d] = points[_IBUG_ROWS, :d]
+    out[_FOREHEAD_ROW, :2] = 2 * points[_NOSE_BRIDGE, :2] - points[_NOSE_TIP, :2]
+    return out
+
+
+class _CascadeFaceBackend(LandmarkBackend):
+    """
+    Base de los modelos que necesitan la caja del rostro: cascada Haar sobre una imagen en
+    gris reducida a `detect_side` px, y entre detecciones la caja que dan los landmarks del
+    frame anterior. LBF (y un ONNX sin salida de puntaje) ajustan una forma en cualquier caja,
+    así que no avisan cuando el rostro se va: la cascada vuelve a correr cada `redetect_every`
+    frames y, si no encuentra rostro, el frame cuenta como sin rostro. La caja guardada se
+    descarta si cambia el tamaño de la imagen (con roi_tracking alternan recorte y frame completo).
+    """
+    def __init__(self, cascade: str = None, detect_side: int = 320, min_face: float = 0.12,
+                 redetect_every: int = 10):
+        super().__init__()
+        self.cascade = cv2.CascadeClassifier(cascade or cv2.data.haarcascades + "haarcascade_frontalface_default.xml")
+        if self.cascade.empty():
+            raise IOError("No se pudo cargar la cascada de rostros")
+        self.detect_side = detect_side
+        self.min_face = min_face
+        self.redetect_every = max(1, redetect_every)
+        self._gray = None
+        self._box = None
+        self._box_shape = None          # tamaño de la imagen en la que vale _box
+        self._since_detect = 0
+
+    def _to_gray(self, rgb: np.ndarray) -> np.ndarray:
+        if self._gray is None or self._gray.shape != rgb.shape[:2]:
+            self._gray = np.empty(rgb.shape[:2], np.uint8)
+        return cv2.cvtColor(rgb, cv2.COLOR_RGB2GRAY, dst=self._gray)
+
+    def _find_face(self, gray: np.ndarray) -> Optional[Tuple[int, int, int, int]]:
+        """Caja (x, y, w, h) del rostro más grande, en píxeles de `gray`."""
+        h, w = gray.shape
+        scale = min(1.0, self.detect_side / max(h, w))
+        small = cv2.resize(gray, (round(w * scale), round(h * scale)), interpolation=cv2.INTER_AREA) if scale < 1.0 else gray
+        side = max(24, int(min(small.shape) * self.min_face))
+        faces = self.cascade.detectMultiScale(small, scaleFactor=1.1, minNeighbors=5, minSize=(side, side))
+        if len(faces) == 0:
+            return None
+        x, y, fw, fh = max(faces.tolist(), key=lambda f: f[2] * f[3])
+        return (round(x / scale), round(y / scale), round(fw / scale), round(fh / scale))
+
+    def _track_box(self, pts_px: np.ndarray, shape) -> Tuple[int, int, int, int]:
+        """Caja para el próximo frame a partir de los landmarks encontrados (en píxeles)."""
+        (x0, y0), (x1, y1) = pts_px[:, :2].min(axis=0), pts_px[:, :2].max(axis=0)
+        cx, cy, half = (x0 + x1) / 2, (y0 + y1) / 2, max(x1 - x0, y1 - y0) * 0.6
+        h, w = shape[:2]
+        x, y = max(0, int(cx - half)), max(0, int(cy - half))
+        return (x, y, min(w, int(cx + half)) - x, min(h, int(cy + half)) - y)
+
+    def detect(self, rgb):
+        gray = self._to_gray(rgb)
+        if self._box_shape != gray.shape:
+            self._box = None
+        tracked = self._box is not None and self._since_detect < self.redetect_every
+        if tracked:
+            box = self._box
+            self._since_detect += 1
+        else:
+            box = self._find_face(gray)
+            self._since_detect = 1
+        pts = self._landmarks(rgb, gray, box) if box is not None else None
+        if pts is None and tracked:
+            # la caja del frame anterior ya no tiene rostro: se busca de nuevo
+            box = self._find_face(gray)
+            self._since_detect = 1
+            pts = self._landmarks(rgb, gray, box) if box is not None else None
+        if pts is None:
+            self._box = None
+            return None
+        self._box = self._track_box(pts, gray.shape)
+        self._box_shape = gray.shape
+        h, w = gray.shape
+        pts = pts / np.array([w, h, w][:pts.shape[1]], np.float32)
+        return ibug68_to_metric(pts, self._out) if len(pts) == 68 else self._from_mesh(pts)
+
+    def _from_mesh(self, pts: np.ndarray) -> np.ndarray:
+        self._out[:, :pts.shape[1]] = pts[METRIC_IDX]
+        return self._out
+
+    @abstractmethod
+    def _landmarks(self, rgb, gray, box) -> Optional[np.ndarray]:
+        """Landmarks en píxeles de la imagen (N, 2|3) dentro de `box`, o None si no hay rostro."""
+
+
+class FacemarkLbfBackend(_CascadeFaceBackend):
+    """Facemark LBF de OpenCV: 68 puntos 2D, ~1-2 ms por rostro en CPU."""
+    name = "lbf"
+
+    def __init__(self, model_path: str, **kw):
+        if not hasattr(cv2, "face"):
+            raise ImportError("Facemark LBF necesita opencv-contrib-python (módulo cv2.face)")
+        super().__init__(**kw)
+        self.facemark = cv2.face.createFacemarkLBF()
+        self.facemark.loadModel(model_path)
+
+    def _landmarks(self, rgb, gray, box):
+        ok, landmarks = self.facemark.fit(gray, np.array([box], np.int32))
+        if not ok or len(landmarks) == 0:
+            return None
+        return landmarks[0].reshape(-1, 2)
+
+
+ONNX_POINTS = (68, 468, 478)      # iBUG y MediaPipe (sin y con iris)
+
+
+class OnnxLandmarkBackend(_CascadeFaceBackend):
+    """
+    Modelo ONNX de landmarks sobre el recorte cuadrado del rostro (margen `padding`).
+    Entrada RGB NCHW o NHWC según la forma del modelo, escalada a [0, 1] (o a [-1, 1] con
+    norm="-1_1"). La salida (N*2 o N*3 valores) puede venir normalizada al recorte o en
+    píxeles de la entrada; N debe ser 68 (iBUG) o 468/478 (MediaPipe).
+    `score_threshold` se aplica a la segunda salida del modelo si la tiene (presencia de rostro).
+    Con el módulo DNN de OpenCV la forma de la entrada no se lee del modelo: va en `input_shape`.
+    """
+    name = "onnx"
+
+    def __init__(self, model_path: str, padding: float = 0.25, norm: str = "0_1",
+                 score_threshold: float = 0.5, threads: int = 1, input_shape=(1, 3, 112, 112), **kw):
+        super().__init__(**kw)
+        self.padding = padding
+        self.norm = norm
+        self.score_threshold = score_threshold
+        if onnxruntime is not None:
+            opts = onnxruntime.SessionOptions()
+            opts.intra_op_num_threads = threads
+            self._session = onnxruntime.InferenceSession(model_path, opts, providers=["CPUExecutionProvider"])
+            inp = self._session.get_inputs()[0]
+            self._input_name, shape = inp.name, inp.shape
+            self._net = None
+        else:
+            self._session = None
+            self._net = cv2.dnn.readNetFromONNX(model_path)
+            self._net.setPreferableBackend(cv2.dnn.DNN_BACKEND_OPENCV)
+            shape = input_shape
+        self.nchw = shape[1] == 3
+        self.input_size = int(shape[2] if self.nchw else shape[1])
+        self._blob = np.zeros((1, 3, self.input_size, self.input_size) if self.nchw
+                              else (1, self.input_size, self.input_size, 3), np.float32)
+
+    def _run(self, crop: np.ndarray) -> List[np.ndarray]:
+        x = crop.astype(np.float32) * (1 / 255.0)
+        if self.norm == "-1_1":
+            x = x * 2 - 1
+        if self.nchw:
+            self._blob[0] = x.transpose(2, 0, 1)
+        else:
+            self._blob[0] = x
+        if self._session is not None:
+            return self._session.run(None, {self._input_name: self._blob})
+        self._net.setInput(self._blob)
+        return [self._net.forward()]
+
+    def _landmarks(self, rgb, gray, box):
+        x, y, bw, bh = box
+        side = max(bw, bh) * (1 + 2 * self.padding)
+        cx, cy = x + bw / 2, y + bh / 2
+        x0, y0 = int(round(cx - side / 2)), int(round(cy - side / 2))
+        s = int(round(side))
+        h, w = rgb.shape[:2]
+        # recorte cuadrado con relleno negro donde se sale de la imagen
+        crop = np.zeros((s, s, 3), np.uint8)
+        sx0, sy0, sx1, sy1 = max(0, x0), max(0, y0), min(w, x0 + s), min(h, y0 + s)
+        if sx1 <= sx0 or sy1 <= sy0:
+            return None
+        crop[sy0 - y0:sy1 - y0, sx0 - x0:sx1 - x0] = rgb[sy0:sy1, sx0:sx1]
+        crop = cv2.resize(crop, (self.input_size, self.input_size), interpolation=cv2.INTER_AREA)
+        outputs = self._run(crop)
+        if len(outputs) > 1 and outputs[1].size == 1:
+            score = float(outputs[1].ravel()[0])
+            if score < 0 or score > 1:
+                score = 1 / (1 + np.exp(-score))        # logit
+            if score < self.score_threshold:
+                return None
+        flat = outputs[0].ravel()
+        # (N, d) por el total de valores: ningún par soportado comparte tamaño (68*3 = 204 != n*2)
+        layout = next(((n, d) for n in ONNX_POINTS for d in (2, 3) if n * d == flat.size), None)
+        if layout is None:
+            raise ValueError(f"El modelo entrega {flat.size} valores; se esperan N*2 o N*3 con N en {ONNX_POINTS}")
+        dims = layout[1]
+        pts = flat.reshape(layout).astype(np.float32)
+        if np.abs(pts[:, :2]).max() > 2.0:
+            pts /= self.input_size          # en píxeles de la entrada -> normalizados al recorte
+        pts[:, :2] = pts[:, :2] * s + (x0, y0)
+        if dims == 3:
+            pts[:, 2] *= s
+        return pts
+
+
+# ---------------- Comparación entre modelos ----------------
+def blink_agreement(counts_a: List[int], counts_b: List[int], tolerance: int = 5) -> Dict[str, float]:
+    """
+    Parpadeos de B contra los de A (referencia) a partir del contador por frame: un parpadeo
+    coincide si B lo cuenta a `tolerance` frames o menos del de A. Retorna precisión, recall, F1
+    y el desfase (frames) de los que coinciden.
+    """
+    n = min(len(counts_a), len(counts_b))
+    ta = np.flatnonzero(np.diff(np.asarray(counts_a[:n]), prepend=0) > 0)
+    tb = np.flatnonzero(np.diff(np.asarray(counts_b[:n]), prepend=0) > 0)
+    matched = 0
+    offsets = []
+    j = 0
+    for t in ta.tolist():
+        while j < len(tb) and tb[j] < t - tolerance:
+            j += 1
+        if j < len(tb) and tb[j] <= t + tolerance:
+            matched += 1
+            offsets.append(abs(int(tb[j]) - t))
+            j += 1
+    precision = matched / len(tb) if len(tb) else 1.0
+    recall = matched / len(ta) if len(ta) else 1.0
+    f1 = 2 * precision * recall / (precision + recall) if precision + recall else 0.0
+    return {"parpadeos_ref": int(len(ta)), "parpadeos": int(len(tb)), "coinciden": matched,
+            "precision": round(precision, 3), "recall": round(recall, 3), "f1": round(f1, 3),
+            "desfase_medio_frames": round(float(np.mean(offsets)), 2) if offsets else 0.0,
+            "desfase_max_frames": max(offsets, default=0)}
+
+
+def compare_backends(sources: List[str], specs: List[str], config: Dict = None, fps: float = 30.0,
+                     tolerance: int = 5) -> Dict:
+    """
+    Corre los mismos clips con cada modelo (un proceso por modelo) y compara latencia de
+    inferencia y concordancia de EAR y parpadeos contra el primero de `specs`.
+    """
+    from evaluacion import agreement, evaluate_isolated, public
+
+    reports = [evaluate_isolated(sources, {**(config or {}), "landmark_backend": spec}, None, fps)
+               for spec in specs]
+    ref = reports[0]
+    out = {}
+    for spec, r in zip(specs, reports):
+        entry = {"inferencia_ms": r["etapas"]["inferencia"], "total_ms": r["total"], "fps": r["fps"],
+                 "cpu_ms_por_frame": r["cpu_ms_por_frame"], "rss_max_mb": r["rss_max_mb"],
+                 "fuentes": public(r)["fuentes"]}
+        if r is not ref:
+            entry["concordancia"] = agreement(ref, r, tolerance)
+        out[spec] = entry
+    return out
+
+
+def print_comparison(result: Dict):
+    ref = next(iter(result))
+    print(f"\n🧠 Modelos de landmarks (referencia: {ref})")
+    for spec, r in result.items():
+        inf = r["inferencia_ms"]
+        print(f"   {spec:<28} inferencia p50={inf['p50']:>7.3f}  p95={inf['p95']:>7.3f} ms  "
+              f"fps={r['fps']:<7} cpu={r['cpu_ms_por_frame']} ms/frame")
+        c = r.get("concordancia")
+        if c:
+            print(f"   {'':<28} rostro={c.get('rostro_coincide_pct')}%  ear_dif={c.get('ear_dif_media')}  "
+                  f"parpadeos {c['parpadeos']}/{c['parpadeos_ref']}  F1={c['f1']}")
+
+
+def main(argv=None):
+    from evaluacion import parse_config
+
+    parser = argparse.ArgumentParser(description="Modelos de landmarks: comparación de latencia y concordancia")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    bench = sub.add_parser("bench", help="compara modelos sobre los mismos clips grabados")
+    bench.add_argument("fuentes", nargs="+", help="videos o carpetas de imágenes")
+    bench.add_argument("--modelo", action="append", default=[],
+                       help="mediapipe, mediapipe_sin_iris, lbf:<modelo.yaml> u onnx:<modelo.onnx>; "
+                            "el primero es la referencia")
+    bench.add_argument("--config", default="", help="kwargs del detector comunes a todos los modelos")
+    bench.add_argument("--tolerancia", type=int, default=5, help="frames de tolerancia al emparejar parpadeos")
+    bench.add_argument("--fps", type=float, default=30.0, help="fps nominal para carpetas de imágenes")
+    bench.add_argument("--reporte", help="resultado en JSON")
+    args = parser.parse_args(argv)
+
+    specs = args.modelo or ["mediapipe", "mediapipe_sin_iris"]
+    result = compare_backends(args.fuentes, specs, parse_config(args.config), args.fps, args.tolerancia)
+    print_comparison(result)
+    if args.reporte:
+        with open(args.reporte, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Perfilado del detector en vivo: endpoint HTTP /metrics y muestreo de pilas para flame graphs.
+
+- GET /metrics          histogramas por etapa, contadores y medidores (texto de Prometheus)
+- GET /perfil?segundos=N muestrea las pilas de todos los hilos N s y responde en formato
+                         "folded" (flamegraph.pl, speedscope, inferno)
+- SIGUSR1               igual que /perfil, pero guarda perfil_<fecha>.folded en el directorio actual
+
+Ejemplos:
+    python somnolencia.py --metricas-puerto 9108
+    curl localhost:9108/metrics
+    curl "localhost:9108/perfil?segundos=10" > perfil.folded && flamegraph.pl perfil.folded > perfil.svg
+"""
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from somnolencia import HotPathStats
+
+MAX_PROFILE_SECONDS = 60.0
+
+
+class StackSampler:
+    """
+    Toma las pilas de todos los hilos cada `interval` s (sys._current_frames) y cuenta
+    cuántas veces aparece cada una. El tiempo dentro de código C (FaceMesh, OpenCV) se
+    atribuye a la función de Python que lo llamó.
+    """
+    def __init__(self, interval: float = 0.005):
+        self.interval = interval
+        self._lock = threading.Lock()       # un muestreo a la vez
+
+    def sample(self, seconds: float) -> Counter:
+        counts = Counter()
+        own = threading.get_ident()
+        with self._lock:
+            end = time.perf_counter() + min(seconds, MAX_PROFILE_SECONDS)
+            while time.perf_counter() < end:
+                names = {t.ident: t.name for t in threading.enumerate()}
+                for tid, frame in sys._current_frames().items():
+                    if tid == own:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                        frame = frame.f_back
+                    stack.append(names.get(tid, str(tid)))
+                    counts[";".join(reversed(stack))] += 1
+                time.sleep(self.interval)
+        return counts
+
+    @staticmethod
+    def folded(counts: Counter) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in counts.most_common())
+
+    def dump(self, path: str, seconds: float) -> int:
+        counts = self.sample(seconds)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.folded(counts))
+        return sum(counts.values())
+
+
+class MetricsServer:
+    """Servidor HTTP local (hilo daemon) que publica un HotPathStats."""
+    def __init__(self, stats: HotPathStats, host: str = "127.0.0.1", port: int = 9108,
+                 sampler: StackSampler = None):
+        self.stats = stats
+        self.sampler = sampler or StackSampler()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self) -> int:
+        return self._httpd.server_address[1]
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                url = urlparse(self.path)
+                if url.path == "/metrics":
+                    self._reply(server.stats.prometheus(), "text/plain; version=0.0.4; charset=utf-8")
+                elif url.path == "/perfil":
+                    try:
+                        seconds = float(parse_qs(url.query).get("segundos", ["5"])[0])
+                    except ValueError:
+                        self.send_error(400, "segundos inválido")
+                        return
+                    self._reply(server.sampler.folded(server.sampler.sample(seconds)), "text/plain; charset=utf-8")
+                else:
+                    self.send_error(404)
+
+            def _reply(self, body: str, content_type: str):
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self) -> "MetricsServer":
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="metricas", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def install_signal_dump(seconds: float = 10.0, sampler: StackSampler = None) -> bool:
+    """Con SIGUSR1 guarda un perfil de `seconds` s en un hilo aparte. False si la plataforma no lo permite."""
+    if not hasattr(signal, "SIGUSR1") or threading.current_thread() is not threading.main_thread():
+        return False
+    sampler = sampler or StackSampler()
+
+    def dump():
+        path = f"perfil_{datetime.now():%Y%m%d_%H%M%S}.folded"
+        n = sampler.dump(path, seconds)
+        print(f"🔥 Perfil guardado en {path} ({n} muestras)")
+
+    signal.signal(signal.SIGUSR1, lambda *_: threading.Thread(target=dump, name="perfil", daemon=True).start())
+    return True
+
+
+def print_summary(stats: HotPathStats):
+    s = stats.summary()
+    for stage, h in sorted(s["etapas"].items()):
+        print(f"⏱️ {stage:<11} n={h['n']:<7} media={h['media_ms']:>8.3f} ms  "
+              f"p50≤{h['p50_ms']:g} ms  p99≤{h['p99_ms']:g} ms")
+    if s["contadores"]:
+        print("🔢 " + "  ".join(f"{k}={v}" for k, v in sorted(s["contadores"].items())))
+    if s["medidores"]:
+        print("📏 " + "  ".join(f"{k}={v:g}" for k, v in sorted(s["medidores"].items())))
@@ -0,0 +1,272 @@
+"""
+Supervisor multi-cámara: un proceso por cabina/conductor.
+
+Cada worker abre su fuente (índice de cámara, URL RTSP o archivo), tiene su propio
+FaceMesh y máquina de estados, y se fija a un núcleo. Los eventos de todos los workers
+llegan por una cola a un único agregador que escribe en la DB con EventWriter.
+El supervisor publica salud y FPS por stream y reinicia los workers que se caen.
+
+Ejemplos:
+    python servidor_camaras.py 0 1 rtsp://10.0.0.21/stream1
+    python servidor_camaras.py cabina1.mp4 cabina2.mp4 --config roi_tracking=true
+"""
+import os
+import argparse
+import json
+import multiprocessing
+import queue
+import threading
+import time
+from typing import Dict, List, Tuple
+
+STATS_INTERVAL = 1.0        # cada cuánto reporta un worker (s)
+HEARTBEAT_TIMEOUT = 5.0     # sin reportes por más de esto => stream sin datos
+MAX_RESTART_BACKOFF = 30.0
+STABLE_UPTIME = 60.0        # un worker que vivió más que esto reinicia sin espera acumulada
+
+
+# ---------------- Worker (proceso hijo) ----------------
+class QueueEventWriter:
+    """Sumidero de eventos del worker: reenvía las filas al agregador sin bloquear el frame."""
+    def __init__(self, stream_id: str, events):
+        self.stream_id = stream_id
+        self._events = events
+        self.dropped = 0
+
+    def start(self):
+        pass
+
+    def put(self, row: Tuple) -> bool:
+        try:
+            self._events.put_nowait((self.stream_id, row))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0):
+        pass
+
+
+def _open_source(source: str):
+    from captura import open_source
+    return open_source(source)
+
+
+def camera_worker(stream_id: str, source: str, config: Dict, events, stats, stop, core: int = None):
+    """Bucle de un stream: captura -> analyze, sin dibujos ni audio. Sale con 0 al terminar un archivo."""
+    if core is not None and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, {core})
+        except OSError:
+            pass
+
+    from somnolencia import DrowsinessDetector, NullAudio
+
+    cap = _open_source(source)
+    if not cap.isOpened():
+        raise SystemExit(2)
+    # los workers no suenan: las alertas de cada cabina van a la DB
+    detector = DrowsinessDetector(**{"event_writer": QueueEventWriter(stream_id, events), "audio": NullAudio(),
+                                     "render_level": "ninguno", "trip_label": f"{stream_id}:{source}",
+                                     **config})
+    frames = faces = 0
+    window_start = time.monotonic()
+
+    def report(now):
+        m = detector.metrics
+        try:
+            stats.put_nowait((stream_id, {
+                "fps": frames / max(now - window_start, 1e-6),
+                "rostro_pct": 100.0 * faces / max(frames, 1),
+                "nivel": m.drowsiness_level,
+                "parpadeos": m.blinks_count, "cabeceos": m.head_nods_count, "bostezos": m.yawns_count,
+                "eventos_descartados": detector.event_writer.dropped,
+                "inferencia_ms": detector.stage_times["inferencia"] * 1000,
+            }))
+        except queue.Full:
+            pass
+
+    try:
+        while not stop.is_set():
+            ret, frame = cap.read()
+            if not ret:
+                # archivo terminado => fin normal; cámara/RTSP caída => error para que se reinicie
+                raise SystemExit(0 if os.path.isfile(source) else 3)
+            detector.analyze(frame)
+            frames += 1
+            faces += detector.metrics.is_face_detected
+            now = time.monotonic()
+            if now - window_start >= STATS_INTERVAL:
+                report(now)
+                frames = faces = 0
+                window_start = now
+    finally:
+        if frames:
+            report(time.monotonic())
+        cap.release()
+        detector.cleanup()
+
+
+# ---------------- Supervisor (proceso principal) ----------------
+class StreamHandle:
+    """Estado que el supervisor lleva de cada stream."""
+    def __init__(self, stream_id: str, source: str, core: int = None):
+        self.stream_id = stream_id
+        self.source = source
+        self.core = core
+        self.process = None
+        self.restarts = 0
+        self.failures = 0           # caídas seguidas (para el backoff)
+        self.started_at = 0.0
+        self.next_start = 0.0
+        self.finished = False
+        self.last_stats = {}
+        self.last_seen = 0.0
+
+    def health(self, now: float) -> Dict:
+        if self.finished:
+            state = "terminado"
+        elif self.process is None or not self.process.is_alive():
+            state = "reiniciando"
+        elif now - self.last_seen > HEARTBEAT_TIMEOUT:
+            state = "sin_datos"
+        else:
+            state = "ok"
+        return {"fuente": self.source, "estado": state, "reinicios": self.restarts,
+                "core": self.core, **self.last_stats}
+
+
+class CameraSupervisor:
+    def __init__(self, sources: List[str], config: Dict = None, event_writer=None, pin_cores: bool = True):
+        self.config = dict(config or {})
+        self._ctx = multiprocessing.get_context("spawn")
+        self.events = self._ctx.Queue(maxsize=10000)
+        self.stats = self._ctx.Queue(maxsize=1000)
+        self._stop = self._ctx.Event()
+        ncores = os.cpu_count() or 1
+        self.streams = {f"cam{i}": StreamHandle(f"cam{i}", src, (i % ncores) if pin_cores else None)
+                        for i, src in enumerate(sources)}
+        if event_writer is None:
+            from somnolencia import EventWriter
+            event_writer = EventWriter()
+        self.event_writer = event_writer
+        self._aggregator = None
+
+    # ---- Agregador de eventos -> DB ----
+    def _aggregate_events(self):
+        while not self._stop.is_set() or not self.events.empty():
+            try:
+                stream_id, row = self.events.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self.event_writer.put(row)
+
+    # ---- Ciclo de vida de los workers ----
+    def _spawn(self, handle: StreamHandle):
+        handle.process = self._ctx.Process(
+            target=camera_worker, name=handle.stream_id, daemon=True,
+            args=(handle.stream_id, handle.source, {**self.config, "camera_id": handle.source},
+                  self.events, self.stats, self._stop, handle.core))
+        handle.process.start()
+        handle.started_at = handle.last_seen = time.monotonic()
+
+    def _check_workers(self, now: float):
+        for handle in self.streams.values():
+            proc = handle.process
+            if handle.finished or (proc is not None and proc.is_alive()):
+                continue
+            if proc is not None:
+                if proc.exitcode == 0:
+                    handle.finished = True
+                    print(f"🏁 {handle.stream_id} terminó ({handle.source})")
+                    continue
+                if handle.next_start == 0.0:
+                    if now - handle.started_at > STABLE_UPTIME:
+                        handle.failures = 0
+                    backoff = min(2 ** handle.failures, MAX_RESTART_BACKOFF)
+                    handle.failures += 1
+                    handle.next_start = now + backoff
+                    print(f"⚠️ {handle.stream_id} se cayó (código {proc.exitcode}); reinicio en {backoff:.0f}s")
+                if now < handle.next_start:
+                    continue
+                handle.restarts += 1
+            handle.next_start = 0.0
+            self._spawn(handle)
+
+    def _drain_stats(self, now: float):
+        while True:
+            try:
+                stream_id, st = self.stats.get_nowait()
+            except queue.Empty:
+                return
+            handle = self.streams[stream_id]
+            handle.last_stats = st
+            handle.last_seen = now
+
+    def health(self) -> Dict[str, Dict]:
+        now = time.monotonic()
+        return {sid: h.health(now) for sid, h in self.streams.items()}
+
+    def run(self, report_every: float = 5.0):
+        self.event_writer.start()
+        self._aggregator = threading.Thread(target=self._aggregate_events, name="agregador", daemon=True)
+        self._aggregator.start()
+        last_report = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                self._check_workers(now)
+                self._drain_stats(now)
+                if all(h.finished for h in self.streams.values()):
+                    break
+                if now - last_report >= report_every:
+                    self.print_health()
+                    last_report = now
+                time.sleep(0.2)
+        finally:
+            self.stop()
+
+    def print_health(self):
+        for sid, h in self.health().items():
+            fps = h.get("fps", 0.0)
+            print(f"📡 {sid} [{h['estado']}] {fps:5.1f} fps  nivel={h.get('nivel', '-')}  "
+                  f"reinicios={h['reinicios']}  core={h['core']}  {h['fuente']}")
+
+    def stop(self):
+        self._stop.set()
+        for handle in self.streams.values():
+            if handle.process is not None:
+                handle.process.join(timeout=3.0)
+                if handle.process.is_alive():
+                    handle.process.terminate()
+        if self._aggregator is not None:
+            self._aggregator.join(timeout=3.0)
+        self.event_writer.close()
+
+
+def main(argv=None):
+    from evaluacion import parse_config
+
+    parser = argparse.ArgumentParser(description="Supervisor multi-cámara del detector de somnolencia")
+    parser.add_argument("fuentes", nargs="+", help="índices de cámara, URLs RTSP/GStreamer o archivos")
+    parser.add_argument("--config", default="", help="kwargs del detector, ej. roi_tracking=true")
+    parser.add_argument("--sin-afinidad", action="store_true", help="no fijar cada worker a un núcleo")
+    parser.add_argument("--salud", help="al salir, guarda la salud final por stream en este JSON")
+    args = parser.parse_args(argv)
+
+    supervisor = CameraSupervisor(args.fuentes, parse_config(args.config), pin_cores=not args.sin_afinidad)
+    print(f"🚚 Supervisando {len(args.fuentes)} streams (Ctrl+C para salir)")
+    try:
+        supervisor.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        supervisor.print_health()
+        if args.salud:
+            with open(args.salud, "w", encoding="utf-8") as f:
+                json.dump(supervisor.health(), f, indent=2, ensure_ascii=False)
+
+
+if __name__ == "__main__":
+    main()
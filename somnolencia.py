@@ -1,32 +1,467 @@
-import cv2
+import time
+_MODULE_T0 = time.perf_counter()
+
 import numpy as np
-import mediapipe as mp
 import math
-import time
+import sys
 import threading
-from typing import Tuple, Dict
-import pygame
-from dataclasses import dataclass
+import collections
+import argparse
+import importlib
+from typing import Tuple, Dict, Optional
+from dataclasses import dataclass, replace
 
-import mysql.connector
+import os
+import json
+import queue
+import uuid
+import tempfile
+import bisect
+import heapq
+from abc import ABC, abstractmethod
 from datetime import datetime
 
+# -----------------------
+# Importaciones diferidas: cv2, mediapipe, pygame y mysql se cargan en el primer uso,
+# así las herramientas que solo usan DrowsinessMetrics o la matemática no los pagan.
+# -----------------------
+IMPORT_TIMES_MS: Dict[str, float] = {}
+
+
+class _LazyModule:
+    """Importa el módulo real en el primer acceso a un atributo y registra cuánto tardó."""
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            t0 = time.perf_counter()
+            self._module = importlib.import_module(self._name)
+            IMPORT_TIMES_MS[self._name] = (time.perf_counter() - t0) * 1000
+        return getattr(self._module, attr)
+
+
+cv2 = _LazyModule("cv2")
+mp = _LazyModule("mediapipe")
+pygame = _LazyModule("pygame")
+mysql_connector = _LazyModule("mysql.connector")
+
 # -----------------------
 # Conexión a la base de datos (ajusta usuario/clave si hace falta)
 # -----------------------
-try:
-    conn = mysql.connector.connect(
-        host="localhost",
-        user="root",
-        password="",        # <-- pon tu contraseña si tienes
-        database="somnolencia"
-    )
-    cursor = conn.cursor()
-    print("✅ Conexión MySQL OK")
-except Exception as e:
-    conn = None
-    cursor = None
-    print("⚠️ No se pudo conectar a MySQL:", e)
+DB_CONFIG = {
+    "host": "localhost",
+    "user": "root",
+    "password": "",        # <-- pon tu contraseña si tienes
+    "database": "somnolencia",
+}
+
+# -----------------------
+# Instrumentación del camino caliente
+# -----------------------
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.25, 0.5, 1.0)   # s
+
+
+class LatencyHistogram:
+    """Latencias en cubetas fijas (las de Prometheus, `le`): observar es un bisect y dos sumas."""
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)     # la última es +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Cota superior de la cubeta que contiene el cuantil q (s)."""
+        target = q * self.count
+        acc = 0
+        for le, c in zip(LATENCY_BUCKETS, self.counts):
+            acc += c
+            if acc >= target:
+                return le
+        return math.inf
+
+
+class HotPathStats:
+    """
+    Tiempos por etapa y contadores del detector. Se actualizan sin lock desde cualquier
+    hilo (con el GIL, en el peor caso se pierde alguna cuenta bajo contención); los
+    medidores son funciones que se evalúan solo al exportar.
+    """
+    def __init__(self):
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.counters: Dict[str, int] = {}
+        self.gauges: Dict[str, object] = {}
+
+    def observe(self, stage: str, seconds: float):
+        h = self.histograms.get(stage)
+        if h is None:
+            h = self.histograms[stage] = LatencyHistogram()
+        h.observe(seconds)
+
+    def inc(self, name: str, n: int = 1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name: str, fn):
+        self.gauges[name] = fn
+
+    def _gauge_values(self) -> Dict[str, float]:
+        out = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                out[name] = float(fn())
+            except Exception:
+                pass
+        return out
+
+    def summary(self) -> Dict:
+        etapas = {stage: {"n": h.count, "media_ms": round(1000 * h.total / max(h.count, 1), 3),
+                          "p50_ms": 1000 * h.quantile(0.5), "p99_ms": 1000 * h.quantile(0.99)}
+                  for stage, h in self.histograms.items()}
+        return {"etapas": etapas, "contadores": dict(self.counters), "medidores": self._gauge_values()}
+
+    def prometheus(self, prefix: str = "somnolencia") -> str:
+        """Formato de texto de Prometheus (versión 0.0.4)."""
+        name = f"{prefix}_etapa_segundos"
+        lines = [f"# HELP {name} Duración de cada etapa del frame.", f"# TYPE {name} histogram"]
+        for stage, h in sorted(self.histograms.items()):
+            acc = 0
+            for le, c in zip(LATENCY_BUCKETS, h.counts):
+                acc += c
+                lines.append(f'{name}_bucket{{etapa="{stage}",le="{le}"}} {acc}')
+            lines.append(f'{name}_bucket{{etapa="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{name}_sum{{etapa="{stage}"}} {h.total:.6f}')
+            lines.append(f'{name}_count{{etapa="{stage}"}} {h.count}')
+        for counter, v in sorted(self.counters.items()):
+            lines += [f"# TYPE {prefix}_{counter}_total counter", f"{prefix}_{counter}_total {v}"]
+        for gauge, v in sorted(self._gauge_values().items()):
+            lines += [f"# TYPE {prefix}_{gauge} gauge", f"{prefix}_{gauge} {v:g}"]
+        return "\n".join(lines) + "\n"
+
+# -----------------------
+# Modelo de viajes: sesión por viaje, eventos append-only y resumen por minuto
+# -----------------------
+EVENT_TYPES = ("parpadeo", "cabeceo", "bostezo")
+SESSION_START = "inicio"
+SESSION_END = "fin"
+
+# Se crean al conectar si no existen (la tabla `viaje` anterior queda solo como histórico)
+SCHEMA_SQL = (
+    """CREATE TABLE IF NOT EXISTS sesion (
+        id_sesion CHAR(32) NOT NULL PRIMARY KEY,
+        origen VARCHAR(128) NULL,
+        inicio DATETIME NOT NULL,
+        fin DATETIME NULL,
+        INDEX idx_sesion_inicio (inicio)
+    )""",
+    """CREATE TABLE IF NOT EXISTS evento (
+        id_evento BIGINT NOT NULL AUTO_INCREMENT PRIMARY KEY,
+        id_sesion CHAR(32) NOT NULL,
+        tipo ENUM('parpadeo', 'cabeceo', 'bostezo') NOT NULL,
+        ts DATETIME(3) NOT NULL,
+        INDEX idx_evento_sesion_ts (id_sesion, ts),
+        INDEX idx_evento_ts (ts)
+    )""",
+    """CREATE TABLE IF NOT EXISTS resumen_minuto (
+        id_sesion CHAR(32) NOT NULL,
+        minuto DATETIME NOT NULL,
+        parpadeos INT NOT NULL DEFAULT 0,
+        cabeceos INT NOT NULL DEFAULT 0,
+        bostezos INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (id_sesion, minuto),
+        INDEX idx_resumen_minuto (minuto)
+    )""",
+)
+
+
+def rollup_by_minute(events) -> list:
+    """[(id_sesion, tipo, ts), ...] -> [(id_sesion, minuto, parpadeos, cabeceos, bostezos), ...]"""
+    counts = {}
+    for session_id, tipo, ts in events:
+        key = (session_id, ts.replace(second=0, microsecond=0))
+        counts.setdefault(key, [0, 0, 0])[EVENT_TYPES.index(tipo)] += 1
+    return [(sid, minute, *c) for (sid, minute), c in counts.items()]
+
+# -----------------------
+# Escritor asíncrono de eventos
+# -----------------------
+class EventWriter:
+    """
+    Sumidero de eventos en segundo plano: el bucle de frames solo encola filas
+    (id_sesion, tipo, ts, origen). Un hilo escritor las agrupa con executemany, inserta
+    los eventos, suma el lote a resumen_minuto y hace commit por tamaño o tiempo.
+    Si MySQL no está disponible, las filas van a un diario local (JSONL) que se
+    reenvía en orden cuando la conexión vuelve.
+    """
+    INSERT_SESSION_SQL = "INSERT IGNORE INTO sesion (id_sesion, inicio, origen) VALUES (%s, %s, %s)"
+    END_SESSION_SQL = "UPDATE sesion SET fin = %s WHERE id_sesion = %s"
+    INSERT_EVENT_SQL = "INSERT INTO evento (id_sesion, tipo, ts) VALUES (%s, %s, %s)"
+    UPSERT_ROLLUP_SQL = ("INSERT INTO resumen_minuto (id_sesion, minuto, parpadeos, cabeceos, bostezos) "
+                         "VALUES (%s, %s, %s, %s, %s) ON DUPLICATE KEY UPDATE "
+                         "parpadeos = parpadeos + VALUES(parpadeos), "
+                         "cabeceos = cabeceos + VALUES(cabeceos), "
+                         "bostezos = bostezos + VALUES(bostezos)")
+
+    def __init__(self,
+                 db_config: Dict = None,
+                 journal_path: str = "eventos_pendientes.jsonl",
+                 max_queue: int = 1000,
+                 batch_size: int = 20,
+                 flush_interval: float = 1.0,
+                 max_backoff: float = 30.0,
+                 connect=None,
+                 stats: HotPathStats = None):
+        self.db_config = db_config if db_config is not None else DB_CONFIG
+        self.journal_path = journal_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_backoff = max_backoff
+        self._connect_fn = connect or (lambda: mysql_connector.connect(**self.db_config))
+        self.stats = stats      # latencia de cada lote (etapa db_insert) y errores
+
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread = None
+        self._closing = threading.Event()
+        self._journal_lock = threading.Lock()     # reenvío del diario vs. filas que se agregan
+        self._conn = None
+        self._cursor = None
+        self._backoff = 1.0
+        self._next_retry = 0.0
+
+        # Estadísticas
+        self.dropped = 0
+        self.written = 0
+        self.journaled = 0
+
+    # ---- API del bucle de frames (no bloqueante) ----
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._closing.clear()
+        self._thread = threading.Thread(target=self._run, name="event-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, row: Tuple) -> bool:
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def close(self, timeout: float = 5.0):
+        self._closing.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+        # Lo que no alcanzó a escribirse queda en el diario (con el lock: si el hilo sigue
+        # reenviando el diario, se agrega después de que lo borre)
+        leftover = self._drain()
+        if leftover:
+            self._spill(leftover)
+        if self._thread is None or not self._thread.is_alive():
+            self._disconnect()
+
+    # ---- Hilo escritor ----
+    def _run(self):
+        batch = []
+        deadline = time.monotonic() + self.flush_interval
+        while not self._closing.is_set():
+            try:
+                batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+            except queue.Empty:
+                pass
+            now = time.monotonic()
+            if len(batch) >= self.batch_size or now >= deadline:
+                if batch:
+                    self._flush(batch)
+                    batch = []
+                elif os.path.exists(self.journal_path):
+                    self._flush([])
+                deadline = now + self.flush_interval
+        batch.extend(self._drain())
+        if batch:
+            self._flush(batch)
+
+    def _drain(self):
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def _flush(self, batch):
+        if not self._ensure_connection():
+            self._spill(batch)
+            return
+        try:
+            self._replay_journal()
+            if batch:
+                t0 = time.perf_counter()
+                self._write_rows(batch)
+                self._conn.commit()
+                self.written += len(batch)
+                if self.stats is not None:
+                    self.stats.observe("db_insert", time.perf_counter() - t0)
+        except Exception as e:
+            if self.stats is not None:
+                self.stats.inc("db_errores")
+            print("⚠️ Error insert DB (lote):", e)
+            self._disconnect()
+            self._schedule_retry()
+            self._spill(batch)
+
+    def _write_rows(self, rows):
+        """Sesiones, eventos y resumen por minuto del lote, dentro de la transacción en curso."""
+        starts = [(sid, ts, origen) for sid, tipo, ts, origen in rows if tipo == SESSION_START]
+        events = [(sid, tipo, ts) for sid, tipo, ts, _ in rows if tipo in EVENT_TYPES]
+        ends = [(ts, sid) for sid, tipo, ts, _ in rows if tipo == SESSION_END]
+        if starts:
+            self._cursor.executemany(self.INSERT_SESSION_SQL, starts)
+        if events:
+            self._cursor.executemany(self.INSERT_EVENT_SQL, events)
+            self._cursor.executemany(self.UPSERT_ROLLUP_SQL, rollup_by_minute(events))
+        if ends:
+            self._cursor.executemany(self.END_SESSION_SQL, ends)
+
+    def _ensure_connection(self) -> bool:
+        if self._conn is not None:
+            return True
+        if time.monotonic() < self._next_retry:
+            return False
+        try:
+            self._conn = self._connect_fn()
+            self._cursor = self._conn.cursor()
+            for ddl in SCHEMA_SQL:
+                self._cursor.execute(ddl)
+            self._conn.commit()
+            self._backoff = 1.0
+            print("✅ Conexión MySQL OK")
+            return True
+        except Exception as e:
+            print("⚠️ No se pudo conectar a MySQL:", e)
+            self._disconnect()
+            self._schedule_retry()
+            return False
+
+    def _schedule_retry(self):
+        self._next_retry = time.monotonic() + self._backoff
+        self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def _disconnect(self):
+        for res in (self._cursor, self._conn):
+            try:
+                if res is not None:
+                    res.close()
+            except Exception:
+                pass
+        self._cursor = None
+        self._conn = None
+
+    # ---- Diario local ----
+    @staticmethod
+    def _encode(row):
+        return [{"dt": v.isoformat()} if isinstance(v, datetime) else v for v in row]
+
+    @staticmethod
+    def _decode(values):
+        return tuple(datetime.fromisoformat(v["dt"]) if isinstance(v, dict) else v for v in values)
+
+    def _spill(self, rows):
+        try:
+            with self._journal_lock, open(self.journal_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(self._encode(row)) + "\n")
+            self.journaled += len(rows)
+        except Exception as e:
+            self.dropped += len(rows)
+            print("⚠️ No se pudo escribir el diario local:", e)
+
+    def _replay_journal(self):
+        """Reenvía el diario pendiente en una sola transacción; se borra solo tras el commit."""
+        with self._journal_lock:
+            self._replay_journal_locked()
+
+    def _replay_journal_locked(self):
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, encoding="utf-8") as f:
+            raw = [self._decode(json.loads(line)) for line in f if line.strip()]
+        rows, legacy, unknown = [], [], []
+        kinds = set(EVENT_TYPES + (SESSION_START, SESSION_END))
+        for r in raw:
+            if len(r) == 4 and isinstance(r[1], str) and r[1] in kinds:
+                rows.append(r)
+            elif self._is_legacy(r):
+                legacy.append(r)
+            else:
+                unknown.append(r)
+        if legacy:
+            try:
+                rows += self._legacy_rows(legacy)
+                print(f"⚠️ Diario: {len(legacy)} filas del formato anterior pasadas a eventos")
+            except ValueError:
+                unknown += legacy
+        for i in range(0, len(rows), self.batch_size):
+            self._write_rows(rows[i:i + self.batch_size])
+        self._conn.commit()
+        if unknown:
+            # no se pierden: quedan aparte para revisarlas a mano
+            with open(self.journal_path + ".legacy", "a", encoding="utf-8") as f:
+                for row in unknown:
+                    f.write(json.dumps(self._encode(row)) + "\n")
+            print(f"⚠️ Diario: {len(unknown)} filas no reconocidas guardadas en {self.journal_path}.legacy")
+        os.remove(self.journal_path)
+        self.written += len(rows)
+        if rows:
+            print(f"✅ Diario reenviado: {len(rows)} filas")
+
+    @staticmethod
+    def _is_legacy(values) -> bool:
+        """Fila del diario anterior: [hora ISO, parpadeos, cabeceos, bostezos] acumulados."""
+        return (len(values) == 4 and isinstance(values[0], (str, datetime))
+                and all(isinstance(v, int) and not isinstance(v, bool) for v in values[1:]))
+
+    @staticmethod
+    def _legacy_rows(legacy) -> list:
+        """
+        Contadores acumulados del formato anterior -> eventos de una sesión sintética
+        'legado<fecha>'. Un contador que baja o una fila con un solo evento reinicia la cuenta.
+        """
+        times = [datetime.fromisoformat(r[0]) if isinstance(r[0], str) else r[0] for r in legacy]
+        session_id = "legado" + times[0].strftime("%Y%m%d%H%M%S%f")
+        rows = [(session_id, SESSION_START, times[0], "diario anterior")]
+        prev = (0, 0, 0)
+        for ts, row in zip(times, legacy):
+            counts = tuple(row[1:])
+            if any(c < p for c, p in zip(counts, prev)) or sum(counts) <= 1:
+                prev = (0, 0, 0)
+            for tipo, c, p in zip(EVENT_TYPES, counts, prev):
+                rows += [(session_id, tipo, ts, None)] * (c - p)
+            prev = counts
+        rows.append((session_id, SESSION_END, times[-1], None))
+        return rows
+
+class NullEventWriter:
+    """Sumidero que descarta los eventos (evaluación offline, herramientas sin DB)."""
+    def __init__(self):
+        self.written = 0
+
+    def start(self):
+        pass
+
+    def put(self, row: Tuple) -> bool:
+        self.written += 1
+        return True
+
+    def close(self, timeout: float = 5.0):
+        pass
 
 # -----------------------
 # Métricas y dataclass
@@ -43,12 +478,821 @@ class DrowsinessMetrics:
     ear_right: float = 0.0
     head_pose: Dict[str, float] = None
     is_face_detected: bool = False
-    mouth_open_ratio: float = 0.0
+    mouth_open_ratio: float = 0.0         # suavizado (el que se compara con el umbral)
+    ear_smoothed: float = 0.0             # EAR promedio suavizado
+    # Ventana deslizante (ver SlidingWindowScorer)
+    perclos: float = 0.0                  # fracción del tiempo con ojos cerrados
+    blink_rate: float = 0.0               # parpadeos/min
+    yawn_rate: float = 0.0                # bostezos/min
+    nod_rate: float = 0.0                 # cabeceos/min
+    mean_blink_duration: float = 0.0      # s
+    blink_duration_hist: Tuple[int, ...] = ()   # conteos por BLINK_HIST_EDGES
+    fatigue_score: float = 0.0            # 0..1
 
     def __post_init__(self):
         if self.head_pose is None:
             self.head_pose = {"pitch": 0.0, "yaw": 0.0, "roll": 0.0}
 
+    def snapshot(self) -> "DrowsinessMetrics":
+        """Copia independiente para pasar a otro hilo (render) sin compartir estado."""
+        return replace(self, head_pose=dict(self.head_pose))
+
+# -----------------------
+# Tonos de alerta precalculados
+# -----------------------
+BEEP_TONE = (1000, 0.3, 0.35)   # (frecuencia Hz, duración s, amplitud) del beep de cabeceo
+
+
+@dataclass(frozen=True)
+class AlertPattern:
+    """Un periodo del patrón: tono + silencio. Se reproduce en bucle en el canal de alerta."""
+    frequency: float = 700
+    tone_duration: float = 0.5
+    pause: float = 0.3
+    amplitude: float = 0.3
+
+
+# Escalamiento por nivel; SOMNOLIENTO replica el bucle anterior (tono 0.5 s cada 0.8 s)
+DEFAULT_ALERT_PATTERNS = {
+    "SOMNOLIENTO": AlertPattern(frequency=700, tone_duration=0.5, pause=0.3, amplitude=0.3),
+    "MICROSUEÑO": AlertPattern(frequency=1000, tone_duration=0.25, pause=0.1, amplitude=0.45),
+}
+
+
+class ToneCache:
+    """Genera cada buffer (frecuencia, duración, amplitud, pausa) una vez con NumPy y guarda el Sound."""
+    def __init__(self, sample_rate: int = 22050, channels: int = 2):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self._sounds = {}
+
+    def samples(self, frequency: float, duration: float, amplitude: float, pause: float = 0.0) -> np.ndarray:
+        frames = int(duration * self.sample_rate)
+        t = np.arange(frames) / self.sample_rate
+        wave = (amplitude * np.sin(2 * np.pi * frequency * t) * 32767).astype(np.int16)
+        buf = np.zeros((frames + int(pause * self.sample_rate), self.channels), np.int16)
+        buf[:frames] = wave[:, None]
+        return buf[:, 0].copy() if self.channels == 1 else buf
+
+    def tone(self, frequency: float, duration: float, amplitude: float, pause: float = 0.0):
+        key = (frequency, duration, amplitude, pause)
+        sound = self._sounds.get(key)
+        if sound is None:
+            sound = pygame.sndarray.make_sound(self.samples(*key))
+            self._sounds[key] = sound
+        return sound
+
+    def pattern(self, pattern: AlertPattern):
+        return self.tone(pattern.frequency, pattern.tone_duration, pattern.amplitude, pattern.pause)
+
+
+class NullAudio:
+    """Backend de audio mudo (servidor multi-cámara, evaluación offline, herramientas)."""
+    def beep(self, frequency: float = BEEP_TONE[0], duration: float = BEEP_TONE[1]):
+        pass
+
+    def start_alert(self, pattern: AlertPattern):
+        pass
+
+    def stop_alert(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class PygameAudio:
+    """
+    pygame.mixer con tonos precalculados: el beep y los patrones se generan al iniciar y
+    la alerta suena en bucle en un canal reservado. Si el mixer no inicia, queda mudo.
+    """
+    def __init__(self, patterns=()):
+        self.available = False
+        self.tones = None
+        self.alert_channel = None
+        try:
+            pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
+            sample_rate, _, channels = pygame.mixer.get_init()
+            self.tones = ToneCache(sample_rate, channels)
+            # Tonos precalculados una sola vez: beep de cabeceo y patrones de alerta
+            self.tones.tone(*BEEP_TONE)
+            for pattern in patterns:
+                self.tones.pattern(pattern)
+            # Canal 0 reservado para la alerta en bucle; los beeps usan los demás
+            pygame.mixer.set_reserved(1)
+            self.alert_channel = pygame.mixer.Channel(0)
+            self.available = True
+            print("✅ Audio inicializado")
+        except Exception as e:
+            print("⚠️ No se pudo inicializar pygame.mixer:", e)
+
+    def beep(self, frequency: float = BEEP_TONE[0], duration: float = BEEP_TONE[1]):
+        if not self.available:
+            return
+        try:
+            self.tones.tone(frequency, duration, BEEP_TONE[2]).play()
+        except Exception:
+            pass
+
+    def start_alert(self, pattern: AlertPattern):
+        if not self.available:
+            return
+        try:
+            self.alert_channel.play(self.tones.pattern(pattern), loops=-1)
+        except Exception:
+            pass
+
+    def stop_alert(self):
+        if not self.available:
+            return
+        try:
+            self.alert_channel.stop()
+        except Exception:
+            pass
+
+    def close(self):
+        if self.available:
+            self.stop_alert()
+            pygame.mixer.quit()
+            self.available = False
+
+
+ALERT_PRIORITY = {"SOMNOLIENTO": 1, "MICROSUEÑO": 2}
+
+
+class AlertScheduler:
+    """
+    Un solo hilo de audio con cola de comandos y temporizadores. start_alert/stop_alert/beep
+    solo encolan (nunca bloquean el frame); el hilo aplica prioridades y tiempos:
+    - un nivel de mayor prioridad reemplaza al que suena en el acto (escalar); uno menor
+      recién cuando el actual lleva `min_hold` s sonando;
+    - stop espera `stop_grace` s: si la alerta vuelve antes, sigue sonando sin cortes;
+    - los beeps respetan `beep_cooldown` y se descartan mientras suena una alerta.
+    El backend (PygameAudio/NullAudio) lo crea la fábrica dentro del hilo.
+    """
+    def __init__(self, backend_factory, patterns: Dict[str, AlertPattern] = None, min_hold: float = 2.0,
+                 stop_grace: float = 0.3, beep_cooldown: float = 1.0, clock=time.monotonic):
+        self._factory = backend_factory
+        self.patterns = dict(patterns or DEFAULT_ALERT_PATTERNS)
+        self.min_hold = min_hold
+        self.stop_grace = stop_grace
+        self.beep_cooldown = beep_cooldown
+        self.clock = clock
+        self.backend = None
+        self.init_ms = None
+        self.level = None               # nivel que suena
+        self._wanted = None             # nivel pedido por el detector
+        self._level_since = 0.0
+        self._stop_since = None
+        self._last_beep = -math.inf
+        self._timers = []               # heap de vencimientos en los que hay que re-evaluar
+        self._inbox = queue.SimpleQueue()
+        self._ready = threading.Event()
+        self._thread = None
+        self.stats = {"inicios": 0, "escaladas": 0, "bajadas": 0, "paradas": 0,
+                      "paradas_canceladas": 0, "beeps": 0, "beeps_descartados": 0}
+
+    # ---- API (no bloqueante) ----
+    def start(self) -> "AlertScheduler":
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="alertas", daemon=True)
+            self._thread.start()
+        return self
+
+    def start_alert(self, level: str):
+        self._inbox.put(("alerta", level))
+
+    def stop_alert(self):
+        self._inbox.put(("alerta", None))
+
+    def beep(self, frequency: float = BEEP_TONE[0], duration: float = BEEP_TONE[1]):
+        self._inbox.put(("beep", (frequency, duration)))
+
+    def wait_ready(self, timeout: float = 5.0) -> bool:
+        return self._ready.wait(timeout)
+
+    def close(self, timeout: float = 2.0):
+        if self._thread is not None:
+            self._inbox.put(("cerrar", None))
+            self._thread.join(timeout=timeout)
+
+    # ---- Hilo de audio ----
+    def _run(self):
+        t0 = time.perf_counter()
+        self.backend = self._factory()
+        self.init_ms = (time.perf_counter() - t0) * 1000
+        self._ready.set()
+        while True:
+            timeout = max(0.0, self._timers[0] - self.clock()) if self._timers else None
+            try:
+                cmd, arg = self._inbox.get(timeout=timeout)
+            except queue.Empty:
+                cmd = None
+            if cmd == "cerrar":
+                break
+            if cmd == "alerta":
+                if arg is not None and arg == self.level and self._stop_since is not None:
+                    self.stats["paradas_canceladas"] += 1
+                self._wanted = arg
+            elif cmd == "beep":
+                self._beep(*arg)
+            now = self.clock()
+            while self._timers and self._timers[0] <= now:
+                heapq.heappop(self._timers)
+            self._reconcile(now)
+        if self.level is not None:
+            self.backend.stop_alert()
+        self.backend.close()
+
+    def _reconcile(self, now: float):
+        wanted, current = self._wanted, self.level
+        if wanted == current:
+            self._stop_since = None
+            return
+        if wanted is None:
+            if self._stop_since is None:
+                self._stop_since = now
+            due = self._stop_since + self.stop_grace
+            if now < due:
+                heapq.heappush(self._timers, due)
+                return
+            self.backend.stop_alert()
+            self.level = None
+            self._stop_since = None
+            self.stats["paradas"] += 1
+            return
+        self._stop_since = None
+        if current is not None and ALERT_PRIORITY.get(wanted, 0) <= ALERT_PRIORITY.get(current, 0):
+            due = self._level_since + self.min_hold
+            if now < due:
+                heapq.heappush(self._timers, due)
+                return
+            self.stats["bajadas"] += 1
+        else:
+            self.stats["inicios" if current is None else "escaladas"] += 1
+        pattern = self.patterns.get(wanted) or next(iter(self.patterns.values()))
+        self.backend.start_alert(pattern)
+        self.level = wanted
+        self._level_since = now
+
+    def _beep(self, frequency: float, duration: float):
+        now = self.clock()
+        if self.level is not None or now - self._last_beep < self.beep_cooldown:
+            self.stats["beeps_descartados"] += 1
+            return
+        self._last_beep = now
+        self.backend.beep(frequency, duration)
+        self.stats["beeps"] += 1
+
+# -----------------------
+# Índices de landmarks y conversión a arreglo
+# -----------------------
+NUM_LANDMARKS = 478                                    # 468 + 10 de iris (refine_landmarks)
+LEFT_EYE_IDX = np.array([362, 385, 387, 263, 373, 380])
+RIGHT_EYE_IDX = np.array([33, 160, 158, 133, 153, 144])
+EYES_IDX = np.stack([LEFT_EYE_IDX, RIGHT_EYE_IDX])     # (2, 6)
+MOUTH_IDX = np.array([61, 291, 13, 14])                # izq, der, arriba, abajo
+HEAD_POSE_IDX = np.array([1, 33, 362, 61, 291])        # nariz, ojos, comisuras
+NOD_IDX = np.array([10, 152, 1])                       # frente, barbilla, nariz
+# Landmarks que realmente usa la lógica (~20 de 478)
+METRIC_IDX = np.unique(np.concatenate([EYES_IDX.ravel(), MOUTH_IDX, HEAD_POSE_IDX, NOD_IDX]))
+# Filas que leen EAR, boca y pose en una sola indexación: 6 + 6 del ojo (p0..p5), 4 de la boca
+# (izq, der, arriba, abajo) y nariz/ojos de la pose (las comisuras ya están en la boca)
+_FACE_IDX = np.concatenate([LEFT_EYE_IDX, RIGHT_EYE_IDX, MOUTH_IDX, HEAD_POSE_IDX[:3]])
+_METRIC_IDX_LIST = METRIC_IDX.tolist()
+
+
+def landmarks_to_array(face_landmarks, out: np.ndarray, indices=_METRIC_IDX_LIST) -> np.ndarray:
+    """
+    Copia los landmarks de MediaPipe al arreglo preasignado `out` float32, leyendo cada
+    landmark una sola vez. Por defecto solo copia los de METRIC_IDX; con indices=None copia
+    todos. Si `out` tiene una fila por índice (len(indices), 3) las filas van en el orden de
+    `indices` (lo que retorna LandmarkBackend.detect); si es (478, 3) conservan el índice
+    original de MediaPipe y las demás filas quedan como estaban.
+    """
+    lms = face_landmarks.landmark
+    if indices is None:
+        n = min(len(lms), out.shape[0])
+        out[:n] = [(lm.x, lm.y, lm.z) for lm in lms[:n]]
+        return out
+    rows = [(lm.x, lm.y, lm.z) for lm in [lms[i] for i in indices]]
+    if out.shape[0] == len(indices):
+        out[:] = rows
+    else:
+        out[indices] = rows
+    return out
+
+# -----------------------
+# Modelos de landmarks intercambiables
+# -----------------------
+# "mediapipe" (478 con iris), "mediapipe_sin_iris" (468), "lbf:<modelo.yaml>" y "onnx:<modelo.onnx>" (ver modelos.py)
+LANDMARK_BACKENDS = ("mediapipe", "mediapipe_sin_iris", "lbf", "onnx")
+
+
+class LandmarkBackend(ABC):
+    """
+    Interfaz de un modelo de landmarks. detect(rgb) retorna un arreglo (len(METRIC_IDX), 3)
+    float32 con solo los landmarks que usa la lógica, en el orden de METRIC_IDX y normalizados
+    a la imagen recibida (z = 0 si el modelo no la estima), o None si no hay rostro.
+    Los modelos con malla completa la dejan en `mesh` (solo se usa para dibujarla).
+    """
+    name = "base"
+    has_mesh = False
+
+    def __init__(self):
+        self.mesh = None
+        self._out = np.zeros((len(METRIC_IDX), 3), np.float32)
+
+    @abstractmethod
+    def detect(self, rgb: np.ndarray) -> Optional[np.ndarray]:
+        ...
+
+    def close(self):
+        pass
+
+
+class MediaPipeBackend(LandmarkBackend):
+    """FaceMesh de MediaPipe; sin `refine` no corre la etapa de iris (468 landmarks, más barato)."""
+    has_mesh = True
+
+    def __init__(self, refine: bool = True, face_mesh=None, min_detection_confidence: float = 0.7,
+                 min_tracking_confidence: float = 0.5):
+        super().__init__()
+        self.name = "mediapipe" if refine else "mediapipe_sin_iris"
+        if face_mesh is None:
+            face_mesh = mp.solutions.face_mesh.FaceMesh(
+                max_num_faces=1,
+                refine_landmarks=refine,
+                min_detection_confidence=min_detection_confidence,
+                min_tracking_confidence=min_tracking_confidence
+            )
+        self.face_mesh = face_mesh
+
+    def detect(self, rgb):
+        faces = self.face_mesh.process(rgb).multi_face_landmarks
+        if not faces:
+            self.mesh = None
+            return None
+        self.mesh = faces[-1]
+        return landmarks_to_array(self.mesh, self._out)
+
+    def close(self):
+        close = getattr(self.face_mesh, "close", None)
+        if close is not None:
+            close()
+
+
+def make_landmark_backend(spec: str) -> LandmarkBackend:
+    """'mediapipe', 'mediapipe_sin_iris', 'lbf:<modelo.yaml>' u 'onnx:<modelo.onnx>'."""
+    kind, _, path = spec.partition(":")
+    if kind not in LANDMARK_BACKENDS:
+        raise ValueError(f"modelo de landmarks debe ser uno de {LANDMARK_BACKENDS}")
+    if kind in ("mediapipe", "mediapipe_sin_iris"):
+        return MediaPipeBackend(refine=kind == "mediapipe")
+    if not path:
+        raise ValueError(f"'{kind}' necesita la ruta del modelo: {kind}:<archivo>")
+    import modelos
+    return modelos.FacemarkLbfBackend(path) if kind == "lbf" else modelos.OnnxLandmarkBackend(path)
+
+# -----------------------
+# Niveles de dibujo y capa de overlays
+# -----------------------
+# De menor a mayor costo: nada, solo HUD, HUD + ojos/cabeza, todo + malla facial completa
+RENDER_LEVELS = ("ninguno", "hud", "ojos_cabeza", "malla")
+
+
+def display_available() -> bool:
+    """En Linux sin DISPLAY/WAYLAND_DISPLAY no hay dónde mostrar: no se dibuja nada."""
+    if sys.platform.startswith("linux"):
+        return bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+    return True
+
+
+class OverlayLayer:
+    """
+    Capa de dibujo reutilizable del tamaño del frame. Se dibuja en ella y luego se compone
+    sobre el frame en un solo paso (solo los píxeles dibujados). Los buffers se asignan una
+    vez; limpieza y composición se limitan al rectángulo marcado con mark().
+    """
+    def __init__(self):
+        self.image = None
+        self._gray = None
+        self._mask = None
+        self._dirty = None      # (x0, y0, x1, y1) de lo dibujado desde begin()
+
+    def begin(self, shape) -> np.ndarray:
+        if self.image is None or self.image.shape != shape:
+            self.image = np.zeros(shape, np.uint8)
+            self._gray = np.zeros(shape[:2], np.uint8)
+            self._mask = np.zeros(shape[:2], np.uint8)
+        elif self._dirty is not None:
+            x0, y0, x1, y1 = self._dirty
+            self.image[y0:y1, x0:x1] = 0
+        self._dirty = None
+        return self.image
+
+    def mark(self, x0: int, y0: int, x1: int, y1: int):
+        h, w = self.image.shape[:2]
+        x0, y0, x1, y1 = max(0, int(x0)), max(0, int(y0)), min(w, int(x1)), min(h, int(y1))
+        if x1 <= x0 or y1 <= y0:
+            return
+        if self._dirty is not None:
+            dx0, dy0, dx1, dy1 = self._dirty
+            x0, y0, x1, y1 = min(x0, dx0), min(y0, dy0), max(x1, dx1), max(y1, dy1)
+        self._dirty = (x0, y0, x1, y1)
+
+    def composite(self, frame) -> np.ndarray:
+        if self._dirty is None:
+            return frame
+        x0, y0, x1, y1 = self._dirty
+        src = self.image[y0:y1, x0:x1]
+        gray = self._gray[y0:y1, x0:x1]
+        mask = self._mask[y0:y1, x0:x1]
+        cv2.cvtColor(src, cv2.COLOR_BGR2GRAY, dst=gray)
+        cv2.threshold(gray, 0, 255, cv2.THRESH_BINARY, dst=mask)
+        cv2.copyTo(src, mask, frame[y0:y1, x0:x1])
+        return frame
+
+# -----------------------
+# Tasa de inferencia adaptativa
+# -----------------------
+class AdaptiveScheduler:
+    """
+    Decide qué frames pasan por FaceMesh. Con el conductor estable (EAR lejos del umbral,
+    boca cerrada, cabeza quieta) durante `stable_time` s, infiere 1 de cada max_skip + 1
+    frames. Vuelve a tasa completa apenas el EAR o la boca se acercan a su umbral, la cabeza
+    se mueve, se pierde el rostro o hay un parpadeo/bostezo/cabeceo/alerta en curso.
+    El cierre de ojos que arranca en un frame saltado se ve recién en la próxima inferencia:
+    con max_skip=1 el parpadeo se corre a lo sumo un frame; con más, uno corto puede perderse.
+    """
+    def __init__(self, max_skip: int = 1, stable_time: float = 2.0, ear_margin: float = 0.06,
+                 yawn_margin: float = 0.2, motion_threshold: float = 0.01):
+        self.max_skip = max_skip
+        self.stable_time = stable_time
+        self.ear_margin = ear_margin
+        self.yawn_margin = yawn_margin
+        self.motion_threshold = motion_threshold
+        self.skip = 0                   # frames a saltar entre inferencias (0 = tasa completa)
+        self._pending = 0
+        self._stable_since = None
+        self._prev_head = None
+        self.inferred = 0
+        self.skipped = 0
+
+    def should_infer(self) -> bool:
+        if self._pending > 0:
+            self._pending -= 1
+            self.skipped += 1
+            return False
+        self._pending = self.skip
+        self.inferred += 1
+        return True
+
+    def update(self, now: float, metrics: "DrowsinessMetrics", pts: Optional[np.ndarray],
+               ear_threshold: float, yawn_threshold: float, busy: bool):
+        motion = 0.0
+        if pts is not None:
+            head = pts[HEAD_POSE_IDX, :2]
+            if self._prev_head is not None:
+                motion = float(np.abs(head - self._prev_head).max())
+            self._prev_head = head.copy()
+        else:
+            self._prev_head = None
+
+        avg_ear = (metrics.ear_left + metrics.ear_right) / 2.0
+        near = (busy or pts is None
+                or avg_ear < ear_threshold + self.ear_margin
+                or metrics.mouth_open_ratio > yawn_threshold - self.yawn_margin
+                or motion > self.motion_threshold)
+        if near:
+            self._stable_since = None
+            self.skip = self._pending = 0
+        elif self._stable_since is None:
+            self._stable_since = now
+        elif now - self._stable_since >= self.stable_time:
+            self.skip = self.max_skip
+
+    def stats(self) -> Dict[str, float]:
+        total = self.inferred + self.skipped
+        return {"inferidos": self.inferred, "saltados": self.skipped,
+                "saltados_pct": round(100.0 * self.skipped / total, 1) if total else 0.0}
+
+# -----------------------
+# Métricas de ventana deslizante
+# -----------------------
+BLINK_HIST_EDGES = (0.1, 0.2, 0.3, 0.4, 0.6, 1.0)    # s; el último bin es > 1.0 s
+ALERT_LEVELS = ("SOMNOLIENTO", "MICROSUEÑO")
+
+
+class SlidingWindowScorer:
+    """
+    PERCLOS, tasas de parpadeo/bostezo/cabeceo e histograma de duración de parpadeos
+    sobre los últimos `window` s. La ventana es un anillo de `bins` intervalos con sus
+    sumas más una suma corriente: sumar un frame y expirar un intervalo son O(1) y la
+    memoria no crece con la duración del viaje.
+    El puntaje de fatiga (0..1) combina PERCLOS, fracción de parpadeos largos y las
+    tasas de bostezos y cabeceos, cada uno normalizado por su valor de referencia.
+    """
+    CLOSED, OBSERVED, BLINKS, YAWNS, NODS, BLINK_TIME, HIST = range(7)
+    EVENT_COLS = {"bostezo": YAWNS, "cabeceo": NODS}
+
+    def __init__(self, window: float = 60.0, bins: int = 60, max_gap: float = 0.5,
+                 min_observed: float = 10.0, perclos_ref: float = 0.15, long_blink: float = 0.4,
+                 yawn_ref: float = 3.0, nod_ref: float = 3.0,
+                 weights: Tuple[float, float, float, float] = (0.5, 0.2, 0.15, 0.15)):
+        self.window = window
+        self.bins = bins
+        self.bin_width = window / bins
+        self.max_gap = max_gap              # huecos más largos (sin frames) no suman tiempo
+        self.min_observed = min_observed    # PERCLOS no pesa hasta tener esta cantidad de datos
+        self.perclos_ref = perclos_ref
+        self.yawn_ref = yawn_ref
+        self.nod_ref = nod_ref
+        self.weights = weights
+        ncols = self.HIST + len(BLINK_HIST_EDGES) + 1
+        self._ring = np.zeros((bins, ncols))
+        self._sums = np.zeros(ncols)
+        # bins del histograma cuyo límite inferior es >= long_blink
+        self._long_from = self.HIST + int(np.searchsorted(BLINK_HIST_EDGES, long_blink)) + 1
+        self._bin_id = None
+        self._last_t = None
+        self._last_closed = None
+
+    def _advance(self, now: float):
+        bin_id = int(now // self.bin_width)
+        if self._bin_id is None:
+            self._bin_id = bin_id
+            return
+        # expirar los intervalos que salen de la ventana (como máximo el anillo entero)
+        for k in range(1, min(bin_id - self._bin_id, self.bins) + 1):
+            row = self._ring[(self._bin_id + k) % self.bins]
+            self._sums -= row
+            row[:] = 0.0
+        if bin_id > self._bin_id:
+            self._bin_id = bin_id
+
+    def _add(self, col: int, value: float = 1.0):
+        self._ring[self._bin_id % self.bins, col] += value
+        self._sums[col] += value
+
+    def update(self, now: float, closed: Optional[bool]):
+        """Un frame analizado; closed=None si no hay rostro (ese tiempo no cuenta para PERCLOS)."""
+        self._advance(now)
+        if self._last_closed is not None:
+            dt = min(now - self._last_t, self.max_gap)
+            if dt > 0:
+                self._add(self.OBSERVED, dt)
+                if self._last_closed:
+                    self._add(self.CLOSED, dt)
+        self._last_t = now
+        self._last_closed = closed
+
+    def add_blink(self, duration: float):
+        if self._bin_id is None:
+            return
+        self._add(self.BLINKS)
+        self._add(self.BLINK_TIME, duration)
+        self._add(self.HIST + int(np.searchsorted(BLINK_HIST_EDGES, duration, side="right")))
+
+    def add_event(self, tipo: str):
+        if self._bin_id is not None and tipo in self.EVENT_COLS:
+            self._add(self.EVENT_COLS[tipo])
+
+    def write_to(self, m: "DrowsinessMetrics"):
+        s = self._sums.tolist()
+        per_min = 60.0 / self.window
+        observed = s[self.OBSERVED]
+        blinks = s[self.BLINKS]
+        m.perclos = max(s[self.CLOSED], 0.0) / observed if observed > 0 else 0.0
+        m.blink_rate = blinks * per_min
+        m.yawn_rate = s[self.YAWNS] * per_min
+        m.nod_rate = s[self.NODS] * per_min
+        m.mean_blink_duration = s[self.BLINK_TIME] / blinks if blinks > 0 else 0.0
+        m.blink_duration_hist = tuple(round(c) for c in s[self.HIST:])
+        long_frac = sum(s[self._long_from:]) / blinks if blinks > 0 else 0.0
+        perclos = m.perclos if observed >= self.min_observed else 0.0
+        w_perclos, w_long, w_yawn, w_nod = self.weights
+        m.fatigue_score = (w_perclos * min(perclos / self.perclos_ref, 1.0)
+                           + w_long * long_frac
+                           + w_yawn * min(m.yawn_rate / self.yawn_ref, 1.0)
+                           + w_nod * min(m.nod_rate / self.nod_ref, 1.0))
+
+# -----------------------
+# Perfiles de calibración por conductor
+# -----------------------
+CALIBRATION_FRAMES = 30         # frames con rostro para la línea base sin perfil guardado
+PROFILE_VERSION = 1
+PROFILE_CHECK_FRAMES = 30       # frames con rostro para verificar un perfil cargado
+PROFILE_MAX_Z = 3.0             # desvío máximo (en desviaciones estándar del perfil) de la mediana
+PROFILE_MIN_STD = 0.05          # piso de la desviación, como fracción de la media guardada
+
+
+class RunningStats:
+    """
+    Media y varianza en línea (Welford, en forma de varianza poblacional). Al llegar a
+    max_count deja de crecer n: las muestras viejas pierden peso y el perfil sigue
+    adaptándose (media móvil exponencial con alpha = 1/max_count).
+    """
+    __slots__ = ("n", "mean", "var", "max_count")
+
+    def __init__(self, n: int = 0, mean: float = 0.0, var: float = 0.0, max_count: int = 5000):
+        self.n = n
+        self.mean = mean
+        self.var = var
+        self.max_count = max_count
+
+    def add(self, x: float):
+        if self.n < self.max_count:
+            self.n += 1
+        a = 1.0 / self.n
+        d = x - self.mean
+        self.mean += a * d
+        self.var = (1.0 - a) * (self.var + a * d * d)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.var)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"n": self.n, "media": self.mean, "var": self.var}
+
+    @classmethod
+    def from_dict(cls, d: Dict, max_count: int = 5000) -> "RunningStats":
+        return cls(int(d["n"]), float(d["media"]), float(d["var"]), max_count)
+
+
+class CalibrationProfile:
+    """
+    Línea base de un conductor en una cámara: geometría de la cabeza (frente-barbilla y nariz
+    relativa, para cabeceos) y EAR personal con ojos abiertos y en el mínimo de cada parpadeo.
+    """
+    STATS = ("y_diff", "nose_y", "ear_open", "ear_closed")
+
+    def __init__(self, driver_id: str, revision: int = 0, updated: str = None, stats: Dict = None,
+                 camera_id: str = None):
+        self.driver_id = driver_id
+        self.camera_id = camera_id
+        self.revision = revision
+        self.updated = updated
+        self.stats = {k: RunningStats() for k in self.STATS}
+        self.stats.update(stats or {})
+
+    @property
+    def key(self) -> str:
+        return profile_key(self.driver_id, self.camera_id)
+
+    @property
+    def head_ready(self) -> bool:
+        return self.stats["y_diff"].n >= CALIBRATION_FRAMES
+
+    @property
+    def ear_ready(self) -> bool:
+        return self.stats["ear_open"].n >= 10 * CALIBRATION_FRAMES and self.stats["ear_closed"].n >= 5
+
+    def ear_threshold(self, fraction: float = 0.4) -> float:
+        """Umbral personal: `fraction` del camino entre el EAR cerrado y el abierto."""
+        closed, opened = self.stats["ear_closed"].mean, self.stats["ear_open"].mean
+        return closed + fraction * (opened - closed)
+
+    def to_dict(self) -> Dict:
+        return {"version": PROFILE_VERSION, "revision": self.revision, "actualizado": self.updated,
+                **{k: st.to_dict() for k, st in self.stats.items()}}
+
+    @classmethod
+    def from_dict(cls, driver_id: str, d: Dict, camera_id: str = None) -> "CalibrationProfile":
+        return cls(driver_id, int(d.get("revision", 0)), d.get("actualizado"),
+                   {k: RunningStats.from_dict(d[k]) for k in cls.STATS if k in d}, camera_id)
+
+
+def profile_key(driver_id: str, camera_id: str = None) -> str:
+    """Clave del perfil: la geometría depende de la cámara, así que va 'conductor@cámara'."""
+    return f"{driver_id}@{camera_id}" if camera_id else driver_id
+
+
+class CalibrationStore:
+    """
+    Perfiles de todos los conductores en un JSON local. Cada guardado sube la revisión del
+    perfil y reemplaza el archivo de forma atómica (archivo temporal propio de cada guardado,
+    así varios procesos pueden guardar a la vez); perfiles de otra versión se ignoran.
+    """
+    def __init__(self, path: str = "calibracion_conductores.json"):
+        self.path = path
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Perfiles de calibración ilegibles ({self.path}): {e}")
+            return {}
+
+    def load(self, driver_id: str, camera_id: str = None) -> Optional[CalibrationProfile]:
+        d = self._read().get(profile_key(driver_id, camera_id))
+        if not d or d.get("version") != PROFILE_VERSION:
+            return None
+        return CalibrationProfile.from_dict(driver_id, d, camera_id)
+
+    def save(self, profile: CalibrationProfile):
+        data = self._read()
+        profile.revision += 1
+        profile.updated = datetime.now().isoformat(timespec="seconds")
+        data[profile.key] = profile.to_dict()
+        folder, name = os.path.split(os.path.abspath(self.path))
+        with tempfile.NamedTemporaryFile("w", encoding="utf-8", dir=folder, prefix=name + ".",
+                                         suffix=".tmp", delete=False) as f:
+            json.dump(data, f, indent=1, ensure_ascii=False)
+        try:
+            os.replace(f.name, self.path)
+        except OSError:
+            os.remove(f.name)
+            raise
+
+# -----------------------
+# Filtros de señal (EAR, boca, pose)
+# -----------------------
+class SignalFilter:
+    """Sin filtrado. Interfaz común: __call__(t, x) -> x filtrado; reset() al perder el rostro."""
+    def reset(self):
+        pass
+
+    def __call__(self, t: float, x: float) -> float:
+        return x
+
+
+class EmaFilter(SignalFilter):
+    """Media móvil exponencial; alpha alto = menos retardo, más ruido."""
+    def __init__(self, alpha: float = 0.5):
+        self.alpha = alpha
+        self._y = None
+
+    def reset(self):
+        self._y = None
+
+    def __call__(self, t: float, x: float) -> float:
+        if self._y is None:
+            self._y = x
+        else:
+            self._y += self.alpha * (x - self._y)
+        return self._y
+
+
+class OneEuroFilter(SignalFilter):
+    """
+    Filtro One-Euro (Casiez et al., 2012): pasa-bajos cuyo corte sube con la velocidad
+    de la señal. Quieta => corte min_cutoff (quita el temblor de los landmarks); en un
+    cambio rápido (parpadeo) el corte sube con beta y casi no agrega retardo.
+    """
+    def __init__(self, min_cutoff: float = 1.0, beta: float = 0.0, d_cutoff: float = 1.0):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self._x = None
+        self._dx = 0.0
+        self._t = 0.0
+
+    @staticmethod
+    def _alpha(cutoff: float, dt: float) -> float:
+        tau = 1.0 / (2.0 * math.pi * cutoff)
+        return 1.0 / (1.0 + tau / dt)
+
+    def __call__(self, t: float, x: float) -> float:
+        if self._x is None:
+            self._x, self._t = x, t
+            return x
+        dt = t - self._t
+        if dt <= 0:
+            return self._x
+        self._t = t
+        dx = (x - self._x) / dt
+        self._dx += self._alpha(self.d_cutoff, dt) * (dx - self._dx)
+        cutoff = self.min_cutoff + self.beta * abs(self._dx)
+        self._x += self._alpha(cutoff, dt) * (x - self._x)
+        return self._x
+
+
+SIGNAL_FILTERS = ("ninguno", "ema", "one_euro")
+# Parámetros por señal, en las unidades de cada una (EAR y boca ~0..1, pose en grados/x100)
+FILTER_PARAMS = {
+    "ema": {"ear": {"alpha": 0.6}, "mouth": {"alpha": 0.4}, "pose": {"alpha": 0.3}, "nod": {"alpha": 0.4}},
+    "one_euro": {"ear": {"min_cutoff": 1.5, "beta": 4.0}, "mouth": {"min_cutoff": 1.0, "beta": 1.0},
+                 "pose": {"min_cutoff": 0.5, "beta": 0.05}, "nod": {"min_cutoff": 1.0, "beta": 1.0}},
+}
+
+
+def make_signal_filter(kind: str, signal: str) -> SignalFilter:
+    if kind not in SIGNAL_FILTERS:
+        raise ValueError(f"signal_filter debe ser uno de {SIGNAL_FILTERS}")
+    if kind == "ema":
+        return EmaFilter(**FILTER_PARAMS["ema"][signal])
+    if kind == "one_euro":
+        return OneEuroFilter(**FILTER_PARAMS["one_euro"][signal])
+    return SignalFilter()
+
 # -----------------------
 # Detector principal
 # -----------------------
@@ -57,31 +1301,117 @@ class DrowsinessDetector:
                  ear_threshold: float = 0.25,
                  drowsy_time_threshold: float = 1.5,
                  microsleep_threshold: float = 3.0,
-                 yawn_threshold: float = 0.60):
-        # MediaPipe
-        self.mp_face_mesh = mp.solutions.face_mesh
-        self.mp_drawing = mp.solutions.drawing_utils
-        self.mp_drawing_styles = mp.solutions.drawing_styles
-        self.face_mesh = self.mp_face_mesh.FaceMesh(
-            max_num_faces=1,
-            refine_landmarks=True,
-            min_detection_confidence=0.7,
-            min_tracking_confidence=0.5
-        )
+                 yawn_threshold: float = 0.60,
+                 event_writer: EventWriter = None,
+                 alert_patterns: Dict[str, "AlertPattern"] = None,
+                 refine_landmarks: bool = True,
+                 clock=time.time,
+                 render_level: str = "malla",
+                 roi_tracking: bool = False,
+                 roi_padding: float = 0.35,
+                 roi_max_side: int = 320,
+                 adaptive_rate: bool = False,
+                 adaptive_max_skip: int = 1,
+                 face_mesh=None,
+                 landmark_backend=None,
+                 audio=None,
+                 trip_label: str = None,
+                 window_seconds: float = 60.0,
+                 fatigue_threshold: float = 0.6,
+                 signal_filter: str = "one_euro",
+                 ear_hysteresis: float = 0.02,
+                 yawn_hysteresis: float = 0.08,
+                 nod_threshold: float = 0.3,
+                 nose_nod_threshold: float = 0.5,
+                 nod_hysteresis: float = 0.1,
+                 recorder=None,
+                 driver_id: str = None,
+                 camera_id: str = None,
+                 calibration_store: "CalibrationStore" = None,
+                 personal_ear: bool = True,
+                 hot_stats: HotPathStats = None):
+        """
+        Recursos inyectables y diferidos: `event_writer` (sumidero de eventos), `audio`
+        (PygameAudio/NullAudio) y el modelo de landmarks: `landmark_backend` (un LandmarkBackend
+        o su nombre, ver make_landmark_backend) o `face_mesh` (cualquier objeto con .process(rgb)).
+        Si no se pasan, se crean en el primer uso; warm_up() los crea por adelantado.
+        `recorder` (trazas.TraceWriter) graba los landmarks de cada frame inferido.
+        Con `driver_id`, la calibración se carga de `calibration_store` (por defecto
+        CalibrationStore()) bajo la clave conductor@`camera_id`, se verifica con los primeros
+        frames y se refina y guarda al cerrar.
+        """
+        # Arranque en frío: tiempos de carga de cada recurso
+        self.startup_times: Dict[str, float] = {}
+        # Histogramas por etapa y contadores (exportables con perfilador.MetricsServer)
+        self.hot = hot_stats if hot_stats is not None else HotPathStats()
+
+        # Reloj inyectable: el modo offline usa el tiempo del video en vez del de pared
+        self.clock = clock
+
+        # Dibujo
+        if render_level not in RENDER_LEVELS:
+            raise ValueError(f"render_level debe ser uno de {RENDER_LEVELS}")
+        self.render_level = render_level
+        self.overlay = OverlayLayer()
+
+        # ROI: inferir sobre el recorte del rostro del frame anterior
+        self.roi_tracking = roi_tracking
+        self.roi_padding = roi_padding
+        self.roi_max_side = roi_max_side
+        self._roi_box = None
+        self.roi_stats = {"roi": 0, "completo": 0, "perdidas": 0}
+
+        # Tasa de inferencia adaptativa
+        self.scheduler = AdaptiveScheduler(max_skip=adaptive_max_skip) if adaptive_rate else None
+        self._last_detection = None
+
+        # Modelo de landmarks (MediaPipe FaceMesh por defecto, cargado en el primer frame)
+        self.refine_landmarks = refine_landmarks
+        if face_mesh is not None:
+            landmark_backend = MediaPipeBackend(refine_landmarks, face_mesh=face_mesh)
+        elif landmark_backend is None:
+            landmark_backend = "mediapipe" if refine_landmarks else "mediapipe_sin_iris"
+        self._landmark_spec = landmark_backend if isinstance(landmark_backend, str) else None
+        self._landmark_model = None if isinstance(landmark_backend, str) else landmark_backend
 
         # Landmarks
-        self.LEFT_EYE_LANDMARKS = [362, 385, 387, 263, 373, 380]
-        self.RIGHT_EYE_LANDMARKS = [33, 160, 158, 133, 153, 144]
-        self.MOUTH_OUTER = [61, 291, 13, 14]
+        self.LEFT_EYE_LANDMARKS = LEFT_EYE_IDX
+        self.RIGHT_EYE_LANDMARKS = RIGHT_EYE_IDX
+        self.MOUTH_OUTER = MOUTH_IDX
+        self._pts_buffer = np.zeros((NUM_LANDMARKS, 3), np.float32)  # se reutiliza cada frame
+        self.recorder = recorder
+        self._rgb_buffer = None                                        # destino de la conversión BGR->RGB
+        self.landmark_points = None                                    # arreglo del último frame con rostro
+        # Duración (s) de cada etapa del último frame
+        self.stage_times = {"conversion": 0.0, "inferencia": 0.0, "metricas": 0.0, "dibujo": 0.0}
 
         # Umbrales
         self.ear_threshold = ear_threshold
         self.drowsy_time_threshold = drowsy_time_threshold
         self.microsleep_threshold = microsleep_threshold
         self.yawn_threshold = yawn_threshold
+        self.fatigue_threshold = fatigue_threshold    # puntaje de ventana que dispara SOMNOLIENTO
+        # Histéresis: un parpadeo/bostezo empieza al cruzar el umbral y termina recién al
+        # cruzar el de salida, así el temblor alrededor del umbral no cuenta eventos extra
+        self.ear_exit_threshold = ear_threshold + ear_hysteresis
+        self.yawn_exit_threshold = yawn_threshold - yawn_hysteresis
+        # Cabeceo: caída relativa de frente-barbilla (nod) o de la nariz (nose_nod) respecto de la línea base
+        self.nod_threshold = nod_threshold
+        self.nose_nod_threshold = nose_nod_threshold
+        self.nod_exit_threshold = nod_threshold - nod_hysteresis
+        self.nose_nod_exit_threshold = nose_nod_threshold - nod_hysteresis
+
+        # Suavizado temporal de las señales antes de compararlas con los umbrales
+        self.signal_filter = signal_filter
+        self._ear_filter = make_signal_filter(signal_filter, "ear")
+        self._mouth_filter = make_signal_filter(signal_filter, "mouth")
+        self._pose_filters = {k: make_signal_filter(signal_filter, "pose") for k in ("pitch", "yaw", "roll")}
+        self._nod_filters = (make_signal_filter(signal_filter, "nod"), make_signal_filter(signal_filter, "nod"))
 
         # Estado
         self.metrics = DrowsinessMetrics()
+        self.window_seconds = window_seconds
+        self.window = SlidingWindowScorer(window_seconds)
         self.eye_closed_start_time = None
         self.is_blinking = False
         self.is_yawning = False
@@ -91,171 +1421,274 @@ class DrowsinessDetector:
         self._is_nodding = False    # estado actual temporal
         self.nod_debounce_time = 0.6  # tiempo mínimo entre detección y aceptación (s)
         self._last_nod_time = 0.0
+        self.head_ok = True         # último resultado de _check_head_nod_position (para dibujar)
 
-        # Calibración
+        # Calibración: perfil del conductor (persistente) o línea base de los primeros frames
+        self.driver_id = driver_id
+        if calibration_store is None and driver_id is not None:
+            calibration_store = CalibrationStore()
+        self.calibration_store = calibration_store
+        profile = (calibration_store.load(driver_id, camera_id)
+                   if calibration_store is not None and driver_id else None)
+        self.profile = profile or CalibrationProfile(driver_id or "", camera_id=camera_id)
+        self.personal_ear = personal_ear
         self.baseline_y_diff = None
         self.baseline_nose_y = None
         self.calibration_frames = 0
         self.is_calibrated = False
+        self._first_face_time = None
+        self._blink_min_ear = None
+        self._default_ear_thresholds = (self.ear_threshold, self.ear_exit_threshold)
+        self._profile_check = None      # geometría de los primeros frames mientras se verifica el perfil
+        if profile is not None:
+            self._apply_profile()
 
-        # Audio
-        self._init_audio_system()
-        self.alert_thread = None
-        self.stop_alert = threading.Event()
+        # Eventos -> DB (asíncrono), agrupados por viaje
+        self._event_writer = event_writer
+        self._event_writer_started = False
+        # cámara / conductor que origina el viaje (por defecto el conductor: reportes por conductor)
+        self.trip_label = trip_label if trip_label is not None else driver_id
+        self.session_id = uuid.uuid4().hex
+        self._session_open = False
+
+        # Audio: hilo de alertas propio; el backend se crea dentro de ese hilo
+        self.alert_patterns = dict(alert_patterns) if alert_patterns else dict(DEFAULT_ALERT_PATTERNS)
+        self._audio = audio
+        self._alerts = None
+        self._alert_level = None
         self.alert_active = False
 
-    # ---------------- Audio ----------------
-    def _init_audio_system(self):
-        try:
-            pygame.mixer.init(frequency=22050, size=-16, channels=2, buffer=512)
-            self.audio_available = True
-            print("✅ Audio inicializado")
-        except Exception as e:
-            print("⚠️ No se pudo inicializar pygame.mixer:", e)
-            self.audio_available = False
+    # ---------------- Recursos diferidos ----------------
+    @property
+    def landmark_model(self) -> LandmarkBackend:
+        if self._landmark_model is None:
+            t0 = time.perf_counter()
+            self._landmark_model = make_landmark_backend(self._landmark_spec)
+            self.startup_times["modelo_ms"] = (time.perf_counter() - t0) * 1000
+        return self._landmark_model
 
-    def _beep_once(self, frequency=1000, duration=0.3):
-        if not self.audio_available:
-            return
-        try:
-            sample_rate = 22050
-            frames = int(duration * sample_rate)
-            arr = np.zeros((frames, 2))
-            for i in range(frames):
-                wave = 0.35 * np.sin(2 * np.pi * frequency * i / sample_rate)
-                arr[i] = [wave, wave]
-            arr = (arr * 32767).astype(np.int16)
-            sound = pygame.sndarray.make_sound(arr)
-            sound.play()
-        except Exception:
-            pass
+    @property
+    def alerts(self) -> AlertScheduler:
+        if self._alerts is None:
+            injected, patterns = self._audio, self.alert_patterns
+            self._alerts = AlertScheduler(
+                lambda: injected if injected is not None else PygameAudio(patterns.values()), patterns).start()
+            st = self._alerts.stats
+            for name in ("inicios", "escaladas", "paradas", "beeps_descartados"):
+                self.hot.gauge(f"alertas_{name}", lambda name=name: st[name])
+        return self._alerts
+
+    @property
+    def audio(self):
+        """Backend de audio (espera a que el hilo de alertas lo cree)."""
+        alerts = self.alerts
+        alerts.wait_ready()
+        if alerts.init_ms is not None:
+            self.startup_times["audio_ms"] = alerts.init_ms
+        return alerts.backend
+
+    @property
+    def event_writer(self):
+        if self._event_writer is None:
+            self._event_writer = EventWriter(stats=self.hot)
+            writer = self._event_writer
+            self.hot.gauge("eventos_descartados", lambda: writer.dropped)
+            self.hot.gauge("eventos_en_diario", lambda: writer.journaled)
+        if not self._event_writer_started:
+            self._event_writer.start()
+            self._event_writer_started = True
+        return self._event_writer
 
-    def _play_alert_sound_loop_once(self):
-        if not self.audio_available:
+    def warm_up(self):
+        """Crea modelo, audio y escritor de eventos antes del primer frame."""
+        _ = self.landmark_model
+        _ = self.audio
+        _ = self.event_writer
+
+    def startup_report(self) -> Dict:
+        """Tiempos de arranque: imports (ms), carga de cada recurso (ms) y latencia al primer frame."""
+        if self._alerts is not None and self._alerts.init_ms is not None:
+            self.startup_times["audio_ms"] = self._alerts.init_ms
+        return {"import_ms": {k: round(v, 1) for k, v in IMPORT_TIMES_MS.items()},
+                **{k: round(v, 1) for k, v in self.startup_times.items()}}
+
+    # ---------------- Audio (comandos al hilo de alertas, no bloquean) ----------------
+    def _beep_once(self, frequency=BEEP_TONE[0], duration=BEEP_TONE[1]):
+        self.alerts.beep(frequency, duration)
+
+    def _start_alert_sequence(self, level: str = "SOMNOLIENTO"):
+        """Pide el patrón del nivel en bucle; el hilo de alertas decide si escala o espera."""
+        if self._alert_level == level:
             return
-        try:
-            duration = 0.5
-            sample_rate = 22050
-            frequency = 700
-            frames = int(duration * sample_rate)
-            arr = np.zeros((frames, 2))
-            for i in range(frames):
-                wave = 0.3 * np.sin(2 * np.pi * frequency * i / sample_rate)
-                arr[i] = [wave, wave]
-            arr = (arr * 32767).astype(np.int16)
-            sound = pygame.sndarray.make_sound(arr)
-            sound.play()
-        except Exception:
-            pass
+        self._alert_level = level
+        self.alerts.start_alert(level)
 
-    def _start_alert_sequence(self):
-        if self.alert_thread and self.alert_thread.is_alive():
+    def _stop_alert_sequence(self):
+        if self._alert_level is None:
             return
-        self.stop_alert.clear()
-        self.alert_thread = threading.Thread(target=self._alert_loop, daemon=True)
-        self.alert_thread.start()
+        self._alert_level = None
+        if self._alerts is not None:
+            self._alerts.stop_alert()
 
-    def _alert_loop(self):
-        while not self.stop_alert.is_set():
-            self._play_alert_sound_loop_once()
-            time.sleep(0.8)
+    # ---------------- Eventos ----------------
+    def _open_session(self):
+        self.event_writer.put((self.session_id, SESSION_START, datetime.now(), self.trip_label))
+        self._session_open = True
 
-    def _stop_alert_sequence(self):
-        self.stop_alert.set()
-        if self.alert_thread:
-            self.alert_thread.join(timeout=1.0)
+    def _close_session(self):
+        if self._session_open:
+            self.event_writer.put((self.session_id, SESSION_END, datetime.now(), None))
+            self._session_open = False
 
-    # ---------------- Cálculos ----------------
-    def _calculate_ear(self, eye_landmarks, landmarks):
-        try:
-            pts = []
-            for idx in eye_landmarks:
-                lm = landmarks.landmark[idx]
-                pts.append([lm.x, lm.y])
-            pts = np.array(pts)
-            v1 = np.linalg.norm(pts[1] - pts[5])
-            v2 = np.linalg.norm(pts[2] - pts[4])
-            h = np.linalg.norm(pts[0] - pts[3])
-            return (v1 + v2) / (2.0 * (h + 1e-8))
-        except Exception:
-            return 0.0
+    def _record_event(self, tipo: str):
+        self.hot.inc(f"eventos_{tipo}")
+        self.event_writer.put((self.session_id, tipo, datetime.now(), None))
 
-    def _calculate_mouth_ratio(self, landmarks):
+    # ---------------- Cálculos (una lectura de filas del arreglo de landmarks) ----------------
+    def _face_metrics(self, pts: np.ndarray) -> Tuple[Tuple[float, float], float, Dict[str, float]]:
+        """
+        EAR de ambos ojos, apertura de boca y pose de la cabeza desde una sola lectura de filas:
+        retorna ((ear_izq, ear_der), mouth_ratio, {"pitch", "yaw", "roll"}). Son ~20 puntos, así
+        que la aritmética va en floats de Python: operar en bloque con NumPy cuesta más por llamada.
+        """
         try:
-            left = landmarks.landmark[self.MOUTH_OUTER[0]]
-            right = landmarks.landmark[self.MOUTH_OUTER[1]]
-            top = landmarks.landmark[self.MOUTH_OUTER[2]]
-            bottom = landmarks.landmark[self.MOUTH_OUTER[3]]
-            horizontal = math.hypot(right.x - left.x, right.y - left.y)
-            vertical = math.hypot(bottom.x - top.x, bottom.y - top.y)
-            return vertical / (horizontal + 1e-6)
+            (l0, l1, l2, l3, l4, l5, r0, r1, r2, r3, r4, r5,
+             m_izq, m_der, m_arr, m_aba, nose, l_eye, r_eye) = pts[_FACE_IDX, :2].tolist()
+            hyp = math.hypot
+            ears = ((hyp(l1[0] - l5[0], l1[1] - l5[1]) + hyp(l2[0] - l4[0], l2[1] - l4[1]))
+                    / (2.0 * (hyp(l0[0] - l3[0], l0[1] - l3[1]) + 1e-8)),
+                    (hyp(r1[0] - r5[0], r1[1] - r5[1]) + hyp(r2[0] - r4[0], r2[1] - r4[1]))
+                    / (2.0 * (hyp(r0[0] - r3[0], r0[1] - r3[1]) + 1e-8)))
+            mouth = hyp(m_aba[0] - m_arr[0], m_aba[1] - m_arr[1]) / (hyp(m_der[0] - m_izq[0], m_der[1] - m_izq[1]) + 1e-6)
+            eye_center_x = (l_eye[0] + r_eye[0]) / 2
+            eye_center_y = (l_eye[1] + r_eye[1]) / 2
+            pose = {"pitch": (nose[1] - eye_center_y) * 100,
+                    "yaw": ((m_izq[0] + m_der[0]) / 2 - eye_center_x) * 100,
+                    "roll": math.degrees(math.atan2(r_eye[1] - l_eye[1], r_eye[0] - l_eye[0]))}
+            return ears, mouth, pose
         except Exception:
-            return 0.0
+            return (0.0, 0.0), 0.0, {"pitch": 0.0, "yaw": 0.0, "roll": 0.0}
 
-    def _detect_head_pose(self, landmarks) -> Dict[str, float]:
-        try:
-            nose_tip = landmarks.landmark[1]
-            left_eye = landmarks.landmark[33]
-            right_eye = landmarks.landmark[362]
-            left_mouth = landmarks.landmark[61]
-            right_mouth = landmarks.landmark[291]
-            eye_center_x = (left_eye.x + right_eye.x) / 2
-            mouth_center_x = (left_mouth.x + right_mouth.x) / 2
-            yaw = (mouth_center_x - eye_center_x) * 100
-            eye_center_y = (left_eye.y + right_eye.y) / 2
-            pitch = (nose_tip.y - eye_center_y) * 100
-            eye_angle = math.atan2(right_eye.y - left_eye.y, right_eye.x - left_eye.x)
-            roll = math.degrees(eye_angle)
-            return {"pitch": pitch, "yaw": yaw, "roll": roll}
-        except Exception:
-            return {"pitch": 0.0, "yaw": 0.0, "roll": 0.0}
+    @staticmethod
+    def _head_geometry(pts: np.ndarray) -> Tuple[float, float]:
+        """(distancia frente-barbilla, nariz relativa a frente) en Y normalizada."""
+        frente_y, barbilla_y, nariz_y = pts[NOD_IDX, 1].tolist()
+        return abs(frente_y - barbilla_y), nariz_y - frente_y
 
     # ---------------- Calibración y detección de cabeceo ----------------
-    def _calibrate_baseline(self, landmarks):
-        if self.is_calibrated:
-            return
-        frente = landmarks.landmark[10]
-        barbilla = landmarks.landmark[152]
-        nariz = landmarks.landmark[1]
-        y_diff = abs(frente.y - barbilla.y)
-        nose_y_relative = nariz.y - frente.y
-        if self.baseline_y_diff is None:
-            self.baseline_y_diff = y_diff
-            self.baseline_nose_y = nose_y_relative
-        else:
-            self.baseline_y_diff = (self.baseline_y_diff + y_diff) / 2
-            self.baseline_nose_y = (self.baseline_nose_y + nose_y_relative) / 2
-        self.calibration_frames += 1
-        if self.calibration_frames >= 30:
+    def _apply_profile(self):
+        """Línea base (y umbral de EAR personal) desde el perfil guardado: sin espera de calibración."""
+        st = self.profile.stats
+        head = self.profile.head_ready
+        ear = self.personal_ear and self.profile.ear_ready
+        if head:
+            self.baseline_y_diff = st["y_diff"].mean
+            self.baseline_nose_y = st["nose_y"].mean
+            self.calibration_frames = CALIBRATION_FRAMES
             self.is_calibrated = True
-            print("✅ Calibración completada")
+            self.startup_times["deteccion_valida_ms"] = 0.0
+            # referencia fija: el perfil se sigue refinando mientras se verifica
+            self._profile_ref = [(st[k].mean, max(st[k].std, PROFILE_MIN_STD * abs(st[k].mean)))
+                                 for k in ("y_diff", "nose_y")]
+            self._profile_check = []
+        if ear:
+            hysteresis = self.ear_exit_threshold - self.ear_threshold
+            self.ear_threshold = self.profile.ear_threshold()
+            self.ear_exit_threshold = self.ear_threshold + hysteresis
+        if head or ear:
+            print(f"✅ Perfil de calibración de '{self.profile.key}' cargado (rev. {self.profile.revision}, "
+                  f"EAR umbral {self.ear_threshold:.3f})")
+        else:
+            print(f"ℹ️ Perfil de calibración de '{self.profile.key}' incompleto: se calibra desde cero")
+
+    def _verify_profile(self, pts: np.ndarray):
+        """
+        Junta la geometría de los primeros PROFILE_CHECK_FRAMES frames y compara su mediana con
+        la línea base cargada (z contra la desviación guardada). Si no encaja (otra cámara u
+        otra posición del asiento) descarta el perfil y vuelve a la calibración inicial.
+        """
+        self._profile_check.append(self._head_geometry(pts))
+        if len(self._profile_check) < PROFILE_CHECK_FRAMES:
+            return
+        observed = np.median(np.asarray(self._profile_check), axis=0)
+        self._profile_check = None
+        z = max(abs(x - mean) / (std + 1e-9) for x, (mean, std) in zip(observed.tolist(), self._profile_ref))
+        if z <= PROFILE_MAX_Z:
+            return
+        print(f"⚠️ Perfil de '{self.profile.key}' no coincide con los primeros frames (z={z:.1f}): se recalibra")
+        self.profile = CalibrationProfile(self.profile.driver_id, self.profile.revision,
+                                          camera_id=self.profile.camera_id)
+        self.ear_threshold, self.ear_exit_threshold = self._default_ear_thresholds
+        self.baseline_y_diff = None
+        self.baseline_nose_y = None
+        self.calibration_frames = 0
+        self.is_calibrated = False
+        self._blink_min_ear = None
+
+    def _calibrate_baseline(self, pts: np.ndarray, nodding: bool = False):
+        """
+        Acumula la geometría de la cabeza en el perfil (media y varianza en línea). Antes de
+        calibrar, la línea base es la media de los frames vistos; después queda fija durante
+        el viaje (un conductor que se va hundiendo no la arrastra) y los frames sin cabeceo
+        solo refinan el perfil que guarda save_profile().
+        """
+        if nodding:
+            return
+        y_diff, nose_y_relative = self._head_geometry(pts)
+        st = self.profile.stats
+        st["y_diff"].add(y_diff)
+        st["nose_y"].add(nose_y_relative)
+        if not self.is_calibrated:
+            self.baseline_y_diff = st["y_diff"].mean
+            self.baseline_nose_y = st["nose_y"].mean
+            self.calibration_frames += 1
+            if self.calibration_frames >= CALIBRATION_FRAMES:
+                self.is_calibrated = True
+                elapsed = self.clock() - self._first_face_time
+                self.startup_times["deteccion_valida_ms"] = elapsed * 1000
+                print(f"✅ Calibración completada ({elapsed:.1f} s)")
+
+    def _update_ear_profile(self, avg_ear: float):
+        """EAR abierto en frames sin parpadeo; EAR cerrado = mínimo de cada parpadeo."""
+        if self.is_blinking:
+            if self._blink_min_ear is None or avg_ear < self._blink_min_ear:
+                self._blink_min_ear = avg_ear
+            return
+        if self._blink_min_ear is not None:
+            self.profile.stats["ear_closed"].add(self._blink_min_ear)
+            self._blink_min_ear = None
+        self.profile.stats["ear_open"].add(avg_ear)
+
+    def save_profile(self):
+        if self.calibration_store is not None and self.driver_id and self.profile.head_ready:
+            self.calibration_store.save(self.profile)
 
-    def _check_head_nod_position(self, landmarks) -> bool:
+    def _check_head_nod_position(self, pts: np.ndarray) -> bool:
         """
         Retorna True si la cabeza está en posición 'normal' (NO cabeceando).
         Actualiza contador de cabeceos solo cuando un cabeceo se completa (debounce).
         """
         try:
-            self._calibrate_baseline(landmarks)
+            if self._profile_check is not None:
+                self._verify_profile(pts)
             if not self.is_calibrated:
+                self._calibrate_baseline(pts)
                 return True
 
-            frente = landmarks.landmark[10]
-            barbilla = landmarks.landmark[152]
-            nariz = landmarks.landmark[1]
+            current_y_diff, current_nose_y = self._head_geometry(pts)
+            now_ts = self.clock()
 
-            current_y_diff = abs(frente.y - barbilla.y)
-            current_nose_y = nariz.y - frente.y
+            y_filter, nose_filter = self._nod_filters
+            y_diff_change = y_filter(now_ts, (self.baseline_y_diff - current_y_diff) / (self.baseline_y_diff + 1e-6))
+            nose_y_change = nose_filter(now_ts, (current_nose_y - self.baseline_nose_y) / (abs(self.baseline_nose_y) + 1e-6))
 
-            y_diff_change = (self.baseline_y_diff - current_y_diff) / (self.baseline_y_diff + 1e-6)
-            nose_y_change = (current_nose_y - self.baseline_nose_y) / (abs(self.baseline_nose_y) + 1e-6)
-
-            y_nod = y_diff_change > 0.3
-            nose_nod = nose_y_change > 0.5
-            is_nodding_now = y_nod or nose_nod
+            # Histéresis: el cabeceo empieza sobre el umbral y termina recién bajo el de salida
+            if self._is_nodding:
+                is_nodding_now = y_diff_change > self.nod_exit_threshold or nose_y_change > self.nose_nod_exit_threshold
+            else:
+                is_nodding_now = y_diff_change > self.nod_threshold or nose_y_change > self.nose_nod_threshold
 
             # Máquina de estados: contamos al terminar el cabeceo (was nodding -> now not nodding)
-            now_ts = time.time()
             if is_nodding_now:
                 # Registramos comienzo del cabeceo si antes no lo estaba
                 if not self._is_nodding:
@@ -272,235 +1705,754 @@ class DrowsinessDetector:
                         # beep en múltiplos de 3
                         if self.metrics.head_nods_count % 3 == 0:
                             self._beep_once()
-                        # INSERT DB al detectar un cabeceo completo
-                        try:
-                            if cursor is not None:
-                                sql = "INSERT INTO viaje (hora_viaje, parpadeo, cabeceos, bosteso) VALUES (%s, %s, %s, %s)"
-                                vals = (datetime.now(), self.metrics.blinks_count, self.metrics.head_nods_count, self.metrics.yawns_count)
-                                cursor.execute(sql, vals)
-                                conn.commit()
-                        except Exception as e:
-                            print("⚠️ Error insert DB (cabeceo):", e)
+                        self.window.add_event("cabeceo")
+                        # Encolar evento para la DB (no bloquea el frame)
+                        self._record_event("cabeceo")
                     # reset estado
                     self._is_nodding = False
 
             self._was_nodding = is_nodding_now
+            self._calibrate_baseline(pts, nodding=is_nodding_now or self._is_nodding)
             return not is_nodding_now
         except Exception:
             return True
 
     # ---------------- Dibujos ----------------
-    def _draw_eye_landmarks(self, frame, landmarks):
+    def _draw_eye_landmarks(self, frame, pts: np.ndarray):
         h, w = frame.shape[:2]
-        for eye_landmarks in [self.LEFT_EYE_LANDMARKS, self.RIGHT_EYE_LANDMARKS]:
-            pts = []
-            for idx in eye_landmarks:
-                lm = landmarks.landmark[idx]
-                x = int(lm.x * w); y = int(lm.y * h)
-                pts.append((x, y))
-                cv2.circle(frame, (x, y), 2, (0, 255, 0), -1)
-            pts = np.array(pts, np.int32)
-            cv2.polylines(frame, [pts], True, (255, 255, 0), 1)
-
-    def _draw_head_landmarks(self, frame, landmarks):
+        px = (pts[EYES_IDX, :2] * (w, h)).astype(np.int32)   # (2, 6, 2)
+        for x, y in px.reshape(-1, 2):
+            cv2.circle(frame, (int(x), int(y)), 2, (0, 255, 0), -1)
+        cv2.polylines(frame, list(px), True, (255, 255, 0), 1)
+
+    def _draw_head_landmarks(self, frame, pts: np.ndarray):
         h, w = frame.shape[:2]
         if not self.is_calibrated:
-            cv2.putText(frame, f"CALIBRANDO... {self.calibration_frames}/30",
+            cv2.putText(frame, f"CALIBRANDO... {self.calibration_frames}/{CALIBRATION_FRAMES}",
                         (w - 300, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-        head_ok = self._check_head_nod_position(landmarks)
+        head_ok = self.head_ok
         txt = "Cabeza OK" if head_ok else "CABECEO!"
         color = (0, 255, 0) if head_ok else (0, 0, 255)
         cv2.putText(frame, txt, (w - 220, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.8, color, 2)
 
-        for idx, color, label in [(1, (0, 255, 255), "Nariz"),
-                                  (152, (255, 0, 255), "Barbilla"),
-                                  (10, (255, 255, 0), "Frente")]:
-            lm = landmarks.landmark[idx]
-            x = int(lm.x * w); y = int(lm.y * h)
+        px = (pts[NOD_IDX, :2] * (w, h)).astype(np.int32)    # frente, barbilla, nariz
+        for (x, y), color, label in zip(px.tolist(),
+                                        [(255, 255, 0), (255, 0, 255), (0, 255, 255)],
+                                        ["Frente", "Barbilla", "Nariz"]):
             cv2.circle(frame, (x, y), 4, color, -1)
             cv2.putText(frame, label, (x - 20, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.4, color, 1)
 
     def _draw_full_face_mesh(self, frame, landmarks):
-        self.mp_drawing.draw_landmarks(
+        mp_drawing = mp.solutions.drawing_utils
+        mp_face_mesh = mp.solutions.face_mesh
+        mp_drawing.draw_landmarks(
             frame,
             landmarks,
-            self.mp_face_mesh.FACEMESH_TESSELATION,
+            mp_face_mesh.FACEMESH_TESSELATION,
             landmark_drawing_spec=None,
-            connection_drawing_spec=self.mp_drawing.DrawingSpec(color=(80, 110, 10), thickness=1, circle_radius=1)
+            connection_drawing_spec=mp_drawing.DrawingSpec(color=(80, 110, 10), thickness=1, circle_radius=1)
         )
-        self.mp_drawing.draw_landmarks(
+        mp_drawing.draw_landmarks(
             frame,
             landmarks,
-            self.mp_face_mesh.FACEMESH_CONTOURS,
-            landmark_drawing_spec=self.mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=1, circle_radius=1),
-            connection_drawing_spec=self.mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=1)
+            mp_face_mesh.FACEMESH_CONTOURS,
+            landmark_drawing_spec=mp_drawing.DrawingSpec(color=(0, 255, 0), thickness=1, circle_radius=1),
+            connection_drawing_spec=mp_drawing.DrawingSpec(color=(0, 0, 255), thickness=1)
         )
 
     # ---------------- Procesamiento de frame ----------------
     def process_frame(self, frame) -> Tuple[np.ndarray, DrowsinessMetrics]:
-        rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        results = self.face_mesh.process(rgb)
-        self.metrics.is_face_detected = False
-
-        if results.multi_face_landmarks:
-            for face_landmarks in results.multi_face_landmarks:
-                self.metrics.is_face_detected = True
-
-                self.metrics.ear_left = self._calculate_ear(self.LEFT_EYE_LANDMARKS, face_landmarks)
-                self.metrics.ear_right = self._calculate_ear(self.RIGHT_EYE_LANDMARKS, face_landmarks)
-                avg_ear = (self.metrics.ear_left + self.metrics.ear_right) / 2.0
-
-                head_nod_ok = self._check_head_nod_position(face_landmarks)
-
-                # Bostezo
-                mouth_ratio = self._calculate_mouth_ratio(face_landmarks)
-                self.metrics.mouth_open_ratio = mouth_ratio
-                if mouth_ratio > self.yawn_threshold:
-                    if not self.is_yawning:
-                        self.is_yawning = True
-                        self.metrics.yawns_count += 1
-                        # insertar DB al detectar bostezo
-                        try:
-                            if cursor is not None:
-                                sql = "INSERT INTO viaje (hora_viaje, parpadeo, cabeceos, bosteso) VALUES (%s, %s, %s, %s)"
-                                vals = (datetime.now(), self.metrics.blinks_count, self.metrics.head_nods_count, self.metrics.yawns_count)
-                                cursor.execute(sql, vals)
-                                conn.commit()
-                        except Exception as e:
-                            print("⚠️ Error insert DB (bostezo):", e)
+        face_landmarks = self.analyze(frame)
+        self.draw_overlays(frame, face_landmarks)
+        return frame, self.metrics
+
+    def analyze(self, frame):
+        """
+        Inferencia + máquina de estados, sin dibujar.
+        Retorna los landmarks del rostro (o None) para que otra etapa los dibuje.
+        Con adaptive_rate, en los frames que el planificador salta no se infiere:
+        se retienen los landmarks y las métricas del último frame inferido.
+        """
+        if not self._session_open:
+            self._open_session()
+        self.hot.inc("frames")
+        if self.scheduler is not None and not self.scheduler.should_infer():
+            st = self.stage_times
+            st["conversion"] = st["inferencia"] = st["metricas"] = 0.0
+            self.hot.inc("frames_saltados")
+            return self._last_detection
+
+        rows, roi_box = self._infer(frame)
+        t2 = time.perf_counter()
+        detected = pts = None
+        if rows is not None:
+            model = self._landmark_model
+            # Malla completa para dibujarla si el modelo la tiene; si no, los landmarks de la lógica
+            detected = model.mesh if model.has_mesh else rows
+            # Una sola conversión por frame; todo lo demás indexa este arreglo
+            pts = self._pts_buffer
+            pts[METRIC_IDX] = rows
+            if roi_box is not None:
+                self._map_roi_to_frame(model.mesh, pts, roi_box, frame.shape)
+            if self.roi_tracking:
+                self._roi_box = self._face_box(pts, frame.shape)
+        if self.recorder is not None:
+            self.recorder.write(self.clock(), pts)
+        self.update_state(pts)
+
+        if self.scheduler is not None:
+            self._last_detection = detected
+            busy = (self.is_blinking or self.is_yawning or self._is_nodding
+                    or self.alert_active or not self.is_calibrated)
+            self.scheduler.update(self.clock(), self.metrics, self.landmark_points if detected is not None else None,
+                                  self.ear_threshold, self.yawn_threshold, busy)
+        st = self.stage_times
+        st["metricas"] = time.perf_counter() - t2
+        hot = self.hot
+        hot.observe("conversion", st["conversion"])
+        hot.observe("inferencia", st["inferencia"])
+        hot.observe("metricas", st["metricas"])
+        if "primer_frame_ms" not in self.startup_times:
+            # desde que empezó la importación del módulo hasta el primer frame analizado
+            self.startup_times["primer_frame_ms"] = (time.perf_counter() - _MODULE_T0) * 1000
+            r = self.startup_report()
+            print(f"⏱️ Arranque: import {r['import_ms']} ms | modelo {r.get('modelo_ms', 0)} ms | "
+                  f"primer frame {r['primer_frame_ms']} ms")
+        return detected
+
+    def update_state(self, pts: Optional[np.ndarray]):
+        """
+        Máquina de estados sobre el arreglo de landmarks de un frame (None = sin rostro).
+        No depende del modelo: trazas.py la alimenta con landmarks grabados.
+        """
+        if self.metrics.is_face_detected and pts is None:
+            self.hot.inc("rostros_perdidos")
+        self.metrics.is_face_detected = pts is not None
+        if pts is not None:
+            self.landmark_points = pts
+            if self._first_face_time is None:
+                self._first_face_time = self.clock()
+            (ear_left, ear_right), mouth_ratio, raw_pose = self._face_metrics(pts)
+            self.metrics.ear_left = float(ear_left)
+            self.metrics.ear_right = float(ear_right)
+            current_time = self.clock()
+            avg_ear = self._ear_filter(current_time, (self.metrics.ear_left + self.metrics.ear_right) / 2.0)
+            mouth_ratio = self._mouth_filter(current_time, float(mouth_ratio))
+            self.metrics.ear_smoothed = avg_ear
+
+            head_nod_ok = self._check_head_nod_position(pts)
+            self.head_ok = head_nod_ok
+
+            # Bostezo (con histéresis: termina bajo yawn_exit_threshold)
+            self.metrics.mouth_open_ratio = mouth_ratio
+            if mouth_ratio > (self.yawn_exit_threshold if self.is_yawning else self.yawn_threshold):
+                if not self.is_yawning:
+                    self.is_yawning = True
+                    self.metrics.yawns_count += 1
+                    self.window.add_event("bostezo")
+                    # Encolar evento para la DB (no bloquea el frame)
+                    self._record_event("bostezo")
+            else:
+                self.is_yawning = False
+
+            # Parpadeo y estados (con histéresis: los ojos se abren sobre ear_exit_threshold)
+            eyes_closed = avg_ear < (self.ear_exit_threshold if self.is_blinking else self.ear_threshold)
+            if eyes_closed:
+                if not self.is_blinking:
+                    self.is_blinking = True
+                    self.eye_closed_start_time = current_time
                 else:
-                    self.is_yawning = False
-
-                # Parpadeo y estados
-                current_time = time.time()
-                if avg_ear < self.ear_threshold:
-                    if not self.is_blinking:
-                        self.is_blinking = True
-                        self.eye_closed_start_time = current_time
+                    self.metrics.eye_closed_time = current_time - self.eye_closed_start_time
+                    if self.metrics.eye_closed_time > self.microsleep_threshold:
+                        self.metrics.drowsiness_level = "MICROSUEÑO"
+                    elif self.metrics.eye_closed_time > self.drowsy_time_threshold:
+                        self.metrics.drowsiness_level = "SOMNOLIENTO"
                     else:
-                        self.metrics.eye_closed_time = current_time - self.eye_closed_start_time
-                        if self.metrics.eye_closed_time > self.microsleep_threshold:
-                            self.metrics.drowsiness_level = "MICROSUEÑO"
-                            if not self.alert_active:
-                                self.alert_active = True
-                                self._start_alert_sequence()
-                        elif self.metrics.eye_closed_time > self.drowsy_time_threshold:
-                            self.metrics.drowsiness_level = "SOMNOLIENTO"
-                            if not self.alert_active:
-                                self.alert_active = True
-                                self._start_alert_sequence()
-                        else:
-                            self.metrics.drowsiness_level = "NORMAL"
-                else:
-                    if self.is_blinking:
-                        self.is_blinking = False
-                        # sólo contar parpadeo si la cabeza no está en cabeceo
-                        if head_nod_ok:
-                            self.metrics.blinks_count += 1
-                            # insertar DB al detectar parpadeo
-                            try:
-                                if cursor is not None:
-                                    sql = "INSERT INTO viaje (hora_viaje, parpadeo, cabeceos, bosteso) VALUES (%s, %s, %s, %s)"
-                                    vals = (datetime.now(), self.metrics.blinks_count, self.metrics.head_nods_count, self.metrics.yawns_count)
-                                    cursor.execute(sql, vals)
-                                    conn.commit()
-                            except Exception as e:
-                                print("⚠️ Error insert DB (parpadeo):", e)
-
-                        self.metrics.last_blink_time = current_time
-                        self.metrics.eye_closed_time = 0.0
-                        self.metrics.drowsiness_level = "ALERTA"
-                        if self.alert_active:
-                            self.alert_active = False
-                            self._stop_alert_sequence()
-
-                    if not head_nod_ok:
-                        self.metrics.drowsiness_level = "CABECEO_DETECTADO"
-
-                self.metrics.head_pose = self._detect_head_pose(face_landmarks)
-
-                # Dibujos
-                self._draw_full_face_mesh(frame, face_landmarks)
-                self._draw_eye_landmarks(frame, face_landmarks)
-                self._draw_head_landmarks(frame, face_landmarks)
+                        self.metrics.drowsiness_level = "NORMAL"
+            else:
+                if self.is_blinking:
+                    self.is_blinking = False
+                    # sólo contar parpadeo si la cabeza no está en cabeceo
+                    if head_nod_ok:
+                        self.metrics.blinks_count += 1
+                        self.window.add_blink(current_time - self.eye_closed_start_time)
+                        # Encolar evento para la DB (no bloquea el frame)
+                        self._record_event("parpadeo")
+
+                    self.metrics.last_blink_time = current_time
+                    self.metrics.eye_closed_time = 0.0
+                self.metrics.drowsiness_level = "ALERTA" if head_nod_ok else "CABECEO_DETECTADO"
+
+            self._update_ear_profile(avg_ear)
+            self.window.update(current_time, eyes_closed)
+            pose = self.metrics.head_pose
+            for k, v in raw_pose.items():
+                pose[k] = self._pose_filters[k](current_time, v)
         else:
             self.metrics.drowsiness_level = "SIN_ROSTRO"
-            if self.alert_active:
-                self.alert_active = False
-                self._stop_alert_sequence()
+            self._reset_filters()
+            self.window.update(self.clock(), None)
 
-        return frame, self.metrics
+        self.window.write_to(self.metrics)
+        self._update_alert(pts is not None)
+
+    def _reset_filters(self):
+        self._ear_filter.reset()
+        self._mouth_filter.reset()
+        for f in self._pose_filters.values():
+            f.reset()
+        for f in self._nod_filters:
+            f.reset()
+
+    def _update_alert(self, face_detected: bool):
+        """
+        El nivel instantáneo (ojos cerrados) manda; con los ojos abiertos, un puntaje de
+        fatiga de ventana >= fatigue_threshold mantiene el nivel SOMNOLIENTO.
+        """
+        m = self.metrics
+        if (face_detected and m.drowsiness_level in ("ALERTA", "NORMAL")
+                and m.fatigue_score >= self.fatigue_threshold):
+            m.drowsiness_level = "SOMNOLIENTO"
+        if m.drowsiness_level in ALERT_LEVELS:
+            self.alert_active = True
+            self._start_alert_sequence(m.drowsiness_level)
+        elif self.alert_active:
+            self.alert_active = False
+            self._stop_alert_sequence()
+
+    # ---------------- Inferencia (frame completo o ROI del rostro) ----------------
+    def _infer(self, frame):
+        """
+        Corre el modelo de landmarks y retorna (landmarks de METRIC_IDX o None, roi_box). Con roi_tracking y un rostro previo,
+        infiere solo sobre el recorte (reducido a roi_max_side); si ahí no hay rostro,
+        repite la búsqueda en el frame completo y roi_box es None.
+        """
+        st = self.stage_times
+        st["conversion"] = st["inferencia"] = 0.0
+        box = self._roi_box
+        if box is not None:
+            t0 = time.perf_counter()
+            x0, y0, x1, y1 = box
+            crop = frame[y0:y1, x0:x1]
+            scale = self.roi_max_side / max(x1 - x0, y1 - y0)
+            if scale < 1.0:
+                crop = cv2.resize(crop, (max(1, round((x1 - x0) * scale)), max(1, round((y1 - y0) * scale))),
+                                  interpolation=cv2.INTER_AREA)
+            rgb = cv2.cvtColor(crop, cv2.COLOR_BGR2RGB)
+            t1 = time.perf_counter()
+            rows = self.landmark_model.detect(rgb)
+            st["conversion"] += t1 - t0
+            st["inferencia"] += time.perf_counter() - t1
+            if rows is not None:
+                self.roi_stats["roi"] += 1
+                return rows, box
+            # Se perdió el rostro en el recorte: búsqueda en el frame completo
+            self._roi_box = None
+            self.roi_stats["perdidas"] += 1
+
+        t0 = time.perf_counter()
+        rgb = self._to_rgb(frame)
+        t1 = time.perf_counter()
+        rows = self.landmark_model.detect(rgb)
+        st["conversion"] += t1 - t0
+        st["inferencia"] += time.perf_counter() - t1
+        self.roi_stats["completo"] += 1
+        return rows, None
+
+    def _to_rgb(self, frame):
+        """BGR -> RGB del frame completo en un buffer reutilizado (los modelos no lo retienen entre frames)."""
+        buf = self._rgb_buffer
+        if buf is None or buf.shape != frame.shape:
+            buf = self._rgb_buffer = np.empty_like(frame)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buf)
+
+    def _face_box(self, pts: np.ndarray, shape) -> Optional[Tuple[int, int, int, int]]:
+        """Caja cuadrada con margen alrededor de los landmarks del frame (en píxeles)."""
+        h, w = shape[:2]
+        xy = pts[METRIC_IDX, :2] * (w, h)
+        (x0, y0), (x1, y1) = xy.min(axis=0), xy.max(axis=0)
+        cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+        half = max(x1 - x0, y1 - y0) * (0.5 + self.roi_padding)
+        box = (max(0, int(cx - half)), max(0, int(cy - half)), min(w, int(cx + half)), min(h, int(cy + half)))
+        if box[2] - box[0] < 32 or box[3] - box[1] < 32:
+            return None
+        return box
+
+    def _map_roi_to_frame(self, face_landmarks, pts: np.ndarray, box, shape):
+        """Lleva landmarks normalizados al recorte a coordenadas normalizadas del frame completo."""
+        h, w = shape[:2]
+        x0, y0, x1, y1 = box
+        sx, sy = (x1 - x0) / w, (y1 - y0) / h
+        ox, oy = x0 / w, y0 / h
+        rows = pts[METRIC_IDX]
+        rows[:, 0] = ox + rows[:, 0] * sx
+        rows[:, 1] = oy + rows[:, 1] * sy
+        rows[:, 2] *= sx
+        pts[METRIC_IDX] = rows
+        # La malla completa se dibuja desde el protobuf: solo se remapea si se va a dibujar
+        if face_landmarks is not None and self.render_level == "malla":
+            for lm in face_landmarks.landmark:
+                lm.x = ox + lm.x * sx
+                lm.y = oy + lm.y * sy
+                lm.z *= sx
+
+    def _draw_face(self, image, face_landmarks, pts: np.ndarray):
+        rank = RENDER_LEVELS.index(self.render_level)
+        if face_landmarks is None or rank < RENDER_LEVELS.index("ojos_cabeza"):
+            return
+        if pts is None:
+            pts = self.landmark_points
+        # Rectángulo del rostro (con margen para la malla y las etiquetas)
+        h, w = image.shape[:2]
+        xy = pts[METRIC_IDX, :2] * (w, h)
+        (x0, y0), (x1, y1) = xy.min(axis=0), xy.max(axis=0)
+        mx, my = (x1 - x0) * 0.35 + 20, (y1 - y0) * 0.25 + 20
+        self.overlay.mark(x0 - mx, y0 - my, x1 + mx, y1 + my)
+        self.overlay.mark(w - 300, 0, w, 75)     # textos de calibración / cabeza
+        if rank >= RENDER_LEVELS.index("malla") and self.landmark_model.has_mesh:
+            self._draw_full_face_mesh(image, face_landmarks)
+        self._draw_eye_landmarks(image, pts)
+        self._draw_head_landmarks(image, pts)
+
+    def draw_overlays(self, frame, face_landmarks, pts: np.ndarray = None):
+        """
+        Dibuja los overlays del rostro según render_level (sin HUD).
+        `pts` permite dibujar una copia del arreglo cuando la inferencia corre en otro hilo.
+        """
+        if face_landmarks is None or self.render_level in ("ninguno", "hud"):
+            self.stage_times["dibujo"] = 0.0
+            return frame
+        t0 = time.perf_counter()
+        layer = self.overlay.begin(frame.shape)
+        self._draw_face(layer, face_landmarks, pts)
+        self.overlay.composite(frame)
+        self.stage_times["dibujo"] = time.perf_counter() - t0
+        self.hot.observe("dibujo", self.stage_times["dibujo"])
+        return frame
+
+    def render(self, frame, face_landmarks, pts: np.ndarray, metrics: DrowsinessMetrics,
+               alert_active: bool, pipeline_stats: Dict = None):
+        """Overlays del rostro + HUD en una sola capa, según render_level."""
+        if self.render_level == "ninguno":
+            self.stage_times["dibujo"] = 0.0
+            return frame
+        t0 = time.perf_counter()
+        layer = self.overlay.begin(frame.shape)
+        self._draw_face(layer, face_landmarks, pts)
+        draw_hud(layer, metrics, alert_active, pipeline_stats)
+        h, w = frame.shape[:2]
+        self.overlay.mark(0, 0, w, HUD_HEIGHT)                # textos del HUD y aviso de alerta
+        if pipeline_stats:
+            self.overlay.mark(0, h - 35, w, h)
+        if alert_active:
+            self.overlay.mark(0, 0, w, h)                     # borde rojo
+        self.overlay.composite(frame)
+        self.stage_times["dibujo"] = time.perf_counter() - t0
+        self.hot.observe("dibujo", self.stage_times["dibujo"])
+        return frame
+
+    def show_frame(self, window_name: str, frame) -> bool:
+        """imshow + waitKey medidos como etapa; retorna False si se pidió salir con 'q'."""
+        t0 = time.perf_counter()
+        cv2.imshow(window_name, frame)
+        key = cv2.waitKey(1) & 0xFF
+        self.hot.observe("imshow", time.perf_counter() - t0)
+        return key != ord('q')
 
     def reset_metrics(self):
+        # Reiniciar = terminar el viaje; el siguiente frame abre una sesión nueva
+        self._close_session()
+        self.session_id = uuid.uuid4().hex
         self.metrics = DrowsinessMetrics()
+        self.window = SlidingWindowScorer(self.window_seconds)
+        self._reset_filters()
         self.eye_closed_start_time = None
         self.is_blinking = False
+        self._roi_box = None
+        self._last_detection = None
         if self.alert_active:
             self._stop_alert_sequence()
             self.alert_active = False
 
     def cleanup(self):
         self._stop_alert_sequence()
-        if self.audio_available:
-            pygame.mixer.quit()
+        self._close_session()
+        self.save_profile()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self._event_writer is not None:
+            self._event_writer.close()
+        if self._alerts is not None:
+            self._alerts.close()
+        if self._landmark_model is not None:
+            self._landmark_model.close()
+
+# ---------------- HUD ----------------
+HUD_LINE_Y = (30, 60, 90, 120, 150, 180, 210, 240)   # base de cada línea de texto del HUD
+HUD_HEIGHT = HUD_LINE_Y[-1] + 10                     # alto de la zona que se redibuja
+
+
+def draw_hud(frame, metrics: DrowsinessMetrics, alert_active: bool, pipeline_stats: Dict = None):
+    cv2.putText(frame, f"Parpadeos: {metrics.blinks_count}",
+                (10, HUD_LINE_Y[0]), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
+    cv2.putText(frame, f"Cabeceos: {metrics.head_nods_count}",
+                (10, HUD_LINE_Y[1]), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
+    cv2.putText(frame, f"Bostezos: {metrics.yawns_count}",
+                (10, HUD_LINE_Y[2]), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 200, 255), 2)
+    cv2.putText(frame, f"Estado: {metrics.drowsiness_level}",
+                (10, HUD_LINE_Y[3]), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 150, 150), 2)
+
+    if metrics.eye_closed_time > 0:
+        cv2.putText(frame, f"Ojos cerrados: {metrics.eye_closed_time:.1f}s",
+                    (10, HUD_LINE_Y[4]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 100), 2)
+    cv2.putText(frame, f"EAR: {metrics.ear_smoothed:.3f}",
+                (10, HUD_LINE_Y[5]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220, 220, 220), 2)
+    cv2.putText(frame, f"Mouth: {metrics.mouth_open_ratio:.3f}",
+                (10, HUD_LINE_Y[6]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220, 220, 220), 2)
+    cv2.putText(frame, f"PERCLOS: {metrics.perclos * 100:.0f}%  Fatiga: {metrics.fatigue_score:.2f}",
+                (10, HUD_LINE_Y[7]), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220, 220, 220), 2)
+
+    if pipeline_stats:
+        txt = "  ".join(f"{name}: {st['fps']:.1f}fps/q{st['depth']}/d{st['dropped']}"
+                        for name, st in pipeline_stats.items())
+        cv2.putText(frame, txt, (10, frame.shape[0] - 15),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.5, (180, 180, 180), 1)
+
+    if alert_active:
+        cv2.rectangle(frame, (0, 0), (frame.shape[1], frame.shape[0]),
+                      (0, 0, 255), 8)
+        cv2.putText(frame, "!!! ALERTA DE SOMNOLENCIA !!!",
+                    (frame.shape[1]//2 - 220, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
+    return frame
+
+# ---------------- Pipeline multihilo ----------------
+class LatestFrameRing:
+    """
+    Anillo acotado que siempre entrega el elemento más reciente.
+    Si el consumidor va lento, los elementos viejos se descartan (no se encolan);
+    on_drop recibe cada descartado (p. ej. para devolver su buffer al pool de captura).
+    """
+    def __init__(self, capacity: int = 2, on_drop=None):
+        self._buf = collections.deque(maxlen=capacity)
+        self._cond = threading.Condition()
+        self._closed = False
+        self._on_drop = on_drop
+        self.dropped = 0
+
+    def put(self, item):
+        with self._cond:
+            if len(self._buf) == self._buf.maxlen:
+                self.dropped += 1
+                if self._on_drop is not None:
+                    self._on_drop(self._buf[0])
+            self._buf.append(item)
+            self._cond.notify()
+
+    def get_latest(self, timeout: float = None):
+        """Retorna el más reciente y descarta los anteriores (obsoletos). None si se cerró o venció."""
+        with self._cond:
+            if not self._buf and not self._closed:
+                self._cond.wait(timeout)
+            if not self._buf:
+                return None
+            self.dropped += len(self._buf) - 1
+            item = self._buf.pop()
+            if self._on_drop is not None:
+                for old in self._buf:
+                    self._on_drop(old)
+            self._buf.clear()
+            return item
+
+    def depth(self) -> int:
+        return len(self._buf)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class StageStats:
+    """FPS de una etapa medido sobre una ventana deslizante de marcas de tiempo."""
+    def __init__(self, window: int = 60):
+        self._stamps = collections.deque(maxlen=window)
+        self.count = 0
+
+    def tick(self):
+        self._stamps.append(time.perf_counter())
+        self.count += 1
+
+    def fps(self) -> float:
+        if len(self._stamps) < 2:
+            return 0.0
+        span = self._stamps[-1] - self._stamps[0]
+        return (len(self._stamps) - 1) / span if span > 0 else 0.0
+
+
+class PipelineRunner:
+    """
+    Captura -> inferencia -> render en etapas separadas.
+    - Captura: hilo que lee la cámara y deja solo el frame más nuevo en un anillo.
+    - Inferencia: hilo que corre FaceMesh + máquina de estados (detector.analyze).
+    - Render: hilo principal (cv2.imshow debe ir en el hilo principal) con dibujos y HUD.
+      Sin pantalla (show=False) solo consume resultados, sin dibujar.
+    Si la fuente tiene un FramePool (captura.CaptureSource), cada buffer vuelve al pool recién
+    cuando el render lo soltó o un anillo lo descartó; así la captura nunca pisa un frame en vuelo.
+    """
+    def __init__(self, detector: DrowsinessDetector, cap, window_name: str, ring_capacity: int = 2,
+                 show: bool = True):
+        self.detector = detector
+        self.cap = cap
+        self.window_name = window_name
+        self.show = show
+        pool = getattr(cap, "pool", None)
+        if pool is not None:
+            pool.tracking = True
+        self._release = cap.release_frame if pool is not None else (lambda frame: None)
+        self.capture_ring = LatestFrameRing(ring_capacity, on_drop=self._release)
+        self.result_ring = LatestFrameRing(ring_capacity, on_drop=lambda item: self._release(item[0]))
+        self.stats = {"captura": StageStats(), "inferencia": StageStats(), "render": StageStats()}
+        detector.hot.gauge("frames_descartados_captura", lambda: self.capture_ring.dropped)
+        detector.hot.gauge("frames_descartados_render", lambda: self.result_ring.dropped)
+        self._stop = threading.Event()
+        self._threads = []
+        self.error = None           # primera excepción de un hilo; run() la vuelve a lanzar
+
+    def _guarded(self, loop):
+        """Corre una etapa; si termina (o falla) detiene todo el pipeline en vez de dejarlo colgado."""
+        try:
+            loop()
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+        finally:
+            self._stop.set()
+            self.capture_ring.close()
+            self.result_ring.close()
+
+    def _capture_loop(self):
+        while not self._stop.is_set():
+            ret, frame = self.cap.read()
+            if not ret:
+                break
+            self.stats["captura"].tick()
+            self.capture_ring.put(frame)
+
+    def _inference_loop(self):
+        while not self._stop.is_set():
+            frame = self.capture_ring.get_latest(timeout=0.5)
+            if frame is None:
+                continue
+            face_landmarks = self.detector.analyze(frame)
+            self.stats["inferencia"].tick()
+            # el buffer de landmarks se reutiliza en el siguiente frame: el render recibe copia
+            pts = self.detector.landmark_points.copy() if face_landmarks is not None else None
+            self.result_ring.put((frame, face_landmarks, pts, self.detector.metrics.snapshot(),
+                                  self.detector.alert_active))
+
+    def pipeline_stats(self) -> Dict[str, Dict]:
+        rings = {"captura": self.capture_ring, "inferencia": self.result_ring, "render": None}
+        out = {}
+        for name, st in self.stats.items():
+            ring = rings[name]
+            out[name] = {"fps": st.fps(), "frames": st.count,
+                         "depth": ring.depth() if ring else 0,
+                         "dropped": ring.dropped if ring else 0}
+        return out
+
+    def run(self):
+        self._threads = [threading.Thread(target=self._guarded, args=(self._capture_loop,), name="captura",
+                                          daemon=True),
+                         threading.Thread(target=self._guarded, args=(self._inference_loop,), name="inferencia",
+                                          daemon=True)]
+        for t in self._threads:
+            t.start()
+        try:
+            while not self._stop.is_set():
+                item = self.result_ring.get_latest(timeout=0.5)
+                if item is None:
+                    continue
+                self.stats["render"].tick()
+                frame, face_landmarks, pts, metrics, alert_active = item
+                try:
+                    if not self.show:
+                        continue
+                    self.detector.render(frame, face_landmarks, pts, metrics, alert_active, self.pipeline_stats())
+                    if not self.detector.show_frame(self.window_name, frame):
+                        break
+                finally:
+                    self._release(frame)
+        finally:
+            self.stop()
+        if self.error is not None:
+            raise self.error
+
+    def stop(self):
+        self._stop.set()
+        self.capture_ring.close()
+        self.result_ring.close()
+        for t in self._threads:
+            t.join(timeout=2.0)
+
+
+# ---------------- Microbenchmark de landmarks ----------------
+def _per_landmark_reference(landmarks):
+    """Cálculo previo (acceso por atributo a cada landmark), solo como referencia del benchmark."""
+    def ear(idxs):
+        p = np.array([[landmarks.landmark[i].x, landmarks.landmark[i].y] for i in idxs])
+        return (np.linalg.norm(p[1] - p[5]) + np.linalg.norm(p[2] - p[4])) / (2.0 * (np.linalg.norm(p[0] - p[3]) + 1e-8))
+    lm = landmarks.landmark
+    mouth = math.hypot(lm[14].x - lm[13].x, lm[14].y - lm[13].y) / (math.hypot(lm[291].x - lm[61].x, lm[291].y - lm[61].y) + 1e-6)
+    eye_cx = (lm[33].x + lm[362].x) / 2
+    eye_cy = (lm[33].y + lm[362].y) / 2
+    pose = {"pitch": (lm[1].y - eye_cy) * 100,
+            "yaw": ((lm[61].x + lm[291].x) / 2 - eye_cx) * 100,
+            "roll": math.degrees(math.atan2(lm[362].y - lm[33].y, lm[362].x - lm[33].x))}
+    # calibración y cabeceo leían 10/152/1 dos veces cada uno
+    for _ in range(2):
+        abs(lm[10].y - lm[152].y), lm[1].y - lm[10].y
+    return ear(LEFT_EYE_IDX), ear(RIGHT_EYE_IDX), mouth, pose
+
+
+def benchmark_landmark_math(iterations: int = 2000, seed: int = 0) -> Dict[str, float]:
+    """
+    Costo por frame (µs) de las métricas geométricas: acceso por landmark vs el camino real
+    del detector (MediaPipeBackend.detect -> filas de METRIC_IDX en el arreglo -> métricas).
+    `conversion_us` es solo detect, así que `arreglo_us - conversion_us` es el costo de las
+    métricas (EAR, boca y pose en una lectura de filas, más frente-barbilla). Usa objetos Python simples como landmarks y un FaceMesh
+    falso que no infiere; con protobuf real el acceso a atributos cuesta distinto.
+    """
+    from types import SimpleNamespace
+    rng = np.random.default_rng(seed)
+    coords = rng.random((NUM_LANDMARKS, 3))
+    landmarks = SimpleNamespace(landmark=[SimpleNamespace(x=float(x), y=float(y), z=float(z)) for x, y, z in coords])
+    mesh_output = SimpleNamespace(multi_face_landmarks=[landmarks])
+    backend = MediaPipeBackend(face_mesh=SimpleNamespace(process=lambda rgb: mesh_output))
+
+    detector = DrowsinessDetector(event_writer=NullEventWriter(), audio=NullAudio())   # sin modelo ni audio
+    buf = np.zeros((NUM_LANDMARKS, 3), np.float32)
+
+    def from_array():
+        pts = buf
+        pts[METRIC_IDX] = backend.detect(None)
+        return (*detector._face_metrics(pts), detector._head_geometry(pts))
+
+    ref = _per_landmark_reference(landmarks)
+    vec = from_array()
+    max_diff = max(abs(ref[0] - vec[0][0]), abs(ref[1] - vec[0][1]), abs(ref[2] - vec[1]),
+                   *(abs(ref[3][k] - vec[2][k]) for k in ref[3]))
+
+    result = {}
+    for name, fn in (("por_landmark_us", lambda: _per_landmark_reference(landmarks)),
+                     ("arreglo_us", from_array),
+                     ("conversion_us", lambda: backend.detect(None))):
+        fn()
+        t0 = time.perf_counter()
+        for _ in range(iterations):
+            fn()
+        result[name] = (time.perf_counter() - t0) / iterations * 1e6
+    result["max_diff"] = float(max_diff)
+    return result
 
 # ---------------- Main ----------------
 def create_drowsiness_detector(**kwargs) -> DrowsinessDetector:
     return DrowsinessDetector(**kwargs)
 
+def run_sequential(detector: DrowsinessDetector, cap, window_name: str, show: bool = True):
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        face_landmarks = detector.analyze(frame)
+        if not show:
+            continue
+        detector.render(frame, face_landmarks, None, detector.metrics, detector.alert_active)
+        if not detector.show_frame(window_name, frame):
+            break
+
+IMPORT_TIMES_MS["somnolencia"] = (time.perf_counter() - _MODULE_T0) * 1000
+
 if __name__ == "__main__":
-    detector = create_drowsiness_detector()
-    cap = cv2.VideoCapture(0)
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1280)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 720)
+    parser = argparse.ArgumentParser(description="Detector de somnolencia")
+    parser.add_argument("--secuencial", action="store_true",
+                        help="captura, inferencia y render en un solo hilo (modo anterior)")
+    parser.add_argument("--render", choices=RENDER_LEVELS, default="malla",
+                        help="qué dibujar: ninguno, hud, ojos_cabeza o malla (completo)")
+    parser.add_argument("--modelo", default="mediapipe",
+                        help="modelo de landmarks: mediapipe, mediapipe_sin_iris, lbf:<modelo.yaml> "
+                             "u onnx:<modelo.onnx> (ver modelos.py)")
+    parser.add_argument("--roi", action="store_true",
+                        help="inferir solo sobre el recorte del rostro del frame anterior")
+    parser.add_argument("--adaptativo", action="store_true",
+                        help="bajar la tasa de inferencia cuando el conductor está estable")
+    parser.add_argument("--bench-landmarks", action="store_true",
+                        help="microbenchmark de la extracción de landmarks y sale")
+    parser.add_argument("--conductor", help="id del conductor: carga y guarda su perfil de calibración")
+    parser.add_argument("--grabar-traza", metavar="ARCHIVO",
+                        help="graba los landmarks de cada frame en una traza (ver trazas.py)")
+    parser.add_argument("--fuente", default="0",
+                        help="índice de cámara, archivo/URL o gst:<pipeline de GStreamer>")
+    parser.add_argument("--formato", choices=("MJPG", "YUYV"),
+                        help="formato nativo pedido a la cámara (MJPG: menos ancho de banda USB)")
+    parser.add_argument("--metricas-puerto", type=int, metavar="PUERTO",
+                        help="publica /metrics y /perfil en localhost:PUERTO (ver perfilador.py)")
+    args = parser.parse_args()
+
+    if args.bench_landmarks:
+        r = benchmark_landmark_math()
+        print(f"⏱️ Por landmark: {r['por_landmark_us']:.1f} µs/frame | "
+              f"Arreglo (una lectura de filas): {r['arreglo_us']:.1f} µs/frame (conversión {r['conversion_us']:.1f}) | "
+              f"dif. máx {r['max_diff']:.2e}")
+        raise SystemExit(0)
+
+    show = display_available()
+    if not show:
+        print("🖥️ Sin pantalla: se desactivan los dibujos (Ctrl+C para salir)")
+    recorder = None
+    if args.grabar_traza:
+        from trazas import TraceWriter
+        recorder = TraceWriter(args.grabar_traza, meta={"fuente": args.fuente})
+    detector = create_drowsiness_detector(render_level=args.render if show else "ninguno",
+                                          landmark_backend=args.modelo,
+                                          roi_tracking=args.roi, adaptive_rate=args.adaptativo,
+                                          recorder=recorder, driver_id=args.conductor,
+                                          camera_id=args.fuente)
+    detector.warm_up()
+    metrics_server = None
+    if args.metricas_puerto:
+        from perfilador import MetricsServer, install_signal_dump
+        metrics_server = MetricsServer(detector.hot, port=args.metricas_puerto).start()
+        install_signal_dump()
+        print(f"📈 Métricas en http://127.0.0.1:{metrics_server.port}/metrics")
+    from captura import open_source
+    cap = open_source(args.fuente, 1280, 720, fmt=args.formato)
+    window_name = "🔍 Detector de Somnolencia - 'q' para salir"
 
     print("🔍 Detector de Somnolencia iniciado")
     print("👁️ Cierra los ojos >1.5s para alertas; cabecea para probar el contador")
     print("🔔 Cada 3 cabeceos emite un beep único")
     print("❌ Presiona 'q' para salir")
 
+    runner = None
     try:
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-
-            processed_frame, metrics = detector.process_frame(frame)
-
-            # HUD
-            cv2.putText(processed_frame, f"Parpadeos: {metrics.blinks_count}",
-                        (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 255), 2)
-            cv2.putText(processed_frame, f"Cabeceos: {metrics.head_nods_count}",
-                        (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 255), 2)
-            cv2.putText(processed_frame, f"Bostezos: {metrics.yawns_count}",
-                        (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 200, 255), 2)
-            cv2.putText(processed_frame, f"Estado: {metrics.drowsiness_level}",
-                        (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 150, 150), 2)
-
-            if metrics.eye_closed_time > 0:
-                cv2.putText(processed_frame, f"Ojos cerrados: {metrics.eye_closed_time:.1f}s",
-                            (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 100, 100), 2)
-            avg_ear = (metrics.ear_left + metrics.ear_right) / 2.0
-            cv2.putText(processed_frame, f"EAR: {avg_ear:.3f}",
-                        (10, 180), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220, 220, 220), 2)
-            cv2.putText(processed_frame, f"Mouth: {metrics.mouth_open_ratio:.3f}",
-                        (10, 210), cv2.FONT_HERSHEY_SIMPLEX, 0.6, (220, 220, 220), 2)
-
-            if detector.alert_active:
-                cv2.rectangle(processed_frame, (0, 0), (processed_frame.shape[1], processed_frame.shape[0]),
-                              (0, 0, 255), 8)
-                cv2.putText(processed_frame, "!!! ALERTA DE SOMNOLENCIA !!!",
-                            (processed_frame.shape[1]//2 - 220, 50), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 3)
-
-            cv2.imshow("🔍 Detector de Somnolencia - 'q' para salir", processed_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
+        if args.secuencial:
+            run_sequential(detector, cap, window_name, show)
+        else:
+            runner = PipelineRunner(detector, cap, window_name, show=show)
+            runner.run()
+    except KeyboardInterrupt:
+        pass
     finally:
+        if runner is not None:
+            for name, st in runner.pipeline_stats().items():
+                print(f"📊 {name}: {st['frames']} frames, {st['fps']:.1f} fps, descartados {st['dropped']}")
         cap.release()
-        cv2.destroyAllWindows()
+        if show:
+            cv2.destroyAllWindows()
         detector.cleanup()
+        if metrics_server is not None:
+            from perfilador import print_summary
+            metrics_server.stop()
+            print_summary(detector.hot)
         print("✅ Detector cerrado correctamente")
-        if cursor is not None:
-            cursor.close()
-        if conn is not None:
-            conn.close()
@@ -0,0 +1,98 @@
+"""
+Trabajo de analítica sobre una DB SQLite en memoria (SQLITE_SCHEMA) y sobre diarios JSONL.
+
+    python -m pytest -q test_analitica.py
+"""
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from analitica import TripAnalyzer, connect_sqlite, stream_journals, stream_sessions, stream_viaje
+from somnolencia import EventWriter
+
+T0 = datetime(2026, 10, 1, 8, 0)
+CHUNK_SIZES = (1, 2, 7, 5000)
+
+
+def _iso(dt: datetime) -> str:
+    return dt.isoformat(sep=" ")
+
+
+@pytest.fixture
+def db():
+    conn = connect_sqlite()
+    # s1: 2 h de la mañana, 40 parpadeos parejos, 3 cabeceos seguidos a las 9:00 y 1 bostezo
+    conn.execute("INSERT INTO sesion VALUES ('s1', 'ana', ?, ?)", (_iso(T0), _iso(T0 + timedelta(hours=2))))
+    events = [("parpadeo", T0 + timedelta(minutes=3 * i)) for i in range(40)]
+    events += [("cabeceo", T0 + timedelta(minutes=60 + i)) for i in range(3)]
+    events += [("bostezo", T0 + timedelta(minutes=100))]
+    conn.executemany("INSERT INTO evento (id_sesion, tipo, ts) VALUES ('s1', ?, ?)",
+                     [(tipo, _iso(ts)) for tipo, ts in events])
+    # s2: media hora de noche sin eventos
+    night = T0.replace(hour=23)
+    conn.execute("INSERT INTO sesion VALUES ('s2', 'ana', ?, ?)", (_iso(night), _iso(night + timedelta(minutes=30))))
+    # tabla histórica: contadores acumulados, un hueco de 90 min y un reinicio del detector
+    viaje = [(T0, 1, 0, 0), (T0 + timedelta(seconds=10), 2, 0, 0), (T0 + timedelta(minutes=1), 2, 1, 0),
+             (T0 + timedelta(minutes=2), 2, 1, 1), (T0 + timedelta(minutes=92), 3, 1, 1),
+             (T0 + timedelta(minutes=93), 1, 0, 0)]
+    conn.executemany("INSERT INTO viaje (hora_viaje, parpadeo, cabeceos, bosteso) VALUES (?, ?, ?, ?)",
+                     [(_iso(t), *c) for t, *c in viaje])
+    conn.commit()
+    yield conn
+    conn.close()
+
+
+def analyze(chunks):
+    analyzer = TripAnalyzer()
+    results = [r for chunk in chunks for r in analyzer.feed(chunk)] + list(analyzer.finish())
+    trips = sorted((row for row, _ in results), key=lambda r: r["id_viaje"])
+    windows = sorted((w for _, wins in results for w in wins), key=lambda w: (w["id_viaje"], w["inicio"]))
+    return trips, windows
+
+
+def test_sessions_trip_totals_and_rates(db):
+    trips, _ = analyze(stream_sessions(db))
+    s1, s2 = trips
+    assert (s1["id_viaje"], s1["turno"], s1["duracion_min"]) == ("s1", "mañana", 120.0)
+    assert (s1["parpadeos"], s1["cabeceos"], s1["bostezos"]) == (40, 3, 1)
+    assert (s1["parpadeos_h"], s1["cabeceos_h"], s1["bostezos_h"]) == (20.0, 1.5, 0.5)
+    assert (s2["turno"], s2["duracion_min"], s2["parpadeos"], s2["ventanas_riesgo"]) == ("noche", 30.0, 0, 0)
+
+
+def test_sessions_risk_window(db):
+    trips, windows = analyze(stream_sessions(db))
+    # 3 cabeceos en 10 min => puntaje 0.5 mientras la ventana los contiene a los tres (9:02 a 9:09);
+    # el tramo cubre también los 9 minutos previos de la primera ventana
+    (w,) = windows
+    assert (w["id_viaje"], w["cabeceos"], w["puntaje_max"]) == ("s1", 3, 0.5)
+    assert (w["inicio"], w["fin"], w["minutos"]) == (datetime(2026, 10, 1, 8, 53), datetime(2026, 10, 1, 9, 10), 17)
+    assert trips[0]["ventanas_riesgo"] == 1 and trips[0]["minutos_riesgo"] == 17
+
+
+def test_viaje_deltas(db):
+    trips, _ = analyze(stream_viaje(db))
+    got = {t["id_viaje"]: (t["parpadeos"], t["cabeceos"], t["bostezos"]) for t in trips}
+    # el hueco separa viaje-5 sin reiniciar contadores; viaje-6 es un reinicio (total 1)
+    assert got == {"viaje-1": (2, 1, 1), "viaje-5": (1, 0, 0), "viaje-6": (1, 0, 0)}
+
+
+@pytest.mark.parametrize("source", ["sesiones", "viaje"])
+def test_output_independent_of_chunk_size(db, source):
+    stream = stream_sessions if source == "sesiones" else stream_viaje
+    results = [analyze(stream(db, chunk_size)) for chunk_size in CHUNK_SIZES]
+    assert all(r == results[0] for r in results[1:])
+
+
+def test_journal_legacy_rows_match_replay(tmp_path):
+    path = tmp_path / "diario.jsonl"
+    legacy = [["2026-10-01T08:00:00", 1, 0, 0], ["2026-10-01T08:00:05", 2, 0, 0], ["2026-10-01T08:01:00", 2, 1, 0]]
+    current = [["s1", "inicio", {"dt": "2026-10-02T08:00:00"}, "ana"],
+               ["s1", "parpadeo", {"dt": "2026-10-02T08:00:30"}, None],
+               ["s1", "fin", {"dt": "2026-10-02T08:30:00"}, None]]
+    path.write_text("".join(json.dumps(r) + "\n" for r in legacy + current), encoding="utf-8")
+    sid = EventWriter._legacy_rows(legacy)[0][0]
+    for chunk_size in CHUNK_SIZES:
+        trips, _ = analyze(stream_journals([str(path)], chunk_size))
+        got = {t["id_viaje"]: (t["origen"], t["parpadeos"], t["cabeceos"]) for t in trips}
+        assert got == {sid: ("diario anterior", 2, 1), "s1": ("ana", 1, 0)}
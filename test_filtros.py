@@ -0,0 +1,176 @@
+"""
+Filtros de señal + histéresis sobre una traza sintética reproducida con trazas.replay.
+
+La traza tiene parpadeos reales, un tramo con el EAR rondando el umbral y cierres largos
+(ojos casi cerrados con ruido) que deberían dar una sola alerta cada uno.
+La traza de cabeceos tiene cabeceos reales de 1.5 s con ruido en frente-barbilla que,
+sin filtro ni histéresis, los corta en varios.
+
+    python -m pytest -q test_filtros.py
+"""
+import numpy as np
+import pytest
+
+from somnolencia import HEAD_POSE_IDX, LEFT_EYE_IDX, MOUTH_IDX, NOD_IDX, NUM_LANDMARKS, RIGHT_EYE_IDX
+from trazas import TraceWriter, replay
+
+FPS = 30
+EAR_OPEN = 0.30
+EAR_NEAR = 0.262        # tramo cerca del umbral por defecto (0.25)
+EAR_CLOSING = 0.215     # cierre largo: bajo el umbral, con ruido que lo cruza
+BLINK = (0.20, 0.12, 0.12, 0.20)
+EYE_WIDTH = 0.06
+NOISE = 0.0012          # ruido por landmark (coordenadas normalizadas)
+RAW = {"signal_filter": "ninguno", "ear_hysteresis": 0.0}   # comparación cruda con el umbral
+
+
+def _face() -> np.ndarray:
+    """Rostro neutro: cabeza fija, boca cerrada; los ojos los pone _set_eye."""
+    pts = np.zeros((NUM_LANDMARKS, 3), np.float32)
+    frente, barbilla, nariz = NOD_IDX
+    pts[frente, :2] = (0.50, 0.20)
+    pts[barbilla, :2] = (0.50, 0.60)
+    pts[nariz, :2] = (0.50, 0.42)
+    izq, der, arriba, abajo = MOUTH_IDX
+    pts[izq, :2] = (0.44, 0.50)
+    pts[der, :2] = (0.56, 0.50)
+    pts[arriba, :2] = (0.50, 0.50)
+    pts[abajo, :2] = (0.50, 0.505)
+    for i in HEAD_POSE_IDX:
+        if not pts[i].any():
+            pts[i, :2] = (0.50, 0.35)
+    return pts
+
+
+def _set_eye(pts: np.ndarray, idx, cx: float, ear: float):
+    """Seis puntos del ojo (p0..p5) con EAR = alto / ancho."""
+    w, h, cy = EYE_WIDTH, ear * EYE_WIDTH, 0.32
+    pts[idx, :2] = [(cx - w / 2, cy), (cx - w / 6, cy - h / 2), (cx + w / 6, cy - h / 2),
+                    (cx + w / 2, cy), (cx + w / 6, cy + h / 2), (cx - w / 6, cy + h / 2)]
+
+
+def synthetic_ear(seconds: int = 120):
+    """EAR por frame sin ruido, cantidad de parpadeos reales y de cierres largos."""
+    n = FPS * seconds
+    ear = np.full(n, EAR_OPEN)
+    ear[FPS * 40:FPS * 60] = EAR_NEAR
+    closures = [(FPS * 75, FPS * 83), (FPS * 95, FPS * 103)]
+    for a, b in closures:
+        ear[a:b] = EAR_CLOSING
+    blinks = 0
+    for start in range(15, n - 10, 90):
+        if any(a - 30 <= start < b + 30 for a, b in closures):
+            continue
+        ear[start:start + len(BLINK)] = BLINK
+        blinks += 1
+    return ear, blinks, len(closures)
+
+
+def write_synthetic_trace(path: str, seconds: int = 120, seed: int = 0):
+    """Graba la traza sintética (con ruido en cada landmark) y retorna (parpadeos, cierres)."""
+    ear, blinks, closures = synthetic_ear(seconds)
+    rng = np.random.default_rng(seed)
+    face = _face()
+    pts = face.copy()
+    eyes = np.concatenate([LEFT_EYE_IDX, RIGHT_EYE_IDX])
+    writer = TraceWriter(path)
+    try:
+        for i, e in enumerate(ear):
+            pts[:] = face
+            _set_eye(pts, LEFT_EYE_IDX, 0.56, e)
+            _set_eye(pts, RIGHT_EYE_IDX, 0.44, e)
+            pts[eyes, :2] += rng.normal(0, NOISE, (len(eyes), 2))
+            writer.write(i / FPS, pts)
+    finally:
+        writer.close()
+    return blinks, closures
+
+
+@pytest.fixture(scope="module")
+def trace(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("trazas") / "sintetica.trz")
+    blinks, closures = write_synthetic_trace(path)
+    return path, blinks, closures
+
+
+def test_default_filter_counts_real_blinks(trace):
+    path, blinks, closures = trace
+    r = replay(path)
+    # al abrir los ojos tras un cierre largo también se cuenta un parpadeo
+    assert abs(r["parpadeos"] - (blinks + closures)) <= 3
+
+
+@pytest.mark.parametrize("config", [RAW, {"signal_filter": "ninguno"}], ids=["crudo", "ninguno"])
+def test_default_filter_fewer_events_than_unfiltered(trace, config):
+    path, blinks, _ = trace
+    unfiltered = replay(path, config)
+    filtered = replay(path)
+    assert unfiltered["parpadeos"] > blinks + 10
+    assert filtered["parpadeos"] < unfiltered["parpadeos"]
+
+
+def test_default_filter_fewer_alert_restarts_than_raw(trace):
+    path, _, closures = trace
+    raw = replay(path, RAW)
+    filtered = replay(path)
+    # el ruido en un cierre largo corta la alerta y la vuelve a disparar
+    assert raw["alertas"] > closures
+    assert filtered["alertas"] == closures
+    assert filtered["alertas"] < raw["alertas"]
+
+
+# ---------------- Cabeceos ----------------
+NOD_DROP = 0.40         # caída relativa de frente-barbilla en un cabeceo real (umbral 0.3)
+NOD_JITTER = 0.04       # ruido relativo de frente-barbilla por frame
+
+
+def synthetic_nods(seconds: int = 90):
+    """Caída relativa de frente-barbilla por frame (sin ruido) y cantidad de cabeceos reales."""
+    n = FPS * seconds
+    drop = np.zeros(n)
+    nods = 0
+    for start in range(FPS * 5, n - FPS * 3, FPS * 6):
+        ramp = np.linspace(0.0, NOD_DROP, 6)
+        hold = np.full(FPS + FPS // 2, NOD_DROP)
+        drop[start:start + 6 + len(hold) + 6] = np.concatenate([ramp, hold, ramp[::-1]])
+        nods += 1
+    return drop, nods
+
+
+def write_nod_trace(path: str, seconds: int = 90, seed: int = 0) -> int:
+    """Graba una traza con cabeceos de 1.5 s y ruido en la geometría de la cabeza; retorna los cabeceos."""
+    drop, nods = synthetic_nods(seconds)
+    rng = np.random.default_rng(seed)
+    face = _face()
+    _set_eye(face, LEFT_EYE_IDX, 0.56, EAR_OPEN)
+    _set_eye(face, RIGHT_EYE_IDX, 0.44, EAR_OPEN)
+    frente, barbilla, _ = NOD_IDX
+    y_diff = face[barbilla, 1] - face[frente, 1]
+    pts = face.copy()
+    writer = TraceWriter(path)
+    try:
+        for i, d in enumerate(drop):
+            pts[:] = face
+            pts[barbilla, 1] = face[frente, 1] + y_diff * (1.0 - d - rng.normal(0, NOD_JITTER))
+            writer.write(i / FPS, pts)
+    finally:
+        writer.close()
+    return nods
+
+
+@pytest.fixture(scope="module")
+def nod_trace(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("trazas") / "cabeceos.trz")
+    return path, write_nod_trace(path)
+
+
+def test_default_filter_counts_real_nods(nod_trace):
+    path, nods = nod_trace
+    assert replay(path)["cabeceos"] == nods
+
+
+def test_default_filter_fewer_nods_than_raw(nod_trace):
+    path, nods = nod_trace
+    raw = replay(path, {"signal_filter": "ninguno", "nod_hysteresis": 0.0})
+    # el ruido corta cada cabeceo real en varios
+    assert raw["cabeceos"] > nods
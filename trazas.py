@@ -0,0 +1,258 @@
+"""
+Trazas de landmarks: grabar una vez con FaceMesh y reproducir la máquina de estados sin el modelo.
+
+Formato (un archivo .trz):
+    cabecera   MAGIC (8 bytes) | largo del JSON (uint32) | JSON de metadatos, relleno a 8 bytes
+    bloques    n_frames (uint32) | comprimido (uint32) | largo del contenido (uint64) | contenido
+    contenido  t float64[n] | landmarks dtype[n, L, 3] | presente uint8[n], relleno a 8 bytes
+
+Solo se guardan las filas que usan las métricas (METRIC_IDX, L=20) en float32 (la
+reproducción da los mismos eventos que en vivo) o float16 (mitad de tamaño, ~3 decimales).
+Los bloques sin comprimir se leen directo del archivo mapeado en memoria (sin copias);
+con compresión cada bloque es un zlib independiente.
+
+Ejemplos:
+    python somnolencia.py --grabar-traza viaje.trz
+    python trazas.py grabar viaje.mp4 viaje.trz --dtype float16 --comprimir
+    python trazas.py reproducir viaje.trz --config ear_threshold=0.22 --config ear_threshold=0.25
+"""
+import argparse
+import json
+import mmap
+import struct
+import time
+import zlib
+from datetime import datetime
+from typing import Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from somnolencia import METRIC_IDX, NUM_LANDMARKS, DrowsinessDetector, NullAudio, NullEventWriter
+from evaluacion import MetricsWriter, VideoClock, frame_row, iter_frames, parse_config
+
+MAGIC = b"SOMTRZ1\0"
+VERSION = 1
+_HEADER = struct.Struct("<I")
+_CHUNK = struct.Struct("<IIQ")
+DTYPES = ("float32", "float16")
+
+
+def _pad8(n: int) -> int:
+    return (-n) % 8
+
+
+class TraceWriter:
+    """
+    Grabador de trazas para usar en vivo (DrowsinessDetector(recorder=...)): acumula frames
+    en arreglos preasignados y escribe un bloque cada `chunk_frames` frames.
+    """
+    def __init__(self, path: str, indices=METRIC_IDX, dtype: str = "float32", chunk_frames: int = 256,
+                 compress: bool = False, meta: Dict = None):
+        if dtype not in DTYPES:
+            raise ValueError(f"dtype debe ser uno de {DTYPES}")
+        self.path = path
+        self.indices = np.asarray(indices, np.intp)
+        self.compress = compress
+        self.chunk_frames = chunk_frames
+        self._t = np.zeros(chunk_frames, np.float64)
+        self._lm = np.zeros((chunk_frames, len(self.indices), 3), dtype)
+        self._present = np.zeros(chunk_frames, np.uint8)
+        self._n = 0
+        self.frames = 0
+        header = {"version": VERSION, "dtype": dtype, "indices": self.indices.tolist(),
+                  "chunk_frames": chunk_frames, "compresion": "zlib" if compress else None,
+                  "creado": datetime.now().isoformat(timespec="seconds"), **(meta or {})}
+        raw = json.dumps(header, ensure_ascii=False).encode("utf-8")
+        self._f = open(path, "wb")
+        self._f.write(MAGIC + _HEADER.pack(len(raw)) + raw + b"\0" * _pad8(len(MAGIC) + _HEADER.size + len(raw)))
+
+    def write(self, t: float, pts: np.ndarray = None):
+        """Un frame: tiempo del reloj del detector y arreglo (478, 3) de landmarks, o None sin rostro."""
+        i = self._n
+        self._t[i] = t
+        if pts is None:
+            self._present[i] = 0
+            self._lm[i] = 0
+        else:
+            self._present[i] = 1
+            self._lm[i] = pts[self.indices]
+        self._n += 1
+        self.frames += 1
+        if self._n == self.chunk_frames:
+            self._flush()
+
+    def _flush(self):
+        n = self._n
+        if n == 0:
+            return
+        payload = self._t[:n].tobytes() + self._lm[:n].tobytes() + self._present[:n].tobytes()
+        payload += b"\0" * _pad8(len(payload))
+        if self.compress:
+            payload = zlib.compress(payload, 6)
+            payload += b"\0" * _pad8(len(payload))
+        self._f.write(_CHUNK.pack(n, int(self.compress), len(payload)) + payload)
+        self._n = 0
+
+    def close(self):
+        if not self._f.closed:
+            self._flush()
+            self._f.close()
+
+
+class TraceReader:
+    """Lee una traza mapeada en memoria; `chunks()` da (t, landmarks, presente) por bloque."""
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{path} no es una traza de landmarks")
+        (size,) = _HEADER.unpack_from(self._mm, len(MAGIC))
+        start = len(MAGIC) + _HEADER.size
+        self.meta = json.loads(self._mm[start:start + size].decode("utf-8"))
+        if self.meta.get("version") != VERSION:
+            raise ValueError(f"Versión de traza no soportada: {self.meta.get('version')}")
+        self.dtype = np.dtype(self.meta["dtype"])
+        self.indices = np.asarray(self.meta["indices"], np.intp)
+        # índice de bloques: (offset del contenido, frames, comprimido, largo)
+        self._chunks: List[Tuple[int, int, bool, int]] = []
+        offset = start + size + _pad8(start + size)
+        while offset + _CHUNK.size <= len(self._mm):
+            n, compressed, length = _CHUNK.unpack_from(self._mm, offset)
+            offset += _CHUNK.size
+            if offset + length > len(self._mm):
+                break       # bloque truncado (grabación cortada): se ignora
+            self._chunks.append((offset, n, bool(compressed), length))
+            offset += length
+        self.frames = sum(c[1] for c in self._chunks)
+
+    def __len__(self) -> int:
+        return self.frames
+
+    def chunks(self) -> Iterator[Tuple[np.ndarray, np.ndarray, np.ndarray]]:
+        n_lm = len(self.indices)
+        for offset, n, compressed, length in self._chunks:
+            if compressed:
+                buf, base = zlib.decompress(self._mm[offset:offset + length]), 0
+            else:
+                buf, base = self._mm, offset
+            t = np.frombuffer(buf, np.float64, n, base)
+            base += t.nbytes
+            lm = np.frombuffer(buf, self.dtype, n * n_lm * 3, base).reshape(n, n_lm, 3)
+            base += lm.nbytes
+            present = np.frombuffer(buf, np.uint8, n, base)
+            yield t, lm, present
+
+    def close(self):
+        try:
+            self._mm.close()
+        except BufferError:
+            pass    # quedan arreglos que apuntan al mapeo; se libera cuando se recolectan
+        self._file.close()
+
+
+def replay(path: str, config: Dict = None, salida: str = None) -> Dict:
+    """
+    Pasa la traza por la máquina de estados del detector (sin modelo, sin audio, sin DB).
+    El reloj del detector toma el tiempo grabado de cada frame: la reproducción es determinista.
+    """
+    reader = TraceReader(path)
+    clock = VideoClock()
+    detector = DrowsinessDetector(**{"event_writer": NullEventWriter(), "audio": NullAudio(),
+                                     "clock": clock, "render_level": "ninguno", **(config or {})})
+    writer = MetricsWriter(salida) if salida else None
+    pts = np.zeros((NUM_LANDMARKS, 3), np.float32)
+    idx = reader.indices
+    levels: Dict[str, int] = {}
+    alerts = 0
+    was_alert = False
+    first = last = None
+    n = 0
+    t0 = time.perf_counter()
+    try:
+        for ts, lm, present in reader.chunks():
+            for i in range(len(ts)):
+                clock.t = last = float(ts[i])
+                if first is None:
+                    first = last
+                if present[i]:
+                    pts[idx] = lm[i]
+                    detector.update_state(pts)
+                else:
+                    detector.update_state(None)
+                m = detector.metrics
+                levels[m.drowsiness_level] = levels.get(m.drowsiness_level, 0) + 1
+                alerts += detector.alert_active and not was_alert
+                was_alert = detector.alert_active
+                if writer is not None:
+                    writer.write(frame_row(path, n, last - first, detector))
+                n += 1
+    finally:
+        elapsed = time.perf_counter() - t0
+        if writer is not None:
+            writer.close()
+        detector.cleanup()
+        reader.close()
+    duration = (last - first) if n else 0.0
+    m = detector.metrics
+    return {"traza": path, "config": config or {}, "frames": n, "duracion_s": round(duration, 2),
+            "reproduccion_s": round(elapsed, 3),
+            "x_tiempo_real": round(duration / elapsed, 1) if elapsed > 0 else 0.0,
+            "parpadeos": m.blinks_count, "cabeceos": m.head_nods_count, "bostezos": m.yawns_count,
+            "alertas": alerts, "niveles": levels,
+            "deteccion_valida_ms": detector.startup_times.get("deteccion_valida_ms")}
+
+
+def record_video(source: str, path: str, config: Dict = None, fps: float = 30.0, **writer_kw) -> int:
+    """Graba la traza de un video o carpeta de imágenes corriendo FaceMesh una sola vez."""
+    clock = VideoClock()
+    recorder = TraceWriter(path, meta={"fuente": source}, **writer_kw)
+    detector = DrowsinessDetector(**{"event_writer": NullEventWriter(), "audio": NullAudio(),
+                                     "clock": clock, "render_level": "ninguno", "recorder": recorder,
+                                     **(config or {})})
+    try:
+        for _, t, frame in iter_frames(source, fps):
+            clock.t = t
+            detector.analyze(frame)
+    finally:
+        detector.cleanup()
+    return recorder.frames
+
+
+def print_replay(r: Dict, title: str = "Reproducción"):
+    print(f"📼 {title}: {r['traza']} {r['config'] or ''}")
+    print(f"   {r['frames']} frames, {r['duracion_s']} s grabados en {r['reproduccion_s']} s "
+          f"({r['x_tiempo_real']}x tiempo real)")
+    print(f"   parpadeos={r['parpadeos']} cabeceos={r['cabeceos']} bostezos={r['bostezos']} "
+          f"alertas={r['alertas']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Grabación y reproducción de trazas de landmarks")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    rec = sub.add_parser("grabar", help="graba la traza de un video o carpeta de imágenes")
+    rec.add_argument("fuente")
+    rec.add_argument("traza")
+    rec.add_argument("--dtype", choices=DTYPES, default="float32")
+    rec.add_argument("--comprimir", action="store_true", help="bloques comprimidos con zlib")
+    rec.add_argument("--config", default="", help="kwargs del detector, ej. roi_tracking=true")
+    rec.add_argument("--fps", type=float, default=30.0, help="fps nominal para carpetas de imágenes")
+    rep = sub.add_parser("reproducir", help="pasa la traza por la máquina de estados sin el modelo")
+    rep.add_argument("traza")
+    rep.add_argument("--config", action="append", default=[],
+                     help="kwargs del detector; repetir para comparar configuraciones")
+    rep.add_argument("--salida", help="métricas por frame (.csv o .jsonl) de la primera config")
+    args = parser.parse_args(argv)
+
+    if args.comando == "grabar":
+        n = record_video(args.fuente, args.traza, parse_config(args.config), args.fps,
+                         dtype=args.dtype, compress=args.comprimir)
+        print(f"📼 {n} frames grabados en {args.traza}")
+        return
+
+    for i, config in enumerate([parse_config(c) for c in args.config] or [{}]):
+        print_replay(replay(args.traza, config, args.salida if i == 0 else None), f"Config {chr(ord('A') + i)}")
+
+
+if __name__ == "__main__":
+    main()